@@ -0,0 +1,54 @@
+"""Время импорта пакета и запуска CLI (каждый замер — новый процесс интерпретатора).
+
+Запуск: python benchmarks/bench_import.py [--repeat 10]
+Короткие скриптовые вызовы `gptoss chat` упираются в импорты: следите за колонкой median ms
+и за тем, какие тяжёлые модули (httpx, pydantic, rich.markdown) загружаются для каждой цели.
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+HEAVY = ("httpx", "pydantic", "rich.console", "rich.markdown", "fastapi")
+
+TARGETS: Dict[str, str] = {
+    "python": "pass",
+    "gpt_oss_client": "import gpt_oss_client",
+    "Provider": "from gpt_oss_client import Provider",
+    "LLMClient": "from gpt_oss_client import LLMClient",
+    "cli": "import gpt_oss_client.cli",
+    "daemon client": "import gpt_oss_client.daemon",
+    "server": "import gpt_oss_client.server",
+}
+
+
+def measure(code: str, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def loaded(code: str) -> List[str]:
+    probe = f"import sys\n{code}\nprint(' '.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True).stdout
+    return out.split()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+    print(f"{'target':<16} {'median ms':>10} {'min ms':>8}  heavy modules")
+    for name, code in TARGETS.items():
+        samples = measure(code, args.repeat)
+        print(f"{name:<16} {statistics.median(samples):>10.1f} {min(samples):>8.1f}  {' '.join(loaded(code)) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Время parse_structured_output / parse_json_strict на корпусе типичных форм вывода.
+
+Запуск: python benchmarks/bench_parser.py [--reasoning-kb 64] [--number 200]
+Для отслеживания регрессий сравнивайте колонку us/op между версиями.
+"""
+from __future__ import annotations
+import argparse
+import json
+import timeit
+from typing import Callable, Dict, Tuple
+
+from gpt_oss_client.harmony import parse_json_strict, parse_structured_output
+
+_SENTENCE = "Check the constraint a < b, then compare with the previous step. "
+
+
+def corpus(reasoning_kb: int) -> Dict[str, str]:
+    reasoning = (_SENTENCE * (reasoning_kb * 1024 // len(_SENTENCE) + 1))[: reasoning_kb * 1024]
+    return {
+        "tagged": f"<thinking>{reasoning}</thinking>\n<final>42</final>",
+        "unclosed": f"<thinking>{reasoning}</thinking>\n<final>42",
+        "lmstudio": f"{reasoning}<|channel|>final <|constrain|>json<|message|>" + json.dumps({"final": "42"}),
+        "json": json.dumps({"reasoning": reasoning, "final": "42"}),
+        "trailing_json": reasoning + "\n" + json.dumps({"reasoning": "short", "final": "42"}),
+        "plain": reasoning,
+    }
+
+
+PARSERS: Dict[str, Callable[[str], Tuple]] = {
+    "structured": parse_structured_output,
+    "json_strict": parse_json_strict,
+}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--reasoning-kb", type=int, default=64)
+    ap.add_argument("--number", type=int, default=200)
+    args = ap.parse_args()
+    print(f"{'shape':<14} {'parser':<12} {'us/op':>10}")
+    for shape, text in corpus(args.reasoning_kb).items():
+        for name, fn in PARSERS.items():
+            seconds = timeit.timeit(lambda: fn(text), number=args.number)
+            print(f"{shape:<14} {name:<12} {seconds / args.number * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Накладные расходы разбора стрима бэкенда на один сетевой чанк: построчный ``iter_lines`` + ``json.loads``
+против байтового ``SSEDecoder``/``NDJSONDecoder`` (json и orjson, если установлен).
+
+Запуск: python benchmarks/bench_stream_decode.py [--events 20000] [--per-chunk 1]
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from typing import Callable, Dict, Iterator, List
+
+import httpx
+
+from gpt_oss_client.adapters import decoding
+from gpt_oss_client.adapters.decoding import NDJSONDecoder, SSEDecoder
+
+
+def _sse_body(events: int) -> List[bytes]:
+    frames = [
+        "data: " + json.dumps({"id": "c1", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": f" tok{i}"}}]}) + "\n\n"
+        for i in range(events)
+    ]
+    return [f.encode() for f in frames] + [b"data: [DONE]\n\n"]
+
+
+def _ndjson_body(events: int) -> List[bytes]:
+    return [
+        (json.dumps({"model": "gpt-oss:20b", "message": {"role": "assistant", "content": f" tok{i}"}, "done": False}) + "\n").encode()
+        for i in range(events)
+    ]
+
+
+def _chunks(frames: List[bytes], per_chunk: int) -> List[bytes]:
+    # несколько кадров в одном чанке и кадры, разрезанные посередине, как их отдаёт сеть
+    data = b"".join(frames)
+    size = max(1, len(data) // len(frames) * per_chunk)
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _response(chunks: List[bytes]) -> httpx.Response:
+    return httpx.Response(200, content=iter(chunks))
+
+
+def _sse_lines(chunks: List[bytes]) -> int:
+    count = 0
+    for line in _response(chunks).iter_lines():
+        if not line:
+            continue
+        if line.startswith("data: "):
+            line = line[6:]
+        if line.strip() == "[DONE]":
+            break
+        try:
+            obj = json.loads(line)
+        except Exception:
+            continue
+        if obj["choices"][0]["delta"].get("content"):
+            count += 1
+    return count
+
+
+def _sse_bytes(chunks: List[bytes]) -> int:
+    count = 0
+    decoder = SSEDecoder()
+    for chunk in _response(chunks).iter_bytes():
+        for obj in decoder.feed(chunk):
+            if obj["choices"][0]["delta"].get("content"):
+                count += 1
+        if decoder.done:
+            break
+    return count
+
+
+def _ndjson_lines(chunks: List[bytes]) -> int:
+    count = 0
+    for line in _response(chunks).iter_lines():
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except Exception:
+            continue
+        if obj["message"].get("content"):
+            count += 1
+    return count
+
+
+def _ndjson_bytes(chunks: List[bytes]) -> int:
+    count = 0
+    decoder = NDJSONDecoder()
+    for chunk in _response(chunks).iter_bytes():
+        for obj in decoder.feed(chunk):
+            if obj["message"].get("content"):
+                count += 1
+    for obj in decoder.close():
+        count += 1
+    return count
+
+
+def _measure(fn: Callable[[List[bytes]], int], chunks: List[bytes], events: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        assert fn(chunks) == events
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _loads_variants() -> Iterator[str]:
+    yield "json"
+    if decoding._orjson is not None:
+        yield "orjson"
+
+
+def run(events: int, per_chunk: int, repeat: int) -> None:
+    cases: Dict[str, List[bytes]] = {
+        "sse": _chunks(_sse_body(events), per_chunk),
+        "ndjson": _chunks(_ndjson_body(events), per_chunk),
+    }
+    print(f"{'format':<8} {'decoder':<16} {'chunks':>8} {'µs/chunk':>10} {'µs/event':>10}")
+    for name, chunks in cases.items():
+        lines, raw = (_sse_lines, _sse_bytes) if name == "sse" else (_ndjson_lines, _ndjson_bytes)
+        rows = [("iter_lines+json", lines, json.loads)]
+        rows += [(f"bytes+{variant}", raw, decoding._json_loads if variant == "json" else decoding._orjson.loads) for variant in _loads_variants()]
+        default = decoding.loads
+        for label, fn, loads in rows:
+            decoding.loads = loads
+            try:
+                elapsed = _measure(fn, chunks, events, repeat)
+            finally:
+                decoding.loads = default
+            print(f"{name:<8} {label:<16} {len(chunks):>8} {elapsed / len(chunks) * 1e6:>10.2f} {elapsed / events * 1e6:>10.2f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=20000, help="число токенов в стриме")
+    ap.add_argument("--per-chunk", type=int, default=1, help="кадров в одном сетевом чанке (в среднем)")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    run(args.events, args.per_chunk, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Пропускная способность HarmonyStreamParser на многомегабайтных потоках.
+
+Запуск: python benchmarks/bench_stream_parser.py [--size-mb 8]
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+
+from gpt_oss_client.harmony import HarmonyStreamParser
+
+_SENTENCE = "Let me check the constraint a < b carefully, then compare with the previous step. "
+
+
+def _tagged(size: int) -> str:
+    body = _SENTENCE * (size // len(_SENTENCE) + 1)
+    return f"<thinking>{body[: size // 2]}</thinking><final>{body[: size // 2]}</final>"
+
+
+def _json(size: int) -> str:
+    body = (_SENTENCE + '"quoted" \\ ') * (size // (len(_SENTENCE) + 12) + 1)
+    return json.dumps({"reasoning": body[: size // 2], "final": body[: size // 2]})
+
+
+def _channels(size: int) -> str:
+    body = _SENTENCE * (size // len(_SENTENCE) + 1)
+    return (
+        f"<|channel|>analysis<|message|>{body[: size // 2]}<|end|>"
+        f"<|start|>assistant<|channel|>final<|message|>{body[: size // 2]}<|return|>"
+    )
+
+
+SHAPES: Dict[str, Callable[[int], str]] = {"tagged": _tagged, "json": _json, "lmstudio": _channels}
+
+
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def run(size_mb: float, chunk_sizes: List[int]) -> None:
+    size = int(size_mb * 1024 * 1024)
+    print(f"{'shape':<10} {'chunk':>6} {'MB/s':>9} {'seconds':>9}")
+    for name, make in SHAPES.items():
+        text = make(size)
+        for chunk_size in chunk_sizes:
+            chunks = _chunks(text, chunk_size)
+            parser = HarmonyStreamParser()
+            started = time.perf_counter()
+            for chunk in chunks:
+                parser.feed(chunk)
+            parser.close()
+            elapsed = time.perf_counter() - started
+            print(f"{name:<10} {chunk_size:>6} {len(text) / elapsed / 1e6:>9.1f} {elapsed:>9.3f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--size-mb", type=float, default=4.0)
+    ap.add_argument("--chunk-sizes", type=int, nargs="+", default=[4, 16, 256])
+    args = ap.parse_args()
+    run(args.size_mb, args.chunk_sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Масштабирование REST-сервера по числу воркеров: ``gptoss serve --workers N`` против мок-бэкенда.
+
+Сервер на каждое N запускается отдельным процессом с общим файлом состояния (слоты, кэш, сессии),
+нагрузка подаётся из этого процесса. Прирост виден, пока узкое место — CPU сервера, а не бэкенд
+и не драйвер нагрузки: на машине с одним ядром воркеры только делят его между собой.
+
+Запуск: python benchmarks/bench_workers.py [--workers 1 2 4] [--requests 2000] [--concurrency 64]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Iterator, List, Optional
+
+from gpt_oss_client.bench import BenchConfig, BenchTarget, _drive, _free_port, _wait_ready, run_mock_backend
+from gpt_oss_client.mock_server import MockConfig
+
+
+@contextlib.contextmanager
+def _serve(workers: int, max_concurrent: Optional[int]) -> Iterator[str]:
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        cmd = [
+            sys.executable, "-m", "gpt_oss_client.cli", "serve", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--state-path", os.path.join(tmp, "state.sqlite"),
+        ]
+        if max_concurrent is not None:
+            cmd += ["--max-concurrent", str(max_concurrent)]
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            base = f"http://127.0.0.1:{port}"
+            _wait_ready(f"{base}/admission", timeout=60.0)
+            yield base
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+def run(workers: List[int], requests: int, concurrency: int, stream: bool, base_url: Optional[str], max_concurrent: Optional[int]) -> None:
+    cfg = BenchConfig(
+        target=BenchTarget.SERVER_STREAM if stream else BenchTarget.SERVER,
+        requests=requests,
+        concurrency=concurrency,
+        # быстрый бэкенд: время уходит на сам сервер
+        mock=MockConfig(tokens_per_second=5000.0, first_token_delay=0.0, output_tokens=32),
+    )
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'workers':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    with contextlib.ExitStack() as stack:
+        if base_url is None:
+            base_url = stack.enter_context(run_mock_backend(cfg.mock)) + "/v1"
+        baseline: Optional[float] = None
+        for n in workers:
+            with _serve(n, max_concurrent) as server_url:
+                # прогрев: пулы соединений воркеров и импорт
+                asyncio.run(_drive(cfg.model_copy(update={"requests": concurrency * 2}), base_url, server_url))
+                report = asyncio.run(_drive(cfg, base_url, server_url))
+            baseline = baseline or report.throughput_rps
+            scale = report.throughput_rps / baseline if baseline else 0.0
+            print(f"{n:>7} {report.throughput_rps:>9.1f} {report.latency_p50_ms:>9.1f} {report.latency_p95_ms:>9.1f} {report.errors:>7}  x{scale:.2f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--stream", action="store_true", help="/chat/stream вместо /chat")
+    ap.add_argument("--base-url", default=None, help="Внешний OpenAI-совместимый бэкенд вместо мока")
+    ap.add_argument("--max-concurrent", type=int, default=None, help="Общий на все воркеры лимит генераций на бэкенд")
+    args = ap.parse_args()
+    run(args.workers, args.requests, args.concurrency, args.stream, args.base_url, args.max_concurrent)
+
+
+if __name__ == "__main__":
+    main()
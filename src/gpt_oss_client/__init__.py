@@ -1,11 +1,72 @@
+from __future__ import annotations
+import importlib
+from typing import TYPE_CHECKING, Any, List
+
 __all__ = [
     "Provider",
     "ChatResult",
     "LLMClient",
+    "AsyncLLMClient",
+    "Backend",
+    "BackendPool",
+    "RetryPolicy",
+    "HedgePolicy",
+    "Session",
+    "KeepAliveScheduler",
+    "StructuredOutputError",
+    "Timeouts",
+    "DeadlineExceeded",
+    "Timings",
+    "Usage",
+    "ClientHook",
+    "OpenTelemetryHook",
 ]
 
-from .providers import Provider
-from .schema import ChatResult
-from .client import LLMClient
-
 __version__ = "0.2.0"
+
+# Импорт пакета не тянет httpx/pydantic и весь клиент: модули загружаются при первом обращении к имени.
+_LAZY = {
+    "Provider": ".providers",
+    "ChatResult": ".schema",
+    "LLMClient": ".client",
+    "AsyncLLMClient": ".client",
+    "Backend": ".balancer",
+    "BackendPool": ".balancer",
+    "RetryPolicy": ".retry",
+    "HedgePolicy": ".retry",
+    "Session": ".sessions",
+    "KeepAliveScheduler": ".warmup",
+    "StructuredOutputError": ".structured",
+    "Timeouts": ".timeouts",
+    "DeadlineExceeded": ".timeouts",
+    "Timings": ".schema",
+    "Usage": ".schema",
+    "ClientHook": ".tracing",
+    "OpenTelemetryHook": ".tracing",
+}
+
+if TYPE_CHECKING:
+    from .providers import Provider
+    from .schema import ChatResult
+    from .client import LLMClient, AsyncLLMClient
+    from .balancer import Backend, BackendPool
+    from .retry import HedgePolicy, RetryPolicy
+    from .sessions import Session
+    from .warmup import KeepAliveScheduler
+    from .structured import StructuredOutputError
+    from .timeouts import DeadlineExceeded, Timeouts
+    from .schema import Timings, Usage
+    from .tracing import ClientHook, OpenTelemetryHook
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
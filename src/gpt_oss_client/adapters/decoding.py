@@ -0,0 +1,128 @@
+"""Инкрементальный разбор стримов бэкендов (SSE, NDJSON) прямо из байтов ``iter_bytes``.
+
+Кадр собирается из произвольно нарезанных сетевых чанков и декодируется одним вызовом ``loads``
+(orjson, если установлен, иначе json) без промежуточных строк. Битые кадры не пропускаются молча:
+их считает ``gptoss_stream_malformed_frames``.
+"""
+from __future__ import annotations
+import json
+from typing import Any, List, Optional, Tuple
+
+from ..metrics import MALFORMED_FRAMES
+
+try:  # опционально: pip install gpt-oss-client[fast]
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+
+def _json_loads(data: bytes) -> Any:
+    # json.loads(bytes) заметно медленнее: определяет кодировку и декодирует с surrogatepass
+    return json.loads(data.decode("utf-8"))
+
+
+loads = _orjson.loads if _orjson is not None else _json_loads
+
+_DONE_DATA = b"[DONE]"
+
+
+class _FrameDecoder:
+    format = ""
+
+    def __init__(self, labels: Optional[Tuple[str, str, str]] = None):
+        self.labels = labels
+        self.malformed = 0
+        self._tail = b""
+
+    def _loads(self, data: bytes) -> Any:
+        try:
+            return loads(data)
+        except ValueError:
+            self.malformed += 1
+            if self.labels is not None:
+                MALFORMED_FRAMES.labels(*self.labels, self.format).inc()
+            return None
+
+
+class SSEDecoder(_FrameDecoder):
+    """text/event-stream: несколько ``data:``-строк события склеиваются через ``\\n``, событие
+    завершает пустая строка; комментарии и поля ``event``/``id``/``retry`` игнорируются.
+
+    ``feed`` возвращает JSON-объекты завершённых событий; битые события пропускаются и считаются.
+    После ``data: [DONE]`` выставляется ``done``, остаток стрима не разбирается.
+    """
+
+    format = "sse"
+
+    def __init__(self, labels: Optional[Tuple[str, str, str]] = None):
+        super().__init__(labels)
+        self.done = False
+
+    def _dispatch(self, data: bytes, out: List[Any]) -> None:
+        if data.strip() == _DONE_DATA:
+            self.done = True
+            return
+        obj = self._loads(data)
+        if obj is not None:
+            out.append(obj)
+
+    def _event(self, frame: bytes) -> Optional[bytes]:
+        if frame.startswith(b"data: ") and b"\n" not in frame:
+            return frame[6:]  # обычный случай: одна строка ``data: {...}``
+        data = []
+        for line in frame.split(b"\n"):
+            if line.startswith(b"data:"):
+                data.append(line[6:] if line[5:6] == b" " else line[5:])
+        return b"\n".join(data) if data else None
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        out: List[Any] = []
+        if self.done:
+            return out
+        buf = self._tail + chunk if self._tail else chunk
+        if b"\r" in buf:
+            # CRLF и CR -> LF; \r в конце чанка может оказаться началом \r\n, его нормализует следующий feed
+            held = buf.endswith(b"\r")
+            buf = (buf[:-1] if held else buf).replace(b"\r\n", b"\n").replace(b"\r", b"\n") + (b"\r" if held else b"")
+        frames = buf.split(b"\n\n")
+        self._tail = frames.pop()
+        for frame in frames:
+            data = self._event(frame)
+            if data is not None:
+                self._dispatch(data, out)
+                if self.done:
+                    break
+        return out
+
+    def close(self) -> List[Any]:
+        """Хвост стрима без завершающей пустой строки (часть серверов её не шлёт)."""
+        out = self.feed(b"\n\n") if self._tail else []
+        self._tail = b""
+        return out
+
+
+class NDJSONDecoder(_FrameDecoder):
+    """Построчный JSON (Ollama): ``feed`` возвращает объекты завершённых строк, пустые строки пропускаются."""
+
+    format = "ndjson"
+
+    def _lines(self, chunk: bytes) -> List[bytes]:
+        if self._tail:
+            chunk = self._tail + chunk
+        lines = chunk.split(b"\n")
+        self._tail = lines.pop()
+        return lines
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        out: List[Any] = []
+        for line in self._lines(chunk):
+            if line.strip():
+                obj = self._loads(line)
+                if obj is not None:
+                    out.append(obj)
+        return out
+
+    def close(self) -> List[Any]:
+        out = self.feed(b"\n") if self._tail else []
+        self._tail = b""
+        return out
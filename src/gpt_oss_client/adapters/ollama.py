@@ -1,15 +1,47 @@
 from __future__ import annotations
 import httpx
-import json
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
+from ..providers import Provider
 from ..schema import Message, GenerationParams
+from ..pool import get_http_client, get_async_http_client
+from ..timeouts import Timeouts
+from ..tracing import RequestTrace, async_http_extensions, http_extensions
+from .decoding import NDJSONDecoder
+
+
+def _ndjson_deltas(events: List[Any]) -> Tuple[List[str], Optional[Dict[str, Any]]]:
+    """Тексты чанков и последний объект стрима (``done: true`` — с eval_count и причиной остановки)."""
+    deltas: List[str] = []
+    for obj in events:
+        if not isinstance(obj, dict):
+            continue
+        content = (obj.get("message") or {}).get("content")
+        if content:
+            deltas.append(content)
+        if obj.get("done") is True:
+            return deltas, obj
+    return deltas, None
 
 
 class OllamaAdapter:
-    def __init__(self, base_url: str, timeout: float = 60.0):
+    provider = Provider.OLLAMA
+
+    def __init__(self, base_url: str, timeout: float = 60.0, http_client: Optional[httpx.Client] = None, timeouts: Optional[Timeouts] = None):
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
+        self.http_client = http_client
+        self.timeouts = timeouts or Timeouts(first_token=timeout)
+
+    def _http_timeout(self, gen: Optional[GenerationParams], stream: bool) -> httpx.Timeout:
+        return self.timeouts.http(stream, gen.timeout if gen is not None else None)
+
+    def _client(self) -> httpx.Client:
+        return self.http_client or get_http_client(self.provider, self.base_url)
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/api/chat"
 
     def _build_payload(self, model: str, messages: List[Message], gen: Optional[GenerationParams], stream: bool) -> Dict[str, Any]:
         payload: Dict[str, Any] = {
@@ -25,39 +57,60 @@ class OllamaAdapter:
                 options["top_p"] = gen.top_p
             if gen.max_tokens is not None:
                 options["num_predict"] = gen.max_tokens
-            if gen.json_output:
+            stops = gen.stop_sequences(messages)
+            if stops:
+                options["stop"] = stops
+            if gen.json_schema is not None:
+                # Ollama ≥ 0.5: format принимает JSON Schema и ограничивает генерацию ею
+                payload["format"] = gen.json_schema
+            elif gen.json_output:
                 payload["format"] = "json"
+            if gen.keep_alive is not None:
+                payload["keep_alive"] = gen.keep_alive
         if options:
             payload["options"] = options
         return payload
 
-    def chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None) -> Dict[str, Any]:
-        url = f"{self.base_url}/api/chat"
+    def chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None) -> Dict[str, Any]:
         payload = self._build_payload(model, messages, gen, stream=False)
-        with httpx.Client(timeout=self.timeout) as client:
-            resp = client.post(url, json=payload)
-            resp.raise_for_status()
-            return resp.json()
+        resp = self._client().post(self.url, json=payload, timeout=self._http_timeout(gen, stream=False), extensions=http_extensions(trace))
+        resp.raise_for_status()
+        return resp.json()
+
+    @staticmethod
+    def _warmup_payload(model: str, keep_alive: Optional[str]) -> Dict[str, Any]:
+        # пустой список сообщений: Ollama только загружает модель и продлевает keep_alive, без генерации
+        payload: Dict[str, Any] = {"model": model, "messages": [], "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+    def warmup(self, model: str, keep_alive: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        resp = self._client().post(self.url, json=self._warmup_payload(model, keep_alive), timeout=timeout or self.timeout)
+        resp.raise_for_status()
 
-    def stream_chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None) -> Iterable[str]:
-        url = f"{self.base_url}/api/chat"
+    def stream_chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None) -> Iterable[str]:
         payload = self._build_payload(model, messages, gen, stream=True)
-        with httpx.Client(timeout=self.timeout) as client:
-            with client.stream("POST", url, json=payload) as resp:
-                resp.raise_for_status()
-                for line in resp.iter_lines():
-                    if not line:
-                        continue
-                    try:
-                        obj = json.loads(line)
-                        msg = obj.get("message") or {}
-                        content = msg.get("content")
-                        if content:
-                            yield content
-                        if obj.get("done") is True:
-                            break
-                    except Exception:
-                        continue
+        with self._client().stream("POST", self.url, json=payload, timeout=self._http_timeout(gen, stream=True), extensions=http_extensions(trace)) as resp:
+            resp.raise_for_status()
+            decoder = NDJSONDecoder((self.provider.value, self.base_url, model))
+            with self.timeouts.watch(resp, self.base_url) as watch:
+                for chunk in resp.iter_bytes():
+                    deltas, last = _ndjson_deltas(decoder.feed(chunk))
+                    for content in deltas:
+                        watch.received()
+                        yield content
+                        watch.waiting()
+                    if last is not None:
+                        if trace is not None:
+                            trace.set_usage(last)
+                        break
+                else:
+                    deltas, last = _ndjson_deltas(decoder.close())
+                    for content in deltas:
+                        yield content
+                    if last is not None and trace is not None:
+                        trace.set_usage(last)
 
     @staticmethod
     def extract_text(response_json: Dict[str, Any]) -> str:
@@ -65,3 +118,50 @@ class OllamaAdapter:
             return response_json["message"]["content"]
         except Exception:
             return str(response_json)
+
+
+class AsyncOllamaAdapter(OllamaAdapter):
+    """Асинхронный вариант адаптера на httpx.AsyncClient (не блокирует event loop)."""
+
+    def __init__(self, base_url: str, timeout: float = 60.0, http_client: Optional[httpx.AsyncClient] = None, timeouts: Optional[Timeouts] = None):
+        super().__init__(base_url=base_url, timeout=timeout, timeouts=timeouts)
+        self.async_http_client = http_client
+
+    def _aclient(self) -> httpx.AsyncClient:
+        return self.async_http_client or get_async_http_client(self.provider, self.base_url)
+
+    async def chat(  # type: ignore[override]
+        self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None
+    ) -> Dict[str, Any]:
+        payload = self._build_payload(model, messages, gen, stream=False)
+        resp = await self._aclient().post(self.url, json=payload, timeout=self._http_timeout(gen, stream=False), extensions=async_http_extensions(trace))
+        resp.raise_for_status()
+        return resp.json()
+
+    async def warmup(self, model: str, keep_alive: Optional[str] = None, timeout: Optional[float] = None) -> None:  # type: ignore[override]
+        resp = await self._aclient().post(self.url, json=self._warmup_payload(model, keep_alive), timeout=timeout or self.timeout)
+        resp.raise_for_status()
+
+    async def stream_chat(  # type: ignore[override]
+        self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None
+    ) -> AsyncIterator[str]:
+        payload = self._build_payload(model, messages, gen, stream=True)
+        async with self._aclient().stream(
+            "POST", self.url, json=payload, timeout=self._http_timeout(gen, stream=True), extensions=async_http_extensions(trace)
+        ) as resp:
+            resp.raise_for_status()
+            decoder = NDJSONDecoder((self.provider.value, self.base_url, model))
+            async for chunk in resp.aiter_bytes():
+                deltas, last = _ndjson_deltas(decoder.feed(chunk))
+                for content in deltas:
+                    yield content
+                if last is not None:
+                    if trace is not None:
+                        trace.set_usage(last)
+                    break
+            else:
+                deltas, last = _ndjson_deltas(decoder.close())
+                for content in deltas:
+                    yield content
+                if last is not None and trace is not None:
+                    trace.set_usage(last)
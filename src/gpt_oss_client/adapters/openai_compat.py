@@ -1,9 +1,16 @@
 from __future__ import annotations
-import json
 import httpx
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
+from ..providers import Provider
 from ..schema import Message, GenerationParams
+from ..capabilities import CAPABILITIES, CapabilityRegistry
+from ..metrics import COMPLETION_TOKENS, RESPONSE_FORMAT_FALLBACKS
+from ..structured import compile_schema
+from ..pool import get_http_client, get_async_http_client
+from ..timeouts import Timeouts
+from ..tracing import RequestTrace, async_http_extensions, http_extensions
+from .decoding import SSEDecoder
 
 
 def _normalize_base_url(url: str) -> str:
@@ -13,11 +20,53 @@ def _normalize_base_url(url: str) -> str:
     return u
 
 
+def _sse_content(obj: Any) -> Any:
+    if not isinstance(obj, dict):
+        return None
+    choices = obj.get("choices")
+    if not choices:
+        usage = obj.get("usage")
+        # финальный чанк с usage (stream_options.include_usage)
+        return usage if isinstance(usage, dict) else None
+    delta = choices[0].get("delta") or {}
+    return delta.get("content")
+
+
 class OpenAICompatAdapter:
-    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout: float = 60.0):
+    provider = Provider.OPENAI_COMPAT
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        timeout: float = 60.0,
+        http_client: Optional[httpx.Client] = None,
+        capabilities: Optional[CapabilityRegistry] = None,
+        timeouts: Optional[Timeouts] = None,
+    ):
         self.base_url = _normalize_base_url(base_url)
         self.api_key = api_key
         self.timeout = timeout
+        # без явных таймаутов — прежнее поведение: ``timeout`` на ожидание ответа
+        self.timeouts = timeouts or Timeouts(first_token=timeout)
+        self.http_client = http_client
+        self.capabilities = capabilities or CAPABILITIES
+
+    def _client(self) -> httpx.Client:
+        return self.http_client or get_http_client(self.provider, self.base_url, self.api_key)
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/v1/chat/completions"
+
+    def _http_timeout(self, gen: Optional[GenerationParams], stream: bool) -> httpx.Timeout:
+        return self.timeouts.http(stream, gen.timeout if gen is not None else None)
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
 
     def _build_payload(self, model: str, messages: List[Message], gen: Optional[GenerationParams], stream: bool) -> Dict[str, Any]:
         payload: Dict[str, Any] = {
@@ -25,6 +74,9 @@ class OpenAICompatAdapter:
             "messages": [m.model_dump() for m in messages],
             "stream": stream,
         }
+        caps = self.capabilities.get(self.provider, self.base_url)
+        if stream and caps.stream_usage:
+            payload["stream_options"] = {"include_usage": True}
         if gen:
             if gen.temperature is not None:
                 payload["temperature"] = gen.temperature
@@ -32,60 +84,113 @@ class OpenAICompatAdapter:
                 payload["top_p"] = gen.top_p
             if gen.max_tokens is not None:
                 payload["max_tokens"] = gen.max_tokens
-            if gen.json_output:
+            stops = gen.stop_sequences(messages)
+            if stops:
+                payload["stop"] = stops
+            # бэкенд, уже ответивший 400 на response_format, не получает его снова (без лишнего round trip);
+            # без поддержки json_schema — обычный JSON-режим, схему проверяет клиент
+            if gen.json_schema is not None and caps.json_schema is not False:
+                payload["response_format"] = compile_schema(gen.json_schema).response_format()
+            elif gen.json_output and caps.response_format is not False:
                 payload["response_format"] = {"type": "json_object"}
         return payload
 
-    def chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None) -> Dict[str, Any]:
-        url = f"{self.base_url}/v1/chat/completions"
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+    def _fallback(self, model: str, payload: Dict[str, Any], trace: Optional[RequestTrace] = None) -> str:
+        """Убирает response_format из запроса; возвращает его тип (json_object или json_schema)."""
+        kind = payload.pop("response_format", {}).get("type", "json_object")
+        RESPONSE_FORMAT_FALLBACKS.labels(self.provider.value, self.base_url, model).inc()
+        if trace is not None:
+            trace.count("fallback", response_format=kind)
+        return kind
+
+    @staticmethod
+    def _capability(kind: Optional[str]) -> str:
+        return "json_schema" if kind == "json_schema" else "response_format"
+
+    def _learn_response_format(self, payload: Dict[str, Any], fell_back: Optional[str], status_code: int) -> None:
+        if fell_back and status_code < 400:
+            # без response_format запрос прошёл — значит, 400 был именно из-за него
+            self.capabilities.update(self.provider, self.base_url, **{self._capability(fell_back): False})
+        elif "response_format" in payload and status_code < 400:
+            kind = payload["response_format"].get("type")
+            self.capabilities.learn(self.provider, self.base_url, **{self._capability(kind): True})
+
+    def _stream_usage(self, model: str, usage: Dict[str, Any]) -> None:
+        tokens = usage.get("completion_tokens")
+        if isinstance(tokens, int):
+            COMPLETION_TOKENS.labels(self.provider.value, self.base_url, model).inc(tokens)
+
+    def _labels(self, model: str) -> Tuple[str, str, str]:
+        return (self.provider.value, self.base_url, model)
+
+    def _sse_deltas(self, model: str, events: List[Any], trace: Optional[RequestTrace]) -> List[str]:
+        deltas: List[str] = []
+        for event in events:
+            content = _sse_content(event)
+            if isinstance(content, dict):
+                self._stream_usage(model, content)
+                if trace is not None:
+                    trace.set_usage({"usage": content})
+            elif content:
+                deltas.append(content)
+        return deltas
+
+    def chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None) -> Dict[str, Any]:
+        headers = self._headers()
         payload = self._build_payload(model, messages, gen, stream=False)
-        with httpx.Client(timeout=self.timeout) as client:
-            resp = client.post(url, headers=headers, json=payload)
-            if resp.status_code == 400 and "response_format" in payload:
-                # повторяем без response_format для несовместимых серверов (например, LM Studio)
-                payload.pop("response_format", None)
-                resp = client.post(url, headers=headers, json=payload)
-            resp.raise_for_status()
-            return resp.json()
-
-    def stream_chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None) -> Iterable[str]:
-        url = f"{self.base_url}/v1/chat/completions"
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+        client = self._client()
+        timeout = self._http_timeout(gen, stream=False)
+        resp = client.post(self.url, headers=headers, json=payload, timeout=timeout, extensions=http_extensions(trace))
+        fell_back = None
+        if resp.status_code == 400 and "response_format" in payload:
+            # повторяем без response_format для несовместимых серверов (например, LM Studio)
+            fell_back = self._fallback(model, payload, trace)
+            resp = client.post(self.url, headers=headers, json=payload, timeout=timeout, extensions=http_extensions(trace))
+        self._learn_response_format(payload, fell_back, resp.status_code)
+        resp.raise_for_status()
+        return resp.json()
+
+    @staticmethod
+    def _warmup_payload(model: str) -> Dict[str, Any]:
+        # 1 токен: сервер загружает модель (LM Studio JIT) и прогревает её, почти не тратя GPU
+        return {"model": model, "messages": [{"role": "user", "content": "ping"}], "max_tokens": 1, "stream": False}
+
+    def warmup(self, model: str, keep_alive: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """``keep_alive`` у OpenAI-совместимых серверов не передаётся: выгрузкой управляет сам сервер."""
+        resp = self._client().post(self.url, headers=self._headers(), json=self._warmup_payload(model), timeout=timeout or self.timeout)
+        resp.raise_for_status()
+
+    def stream_chat(self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None) -> Iterable[str]:
+        headers = self._headers()
         payload = self._build_payload(model, messages, gen, stream=True)
-        with httpx.Client(timeout=self.timeout) as client:
-            def do_stream(p: Dict[str, Any]) -> Iterable[str]:
-                with client.stream("POST", url, headers=headers, json=p) as resp:
-                    resp.raise_for_status()
-                    for line in resp.iter_lines():
-                        if not line:
-                            continue
-                        try:
-                            if line.startswith("data: "):
-                                line = line[6:]
-                            if line.strip() == "[DONE]":
-                                break
-                            obj = json.loads(line)
-                            delta = obj.get("choices", [{}])[0].get("delta", {})
-                            content = delta.get("content")
-                            if content:
-                                yield content
-                        except Exception:
-                            continue
-            # первая попытка
-            try:
-                yield from do_stream(payload)
+        client = self._client()
+        timeout = self._http_timeout(gen, stream=True)
+
+        def do_stream(p: Dict[str, Any], fell_back: Optional[str]) -> Iterable[str]:
+            with client.stream("POST", self.url, headers=headers, json=p, timeout=timeout, extensions=http_extensions(trace)) as resp:
+                resp.raise_for_status()
+                self._learn_response_format(p, fell_back, resp.status_code)
+                decoder = SSEDecoder(self._labels(model))
+                with self.timeouts.watch(resp, self.base_url) as watch:
+                    for chunk in resp.iter_bytes():
+                        for content in self._sse_deltas(model, decoder.feed(chunk), trace):
+                            watch.received()
+                            yield content
+                            watch.waiting()
+                        if decoder.done:
+                            break
+                    else:
+                        for content in self._sse_deltas(model, decoder.close(), trace):
+                            yield content
+        # первая попытка
+        try:
+            yield from do_stream(payload, None)
+            return
+        except httpx.HTTPStatusError as e:
+            if e.response is not None and e.response.status_code == 400 and "response_format" in payload:
+                yield from do_stream(payload, self._fallback(model, payload, trace))
                 return
-            except httpx.HTTPStatusError as e:
-                if e.response is not None and e.response.status_code == 400 and "response_format" in payload:
-                    payload.pop("response_format", None)
-                    yield from do_stream(payload)
-                    return
-                raise
+            raise
 
     @staticmethod
     def extract_text(response_json: Dict[str, Any]) -> str:
@@ -93,3 +198,69 @@ class OpenAICompatAdapter:
             return response_json["choices"][0]["message"]["content"]
         except Exception:
             return str(response_json)
+
+
+class AsyncOpenAICompatAdapter(OpenAICompatAdapter):
+    """Асинхронный вариант адаптера на httpx.AsyncClient (не блокирует event loop)."""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        timeout: float = 60.0,
+        http_client: Optional[httpx.AsyncClient] = None,
+        capabilities: Optional[CapabilityRegistry] = None,
+        timeouts: Optional[Timeouts] = None,
+    ):
+        super().__init__(base_url=base_url, api_key=api_key, timeout=timeout, capabilities=capabilities, timeouts=timeouts)
+        self.async_http_client = http_client
+
+    def _aclient(self) -> httpx.AsyncClient:
+        return self.async_http_client or get_async_http_client(self.provider, self.base_url, self.api_key)
+
+    async def chat(  # type: ignore[override]
+        self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None
+    ) -> Dict[str, Any]:
+        headers = self._headers()
+        payload = self._build_payload(model, messages, gen, stream=False)
+        client = self._aclient()
+        timeout = self._http_timeout(gen, stream=False)
+        resp = await client.post(self.url, headers=headers, json=payload, timeout=timeout, extensions=async_http_extensions(trace))
+        fell_back = None
+        if resp.status_code == 400 and "response_format" in payload:
+            fell_back = self._fallback(model, payload, trace)
+            resp = await client.post(self.url, headers=headers, json=payload, timeout=timeout, extensions=async_http_extensions(trace))
+        self._learn_response_format(payload, fell_back, resp.status_code)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def warmup(self, model: str, keep_alive: Optional[str] = None, timeout: Optional[float] = None) -> None:  # type: ignore[override]
+        client = self._aclient()
+        resp = await client.post(self.url, headers=self._headers(), json=self._warmup_payload(model), timeout=timeout or self.timeout)
+        resp.raise_for_status()
+
+    async def stream_chat(  # type: ignore[override]
+        self, model: str, messages: List[Message], gen: Optional[GenerationParams] = None, trace: Optional[RequestTrace] = None
+    ) -> AsyncIterator[str]:
+        headers = self._headers()
+        payload = self._build_payload(model, messages, gen, stream=True)
+        client = self._aclient()
+        timeout = self._http_timeout(gen, stream=True)
+        fell_back: Optional[str] = None
+        for attempt in range(2):
+            async with client.stream("POST", self.url, headers=headers, json=payload, timeout=timeout, extensions=async_http_extensions(trace)) as resp:
+                if attempt == 0 and resp.status_code == 400 and "response_format" in payload:
+                    fell_back = self._fallback(model, payload, trace)
+                    continue
+                resp.raise_for_status()
+                self._learn_response_format(payload, fell_back, resp.status_code)
+                decoder = SSEDecoder(self._labels(model))
+                async for chunk in resp.aiter_bytes():
+                    for content in self._sse_deltas(model, decoder.feed(chunk), trace):
+                        yield content
+                    if decoder.done:
+                        break
+                else:
+                    for content in self._sse_deltas(model, decoder.close(), trace):
+                        yield content
+            return
@@ -0,0 +1,296 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .metrics import Counter, Gauge, Histogram
+from .shared import SharedState, get_shared_state
+
+
+QUEUE_DEPTH = Gauge("gptoss_admission_queue_depth", "Requests waiting for an upstream slot", ("backend", "priority"))
+QUEUE_WAIT = Histogram(
+    "gptoss_admission_queue_wait_seconds",
+    "Time spent waiting for an upstream slot",
+    ("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+ACTIVE_SLOTS = Gauge("gptoss_admission_active", "Upstream generations currently admitted", ("backend",))
+REJECTED = Counter("gptoss_admission_rejected", "Requests shed by admission control", ("reason",))
+
+
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    BATCH = "batch"
+
+
+_RANK = {Priority.INTERACTIVE: 0, Priority.BATCH: 1}
+_EVICT_BATCH = 4
+
+
+class AdmissionRejected(Exception):
+    """Запрос не принят: сервер отвечает 429 с ``Retry-After``."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(f"Request rejected by admission control: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "cancelled")
+
+    def __init__(self, future: "asyncio.Future[None]", priority: Priority) -> None:
+        self.future = future
+        self.priority = priority
+        self.cancelled = False
+
+
+class _Lane:
+    """Слоты одного бэкенда и очередь к ним (куча по приоритету, внутри приоритета — FIFO)."""
+
+    def __init__(self, name: str, limit: int) -> None:
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.heap: List[Tuple[int, int, _Waiter]] = []
+        self.queued: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.service_ewma: Optional[float] = None
+
+    def ahead_of(self, priority: Priority) -> int:
+        return sum(n for p, n in self.queued.items() if _RANK[p] <= _RANK[priority])
+
+    def estimated_wait(self, priority: Priority) -> Optional[float]:
+        if self.active < self.limit and not self.heap:
+            return 0.0
+        if self.service_ewma is None:
+            return None
+        return math.ceil((self.ahead_of(priority) + 1) / self.limit) * self.service_ewma
+
+
+class _KeyQuota:
+    __slots__ = ("inflight", "tokens", "updated")
+
+    def __init__(self, capacity: float) -> None:
+        self.inflight = 0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+
+class AdmissionController:
+    """Ограничивает число одновременных генераций на бэкенд и ставит лишние запросы в очередь.
+
+    Интерактивные запросы обслуживаются раньше пакетных. Если ожидаемое время в очереди больше
+    ``queue_timeout`` (или очередь полна, или исчерпана квота ключа) — сразу ``AdmissionRejected``
+    вместо ожидания, которое всё равно закончится таймаутом у клиента.
+
+    С ``shared`` (несколько воркеров) лимит ``max_concurrent`` общий для всех процессов: после очереди
+    своего процесса запрос берёт слот в общем файле, опрашивая его, пока слот не освободится.
+    Приоритеты соблюдаются внутри воркера; между воркерами слоты достаются первому успевшему.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_queue: int = 256,
+        queue_timeout: float = 30.0,
+        key_max_concurrent: Optional[int] = None,
+        key_rate_per_minute: Optional[float] = None,
+        ewma_alpha: float = 0.2,
+        shared: Optional[SharedState] = None,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.key_max_concurrent = key_max_concurrent
+        self.key_rate_per_minute = key_rate_per_minute
+        self.ewma_alpha = ewma_alpha
+        self.shared = shared
+        self._lanes: Dict[str, _Lane] = {}
+        # квоты ключей от давно не приходивших к недавним
+        self._keys: "OrderedDict[str, _KeyQuota]" = OrderedDict()
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """Включается GPTOSS_MAX_CONCURRENT; GPTOSS_MAX_QUEUE, GPTOSS_QUEUE_TIMEOUT, GPTOSS_KEY_MAX_CONCURRENT, GPTOSS_KEY_RPM."""
+        limit = os.getenv("GPTOSS_MAX_CONCURRENT")
+        if not limit:
+            return None
+        key_concurrent = os.getenv("GPTOSS_KEY_MAX_CONCURRENT")
+        key_rpm = os.getenv("GPTOSS_KEY_RPM")
+        return cls(
+            max_concurrent=int(limit),
+            max_queue=int(os.getenv("GPTOSS_MAX_QUEUE", "256")),
+            queue_timeout=float(os.getenv("GPTOSS_QUEUE_TIMEOUT", "30")),
+            key_max_concurrent=int(key_concurrent) if key_concurrent else None,
+            key_rate_per_minute=float(key_rpm) if key_rpm else None,
+            shared=get_shared_state(),
+        )
+
+    def _lane(self, backend: str) -> _Lane:
+        lane = self._lanes.get(backend)
+        if lane is None:
+            lane = self._lanes[backend] = _Lane(backend, self.max_concurrent)
+        return lane
+
+    def _idle(self, quota: _KeyQuota, now: float) -> bool:
+        """Квота без запросов в работе и с полным ведром ничем не отличается от новой."""
+        if quota.inflight:
+            return False
+        capacity = self.key_rate_per_minute
+        return capacity is None or quota.tokens + (now - quota.updated) * capacity / 60.0 >= capacity
+
+    def _evict_keys(self, now: float) -> None:
+        # ключи клиент выбирает сам: без вытеснения ротация ключей растит память без предела.
+        # За вызов смотрим несколько самых старых — новый ключ добавляется не чаще раза за вызов
+        for _ in range(min(len(self._keys), _EVICT_BATCH)):
+            key, quota = next(iter(self._keys.items()))
+            if quota.inflight:
+                # долгий запрос не держит очередь вытеснения
+                self._keys.move_to_end(key)
+            elif self._idle(quota, now):
+                del self._keys[key]
+            else:
+                break
+
+    def _check_key(self, api_key: Optional[str]) -> None:
+        if api_key is None or (self.key_max_concurrent is None and self.key_rate_per_minute is None):
+            return
+        capacity = self.key_rate_per_minute or 0.0
+        # до поиска своей квоты: она не должна пропасть между проверкой и slot()
+        self._evict_keys(time.monotonic())
+        quota = self._keys.get(api_key)
+        if quota is None:
+            quota = self._keys[api_key] = _KeyQuota(capacity)
+        else:
+            self._keys.move_to_end(api_key)
+        if self.key_max_concurrent is not None and quota.inflight >= self.key_max_concurrent:
+            REJECTED.labels("key_concurrency").inc()
+            raise AdmissionRejected("too many concurrent requests for this API key", 1.0)
+        if self.key_rate_per_minute is not None:
+            # token bucket: ёмкость и скорость пополнения — key_rate_per_minute в минуту
+            now = time.monotonic()
+            quota.tokens = min(capacity, quota.tokens + (now - quota.updated) * capacity / 60.0)
+            quota.updated = now
+            if quota.tokens < 1.0:
+                REJECTED.labels("key_rate").inc()
+                raise AdmissionRejected("rate limit exceeded for this API key", (1.0 - quota.tokens) * 60.0 / capacity)
+            quota.tokens -= 1.0
+
+    async def acquire(self, backend: str, priority: Priority = Priority.INTERACTIVE) -> None:
+        lane = self._lane(backend)
+        if lane.active < lane.limit and not lane.heap:
+            lane.active += 1
+            ACTIVE_SLOTS.labels(backend).set(lane.active)
+            QUEUE_WAIT.labels(priority.value).observe(0.0)
+            return
+        if sum(lane.queued.values()) >= self.max_queue:
+            REJECTED.labels("queue_full").inc()
+            raise AdmissionRejected("queue is full", lane.estimated_wait(priority) or 1.0)
+        estimate = lane.estimated_wait(priority)
+        if estimate is not None and estimate > self.queue_timeout:
+            REJECTED.labels("deadline").inc()
+            raise AdmissionRejected("queue wait would exceed the deadline", estimate)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority)
+        heapq.heappush(lane.heap, (_RANK[priority], next(self._seq), waiter))
+        lane.queued[priority] += 1
+        QUEUE_DEPTH.labels(backend, priority.value).set(lane.queued[priority])
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # слот уже передан нам — возвращаем его следующему
+                self.release(backend)
+            else:
+                waiter.cancelled = True
+                waiter.future.cancel()
+                lane.queued[priority] -= 1
+                QUEUE_DEPTH.labels(backend, priority.value).set(lane.queued[priority])
+            if isinstance(e, asyncio.TimeoutError):
+                REJECTED.labels("timeout").inc()
+                raise AdmissionRejected("timed out waiting in queue", lane.estimated_wait(priority) or self.queue_timeout)
+            raise
+        finally:
+            QUEUE_WAIT.labels(priority.value).observe(time.monotonic() - started)
+
+    def release(self, backend: str, held: Optional[float] = None) -> None:
+        lane = self._lane(backend)
+        if held is not None:
+            lane.service_ewma = held if lane.service_ewma is None else self.ewma_alpha * held + (1 - self.ewma_alpha) * lane.service_ewma
+        while lane.heap:
+            _, _, waiter = heapq.heappop(lane.heap)
+            if waiter.cancelled:
+                continue
+            # передаём слот напрямую: active не меняется
+            lane.queued[waiter.priority] -= 1
+            QUEUE_DEPTH.labels(backend, waiter.priority.value).set(lane.queued[waiter.priority])
+            waiter.future.set_result(None)
+            return
+        lane.active -= 1
+        ACTIVE_SLOTS.labels(backend).set(lane.active)
+
+    async def _lease(self, backend: str, priority: Priority, deadline: float) -> int:
+        """Слот в общем файле, не дольше ``deadline``; к файлу обращается поток ``SharedState``, а не event loop."""
+        assert self.shared is not None
+        lease = await self.shared.wait_lease(backend, self.max_concurrent, deadline)
+        if lease is None:
+            REJECTED.labels("timeout").inc()
+            raise AdmissionRejected("timed out waiting for a shared slot", self._lane(backend).estimated_wait(priority) or self.queue_timeout)
+        return lease
+
+    @asynccontextmanager
+    async def slot(self, backend: str, priority: Priority = Priority.INTERACTIVE, api_key: Optional[str] = None) -> AsyncIterator[None]:
+        """Слот на генерацию у бэкенда ``backend`` на время блока (квота ключа учитывается до очереди)."""
+        self._check_key(api_key)
+        quota = self._keys.get(api_key) if api_key is not None else None
+        if quota is not None:
+            quota.inflight += 1
+        try:
+            queued = time.monotonic()
+            await self.acquire(backend, priority)
+            shared = self.shared
+            try:
+                lease = await self._lease(backend, priority, queued + self.queue_timeout) if shared is not None else None
+            except BaseException:
+                self.release(backend)
+                raise
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                try:
+                    if shared is not None and lease is not None:
+                        # при отмене ожидания освобождение всё равно выполнится в потоке SharedState
+                        await shared.call(shared.release_lease, lease)
+                finally:
+                    self.release(backend, time.monotonic() - started)
+        finally:
+            if quota is not None:
+                quota.inflight -= 1
+
+    def status(self, leases: Optional[Dict[str, int]] = None) -> Dict[str, Dict[str, object]]:
+        """Слоты по бэкендам; с общим состоянием ``shared_active`` — занято всеми воркерами.
+
+        ``leases`` — уже прочитанный ``SharedState.leases()`` (асинхронный код читает его через ``SharedState.call``).
+        """
+        if leases is None and self.shared is not None:
+            leases = self.shared.leases()
+        return {
+            name: {
+                "active": lane.active,
+                **({"shared_active": leases.get(name, 0)} if leases is not None else {}),
+                "limit": lane.limit,
+                "queued": {p.value: n for p, n in lane.queued.items()},
+                "service_ewma_ms": round(lane.service_ewma * 1000, 2) if lane.service_ewma is not None else None,
+            }
+            for name, lane in self._lanes.items()
+        }
@@ -0,0 +1,334 @@
+from __future__ import annotations
+import itertools
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Set, TypeVar, Union
+
+import httpx
+from pydantic import BaseModel
+
+from .metrics import Gauge
+from .pool import get_http_client
+from .providers import BalanceStrategy, Provider
+
+
+T = TypeVar("T")
+
+BACKEND_UP = Gauge("gptoss_backend_up", "Backend health as seen by the load balancer (1 = routable)", ("provider", "base_url"))
+
+
+class Backend(BaseModel):
+    provider: Provider = Provider.OPENAI_COMPAT
+    base_url: str
+    api_key: Optional[str] = None
+    model: Optional[str] = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Backend":
+        """Разбор строки ``[provider=]url[#model]``, например ``ollama=http://gpu2:11434#gpt-oss:20b``."""
+        provider = Provider.OPENAI_COMPAT
+        if "=" in spec.split("://", 1)[0]:
+            name, spec = spec.split("=", 1)
+            provider = Provider(name.strip().lower())
+        model: Optional[str] = None
+        if "#" in spec:
+            spec, model = spec.split("#", 1)
+        return cls(provider=provider, base_url=spec.strip(), model=model or None)
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider.value}|{self.base_url.rstrip('/')}"
+
+
+class NoBackendAvailable(RuntimeError):
+    pass
+
+
+def is_failover_error(e: BaseException) -> bool:
+    """Ошибки, после которых имеет смысл попробовать другую реплику."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return isinstance(e, httpx.TransportError)
+
+
+class BackendNode:
+    """Состояние одной реплики: незавершённые запросы, EWMA задержки, circuit breaker."""
+
+    def __init__(self, backend: Backend) -> None:
+        self.backend = backend
+        self.outstanding = 0
+        self.ewma: Optional[float] = None
+        self.failures = 0
+        self.open_until = 0.0
+        self.healthy = True
+
+    def available(self, now: float) -> bool:
+        # после cooldown breaker «полуоткрыт»: реплика снова получает трафик, первая же ошибка откроет его снова
+        return now >= self.open_until
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "provider": self.backend.provider.value,
+            "base_url": self.backend.base_url,
+            "model": self.backend.model,
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma * 1000, 2) if self.ewma is not None else None,
+            "failures": self.failures,
+            "circuit_open": not self.available(time.monotonic()),
+            "healthy": self.healthy,
+        }
+
+
+class BackendPool:
+    """Пул реплик (можно смешивать OpenAI-совместимые и Ollama) с балансировкой и failover.
+
+    Маршрутизация — по наименьшему числу незавершённых запросов или по EWMA задержки.
+    После ``failure_threshold`` ошибок подряд реплика исключается на ``cooldown`` секунд;
+    фоновые health-check'и (``start_health_checks``) возвращают её раньше или исключают заранее.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[Union[Backend, str]],
+        strategy: BalanceStrategy = BalanceStrategy.LEAST_OUTSTANDING,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        ewma_alpha: float = 0.3,
+        health_check_interval: Optional[float] = None,
+        health_check_timeout: float = 5.0,
+    ) -> None:
+        if not backends:
+            raise ValueError("BackendPool requires at least one backend")
+        self.nodes = [BackendNode(b if isinstance(b, Backend) else Backend.parse(b)) for b in backends]
+        self.strategy = BalanceStrategy(strategy)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+        for node in self.nodes:
+            BACKEND_UP.labels(node.backend.provider.value, node.backend.base_url).set(1)
+
+    @classmethod
+    def from_env(cls) -> Optional["BackendPool"]:
+        """GPTOSS_BACKENDS="openai=http://a:8000/v1,ollama=http://b:11434"; GPTOSS_BALANCE, GPTOSS_HEALTH_INTERVAL."""
+        specs = [s.strip() for s in os.getenv("GPTOSS_BACKENDS", "").split(",") if s.strip()]
+        if not specs:
+            return None
+        interval = os.getenv("GPTOSS_HEALTH_INTERVAL")
+        return cls(
+            specs,
+            strategy=BalanceStrategy(os.getenv("GPTOSS_BALANCE", BalanceStrategy.LEAST_OUTSTANDING.value)),
+            health_check_interval=float(interval) if interval else 10.0,
+        )
+
+    @property
+    def primary(self) -> Backend:
+        return self.nodes[0].backend
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [node.status() for node in self.nodes]
+
+    def _score(self, node: BackendNode) -> float:
+        if self.strategy == BalanceStrategy.EWMA:
+            # неизвестная задержка = 0, чтобы новые реплики получили трафик и оценку
+            return (node.ewma or 0.0) * (node.outstanding + 1)
+        return float(node.outstanding)
+
+    def pick(self, exclude: Optional[Set[BackendNode]] = None) -> Optional[BackendNode]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [n for n in self.nodes if not exclude or n not in exclude]
+            if not candidates:
+                return None
+            ready = [n for n in candidates if n.available(now) and n.healthy]
+            if not ready:
+                # все реплики исключены — пробуем ту, что вернётся раньше всех, вместо отказа
+                ready = [min(candidates, key=lambda n: n.open_until)]
+            offset = next(self._rr)
+            best = min(
+                range(len(ready)),
+                key=lambda i: (self._score(ready[i]), (i - offset) % len(ready)),
+            )
+            node = ready[best]
+            node.outstanding += 1
+            return node
+
+    def release(self, node: BackendNode, elapsed: Optional[float], error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            node.outstanding -= 1
+            if error is not None:
+                if is_failover_error(error):
+                    self._mark_failure(node)
+                return
+            node.failures = 0
+            node.open_until = 0.0
+            if elapsed is not None:
+                node.ewma = elapsed if node.ewma is None else self.ewma_alpha * elapsed + (1 - self.ewma_alpha) * node.ewma
+        self._publish(node)
+
+    def _mark_failure(self, node: BackendNode) -> None:
+        node.failures += 1
+        if node.failures >= self.failure_threshold:
+            node.open_until = time.monotonic() + self.cooldown
+        self._publish(node)
+
+    def _publish(self, node: BackendNode) -> None:
+        up = node.healthy and node.available(time.monotonic())
+        BACKEND_UP.labels(node.backend.provider.value, node.backend.base_url).set(1 if up else 0)
+
+    def call(self, fn: Callable[[BackendNode], T]) -> T:
+        """Вызывает fn на выбранной реплике; при сетевой ошибке/5xx/429 повторяет на следующей."""
+        tried: Set[BackendNode] = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            node = self.pick(tried)
+            if node is None:
+                raise last_error or NoBackendAvailable("no backend available")
+            tried.add(node)
+            started = time.perf_counter()
+            try:
+                result = fn(node)
+            except Exception as e:
+                self.release(node, None, e)
+                if not is_failover_error(e):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                # отмена (например, проигравший хеджированный запрос) — не ошибка реплики
+                self.release(node, None)
+                raise
+            self.release(node, time.perf_counter() - started)
+            return result
+
+    async def acall(self, fn: Callable[[BackendNode], Awaitable[T]]) -> T:
+        tried: Set[BackendNode] = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            node = self.pick(tried)
+            if node is None:
+                raise last_error or NoBackendAvailable("no backend available")
+            tried.add(node)
+            started = time.perf_counter()
+            try:
+                result = await fn(node)
+            except Exception as e:
+                self.release(node, None, e)
+                if not is_failover_error(e):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                # отмена (например, проигравший хеджированный запрос) — не ошибка реплики
+                self.release(node, None)
+                raise
+            self.release(node, time.perf_counter() - started)
+            return result
+
+    def stream(self, fn: Callable[[BackendNode], Iterator[T]]) -> Iterator[T]:
+        """Как ``call`` для стримов: failover возможен только до первого полученного элемента."""
+        tried: Set[BackendNode] = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            node = self.pick(tried)
+            if node is None:
+                raise last_error or NoBackendAvailable("no backend available")
+            tried.add(node)
+            started = time.perf_counter()
+            received = False
+            try:
+                for item in fn(node):
+                    received = True
+                    yield item
+            except Exception as e:
+                self.release(node, None, e)
+                if received or not is_failover_error(e):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                self.release(node, None)
+                raise
+            self.release(node, time.perf_counter() - started)
+            return
+
+    async def astream(self, fn: Callable[[BackendNode], AsyncIterator[T]]) -> AsyncIterator[T]:
+        tried: Set[BackendNode] = set()
+        last_error: Optional[BaseException] = None
+        while True:
+            node = self.pick(tried)
+            if node is None:
+                raise last_error or NoBackendAvailable("no backend available")
+            tried.add(node)
+            started = time.perf_counter()
+            received = False
+            try:
+                async for item in fn(node):
+                    received = True
+                    yield item
+            except Exception as e:
+                self.release(node, None, e)
+                if received or not is_failover_error(e):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                self.release(node, None)
+                raise
+            self.release(node, time.perf_counter() - started)
+            return
+
+    def _health_url(self, backend: Backend) -> str:
+        base = backend.base_url.rstrip("/")
+        if backend.provider == Provider.OLLAMA:
+            return f"{base}/api/tags"
+        if base.endswith("/v1"):
+            base = base[:-3]
+        return f"{base}/v1/models"
+
+    def check_health(self) -> None:
+        """Один проход health-check'ов по всем репликам."""
+        for node in self.nodes:
+            backend = node.backend
+            try:
+                headers = {"Authorization": f"Bearer {backend.api_key}"} if backend.api_key else None
+                client = get_http_client(backend.provider, backend.base_url, backend.api_key)
+                resp = client.get(self._health_url(backend), headers=headers, timeout=self.health_check_timeout)
+                resp.raise_for_status()
+                healthy = True
+            except Exception:
+                healthy = False
+            with self._lock:
+                node.healthy = healthy
+                if healthy and node.failures >= self.failure_threshold:
+                    node.failures = 0
+                    node.open_until = 0.0
+                elif not healthy:
+                    node.failures = max(node.failures, self.failure_threshold)
+                    node.open_until = time.monotonic() + self.cooldown
+            self._publish(node)
+
+    def start_health_checks(self) -> None:
+        if self.health_check_interval is None or self._health_thread is not None:
+            return
+        self._stop.clear()
+
+        def loop() -> None:
+            while not self._stop.wait(self.health_check_interval):
+                self.check_health()
+
+        self._health_thread = threading.Thread(target=loop, name="gptoss-health-checks", daemon=True)
+        self._health_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=self.health_check_timeout + 1)
+            self._health_thread = None
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from .client import LLMClient
+from .schema import BatchItem, GenerationParams
+
+
+class BatchCheckpoint(BaseModel):
+    """Прогресс пакетного прогона.
+
+    Результаты пишутся не по порядку, поэтому хранится «водораздел» ``watermark`` (все строки входа
+    с меньшим номером готовы) и небольшой набор готовых строк за ним — размер не зависит от длины входа.
+    ``output_bytes`` — длина выходного файла на момент сохранения: при возобновлении хвост после неё
+    (строки, записанные после последнего чекпойнта) отрезается и пересчитывается, поэтому дублей нет.
+    """
+
+    input: str
+    watermark: int = 0
+    done: List[int] = []
+    output_bytes: int = 0
+    ok: int = 0
+    errors: int = 0
+    finished: bool = False
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark
+
+    def mark(self, index: int, done: Set[int]) -> None:
+        done.add(index)
+        while self.watermark in done:
+            done.discard(self.watermark)
+            self.watermark += 1
+
+
+class BatchStats(BaseModel):
+    ok: int = 0
+    errors: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+
+
+def checkpoint_path(output: str) -> str:
+    return f"{output}.checkpoint"
+
+
+def load_checkpoint(path: str) -> Optional[BatchCheckpoint]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return BatchCheckpoint.model_validate_json(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(path: str, checkpoint: BatchCheckpoint, done: Set[int]) -> None:
+    checkpoint.done = sorted(done)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(checkpoint.model_dump_json())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _prompt_of(line: str) -> Tuple[str, Any]:
+    """Строка входа: JSON-строка или объект с ``prompt`` (или ``message``) и необязательным ``id``."""
+    data = json.loads(line)
+    if isinstance(data, str):
+        return data, None
+    if isinstance(data, dict):
+        prompt = data.get("prompt", data.get("message"))
+        if isinstance(prompt, str):
+            return prompt, data.get("id")
+    raise ValueError("expected a JSON string or an object with 'prompt'")
+
+
+def _record(index: int, item_id: Any, item: BatchItem) -> Dict[str, Any]:
+    record: Dict[str, Any] = {"index": index}
+    if item_id is not None:
+        record["id"] = item_id
+    if item.result is not None:
+        record["reasoning"] = item.result.reasoning
+        record["final"] = item.result.final_answer
+        parsed = item.result.parsed
+        if parsed is not None:
+            record["parsed"] = parsed.model_dump(mode="json") if isinstance(parsed, BaseModel) else parsed
+    else:
+        record["error"] = item.error
+    return record
+
+
+def run_batch(
+    client: LLMClient,
+    input_path: str,
+    output_path: str,
+    concurrency: int = 8,
+    system_prompt: Optional[str] = None,
+    gen: Optional[GenerationParams] = None,
+    resume: bool = True,
+    checkpoint_every: int = 100,
+    checkpoint_interval: float = 5.0,
+    on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> BatchStats:
+    """Прогоняет JSONL-файл промптов через ``client`` и пишет JSONL-результаты по мере готовности.
+
+    Вход читается построчно (файл целиком в память не загружается), в работе не больше
+    ``2 * concurrency`` запросов, соединения берутся из общего пула клиента. Каждая строка
+    результата содержит номер строки входа (``index``). Чекпойнт ``<output>.checkpoint`` сохраняется
+    каждые ``checkpoint_every`` результатов или ``checkpoint_interval`` секунд; с ``resume=True``
+    прерванный прогон продолжается с места остановки.
+    """
+    started = time.perf_counter()
+    ckpt_path = checkpoint_path(output_path)
+    input_abs = os.path.abspath(input_path)
+    checkpoint = load_checkpoint(ckpt_path) if resume else None
+    if checkpoint is not None and checkpoint.input != input_abs:
+        raise ValueError(f"checkpoint {ckpt_path} belongs to another input: {checkpoint.input}")
+    if checkpoint is None:
+        checkpoint = BatchCheckpoint(input=input_abs)
+        mode = "wb"
+    else:
+        mode = "r+b" if os.path.exists(output_path) else "wb"
+    done: Set[int] = set(checkpoint.done)
+    stats = BatchStats()
+    # позиция в потоке промптов → (номер строки входа, id); размер ограничен числом запросов в работе
+    inflight: Dict[int, Tuple[int, Any]] = {}
+
+    with open(input_path, "r", encoding="utf-8") as src, open(output_path, mode) as out:
+        out.truncate(checkpoint.output_bytes)
+        out.seek(checkpoint.output_bytes)
+        unsaved = 0
+        last_save = time.monotonic()
+
+        def save() -> None:
+            nonlocal unsaved, last_save
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.output_bytes = out.tell()
+            _save_checkpoint(ckpt_path, checkpoint, done)
+            unsaved = 0
+            last_save = time.monotonic()
+
+        def write(index: int, record: Dict[str, Any], failed: bool) -> None:
+            nonlocal unsaved
+            out.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            checkpoint.mark(index, done)
+            if failed:
+                checkpoint.errors += 1
+                stats.errors += 1
+            else:
+                checkpoint.ok += 1
+                stats.ok += 1
+            if on_item is not None:
+                on_item(record)
+            unsaved += 1
+            if unsaved >= checkpoint_every or time.monotonic() - last_save >= checkpoint_interval:
+                save()
+
+        def prompts() -> Iterator[str]:
+            # генератор потребляется в потоке вызывающего (iter_chat_many), поэтому писать отсюда безопасно
+            position = 0
+            for index, line in enumerate(src):
+                if checkpoint.is_done(index) or index in done:
+                    stats.skipped += 1
+                    continue
+                if not line.strip():
+                    checkpoint.mark(index, done)
+                    continue
+                try:
+                    prompt, item_id = _prompt_of(line)
+                except ValueError as e:
+                    write(index, {"index": index, "error": f"invalid input line: {e}"}, True)
+                    continue
+                inflight[position] = (index, item_id)
+                position += 1
+                yield prompt
+
+        try:
+            for item in client.iter_chat_many(prompts(), concurrency=concurrency, system_prompt=system_prompt, gen=gen):
+                index, item_id = inflight.pop(item.index)
+                write(index, _record(index, item_id, item), item.error is not None)
+        except BaseException:
+            # Ctrl+C и прочие сбои: сохраняем уже записанное, чтобы не пересчитывать его
+            save()
+            raise
+        checkpoint.finished = True
+        save()
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
@@ -0,0 +1,214 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from enum import Enum
+from typing import Iterator, List, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from .client import AsyncLLMClient
+from .mock_server import MockConfig
+from .pool import aclose_pools
+from .providers import Provider
+from .schema import GenerationParams
+
+
+class BenchTarget(str, Enum):
+    CLIENT = "client"
+    STREAM = "stream"
+    SERVER = "server"
+    SERVER_STREAM = "server-stream"
+
+
+class BenchConfig(BaseModel):
+    target: BenchTarget = BenchTarget.CLIENT
+    provider: Provider = Provider.OPENAI_COMPAT
+    base_url: Optional[str] = None
+    model: str = "gpt-oss-20b"
+    requests: int = 200
+    concurrency: int = 16
+    json_output: bool = False
+    mock: MockConfig = MockConfig()
+
+
+class BenchReport(BaseModel):
+    target: BenchTarget
+    requests: int
+    errors: int
+    concurrency: int
+    wall_seconds: float
+    throughput_rps: float
+    latency_p50_ms: float
+    latency_p95_ms: float
+    latency_p99_ms: float
+    ttft_p50_ms: Optional[float] = None
+    ttft_p95_ms: Optional[float] = None
+    ttft_p99_ms: Optional[float] = None
+    cpu_ms_per_request: float
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # метод ближайшего ранга
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start: {url}")
+
+
+@contextlib.contextmanager
+def run_mock_backend(cfg: MockConfig) -> Iterator[str]:
+    """Мок-бэкенд в отдельном процессе, чтобы его CPU не попадал в замеры клиента."""
+    port = _free_port()
+    env = {**os.environ, **cfg.to_env()}
+    cmd = [sys.executable, "-m", "uvicorn", "gpt_oss_client.mock_server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, env=env)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        _wait_ready(f"{base}/v1/models")
+        yield base
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+@contextlib.contextmanager
+def run_rest_server() -> Iterator[str]:
+    """REST-сервер gptoss в фоновом потоке этого процесса: его CPU учитывается в замере."""
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config("gpt_oss_client.server:app", host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    try:
+        while not server.started:
+            time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+async def _one_client(client: AsyncLLMClient, gen: GenerationParams, stream: bool, ttfts: List[float]) -> None:
+    started = time.perf_counter()
+    if not stream:
+        await client.chat("Benchmark prompt", gen=gen)
+        return
+    first = True
+    async for _ in client.stream_chat("Benchmark prompt", gen=gen):
+        if first:
+            ttfts.append(time.perf_counter() - started)
+            first = False
+
+
+async def _one_server(http: httpx.AsyncClient, server_url: str, body: dict, stream: bool, ttfts: List[float]) -> None:
+    started = time.perf_counter()
+    if not stream:
+        resp = await http.post(f"{server_url}/chat", json=body)
+        resp.raise_for_status()
+        return
+    async with http.stream("POST", f"{server_url}/chat/stream", json=body) as resp:
+        resp.raise_for_status()
+        first = True
+        async for line in resp.aiter_lines():
+            if first and line.startswith("event: token"):
+                ttfts.append(time.perf_counter() - started)
+                first = False
+
+
+async def _drive(cfg: BenchConfig, base_url: str, server_url: Optional[str]) -> BenchReport:
+    gen = GenerationParams(json_output=cfg.json_output)
+    client = AsyncLLMClient(provider=cfg.provider, base_url=base_url, model=cfg.model)
+    body = {"message": "Benchmark prompt", "provider": cfg.provider.value, "base_url": base_url, "model": cfg.model, "json_output": cfg.json_output}
+    stream = cfg.target in (BenchTarget.STREAM, BenchTarget.SERVER_STREAM)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(cfg.concurrency)
+    limits = httpx.Limits(max_connections=cfg.concurrency, max_keepalive_connections=cfg.concurrency)
+
+    async with httpx.AsyncClient(timeout=300.0, limits=limits) as http:
+        async def one() -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    if server_url is None:
+                        await _one_client(client, gen, stream, ttfts)
+                    else:
+                        await _one_server(http, server_url, body, stream, ttfts)
+                except Exception:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - started)
+
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(cfg.requests)))
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+    await aclose_pools()
+
+    def ms(values: List[float], q: float) -> float:
+        return round(percentile(values, q) * 1000, 2)
+
+    return BenchReport(
+        target=cfg.target,
+        requests=cfg.requests,
+        errors=errors,
+        concurrency=cfg.concurrency,
+        wall_seconds=round(wall, 3),
+        throughput_rps=round(len(latencies) / wall, 2) if wall else 0.0,
+        latency_p50_ms=ms(latencies, 50),
+        latency_p95_ms=ms(latencies, 95),
+        latency_p99_ms=ms(latencies, 99),
+        ttft_p50_ms=ms(ttfts, 50) if stream else None,
+        ttft_p95_ms=ms(ttfts, 95) if stream else None,
+        ttft_p99_ms=ms(ttfts, 99) if stream else None,
+        cpu_ms_per_request=round(cpu / max(cfg.requests, 1) * 1000, 3),
+    )
+
+
+def run_bench(cfg: BenchConfig) -> BenchReport:
+    """Нагрузочный прогон LLMClient, стриминга или REST-сервера.
+
+    Без ``base_url`` поднимается локальный мок-бэкенд (отдельный процесс), так что замеряется
+    только собственный оверхед клиента. ``cpu_ms_per_request`` — CPU этого процесса
+    (драйвер нагрузки и, для целей server/server-stream, REST-сервер) на один запрос.
+    """
+    with contextlib.ExitStack() as stack:
+        base_url = cfg.base_url
+        if base_url is None:
+            base_url = stack.enter_context(run_mock_backend(cfg.mock))
+            if cfg.provider == Provider.OPENAI_COMPAT:
+                base_url += "/v1"
+        server_url: Optional[str] = None
+        if cfg.target in (BenchTarget.SERVER, BenchTarget.SERVER_STREAM):
+            server_url = stack.enter_context(run_rest_server())
+        return asyncio.run(_drive(cfg, base_url, server_url))
@@ -0,0 +1,246 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from .providers import Provider
+from .schema import ChatResult, GenerationParams, Message
+
+
+def cache_key(provider: Provider, base_url: str, model: str, messages: List[Message], gen: GenerationParams) -> str:
+    """Ключ кэша — sha256 канонического JSON запроса (провайдер, бэкенд, модель, сообщения, параметры)."""
+    payload = {
+        "provider": Provider(provider).value,
+        "base_url": base_url.rstrip("/"),
+        "model": model,
+        "messages": [m.model_dump() for m in messages],
+        "gen": gen.model_dump(exclude={"timeout"}),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _expires_at(ttl: Optional[float]) -> Optional[float]:
+    # None — бессрочно; ttl <= 0 («не кэшировать») проверяют до вызова
+    return time.time() + ttl if ttl is not None else None
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    stores: int = 0
+    evictions: int = 0
+    memory_entries: int = 0
+
+
+class MemoryCache:
+    """LRU в памяти с ограничением по числу записей и TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._data: "OrderedDict[str, Tuple[Optional[float], ChatResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[ChatResult]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: ChatResult, ttl: Optional[float] = None) -> None:
+        """``ttl`` — секунд жизни (по умолчанию ``self.ttl``); ``<= 0`` — не сохранять, ``None`` у кэша — бессрочно."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            return
+        self.put(key, value, _expires_at(ttl))
+
+    def put(self, key: str, value: ChatResult, expires_at: Optional[float]) -> None:
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """Персистентный уровень кэша в SQLite: переживает перезапуск процесса."""
+
+    def __init__(self, path: str, ttl: Optional[float] = 7 * 24 * 3600.0) -> None:
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def get(self, key: str) -> Optional[ChatResult]:
+        entry = self.entry(key)
+        return entry[1] if entry is not None else None
+
+    def entry(self, key: str) -> Optional[Tuple[Optional[float], ChatResult]]:
+        """(срок годности, значение) — чтобы уровень в памяти не продлевал запись при подъёме с диска."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        return expires_at, ChatResult.model_validate_json(value)
+
+    def set(self, key: str, value: ChatResult, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value.model_dump_json(), _expires_at(ttl)),
+            )
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            return cur.rowcount
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """Двухуровневый кэш ответов: LRU/TTL в памяти и (опционально) SQLite на диске."""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        path: Optional[str] = None,
+        disk_ttl: Optional[float] = None,
+    ) -> None:
+        self.memory = MemoryCache(max_entries=max_entries, ttl=ttl)
+        self.disk: Optional[SQLiteCache] = SQLiteCache(path, ttl=disk_ttl if disk_ttl is not None else ttl) if path else None
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Настройка через GPTOSS_CACHE_MAX_ENTRIES, GPTOSS_CACHE_TTL и GPTOSS_CACHE_PATH.
+
+        Без GPTOSS_CACHE_PATH, но с GPTOSS_SHARED_STATE (несколько воркеров) дисковый уровень общий для воркеров:
+        ответ, полученный одним воркером, достаётся из кэша и в остальных. Файл отдельный (``<GPTOSS_SHARED_STATE>.cache``),
+        чтобы запись в кэш не ждала транзакций со слотами admission control.
+        """
+        ttl = os.getenv("GPTOSS_CACHE_TTL")
+        path = os.getenv("GPTOSS_CACHE_PATH")
+        shared = os.getenv("GPTOSS_SHARED_STATE")
+        if not path and shared:
+            path = f"{shared}.cache"
+        return cls(
+            max_entries=int(os.getenv("GPTOSS_CACHE_MAX_ENTRIES", "1024")),
+            ttl=float(ttl) if ttl else 3600.0,
+            path=path or None,
+        )
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self._stats, field, getattr(self._stats, field) + 1)
+
+    def _hit(self, tier: str, value: ChatResult) -> ChatResult:
+        self._count("hits")
+        self._count(f"{tier}_hits")
+        return value.model_copy(deep=True)
+
+    def _from_disk(self, key: str, entry: Optional[Tuple[Optional[float], ChatResult]]) -> Optional[ChatResult]:
+        if entry is None:
+            self._count("misses")
+            return None
+        expires_at, value = entry
+        # с оставшимся сроком диска: подъём в память не продлевает запись
+        self.memory.put(key, value, expires_at)
+        return self._hit("disk", value)
+
+    def get(self, key: str) -> Optional[ChatResult]:
+        value = self.memory.get(key)
+        if value is not None:
+            return self._hit("memory", value)
+        return self._from_disk(key, self.disk.entry(key) if self.disk is not None else None)
+
+    async def aget(self, key: str) -> Optional[ChatResult]:
+        """``get`` для event loop: память проверяется сразу, SQLite читается в потоке."""
+        value = self.memory.get(key)
+        if value is not None:
+            return self._hit("memory", value)
+        return self._from_disk(key, await asyncio.to_thread(self.disk.entry, key) if self.disk is not None else None)
+
+    def set(self, key: str, value: ChatResult, ttl: Optional[float] = None) -> None:
+        """``ttl`` на эту запись вместо настроенного; ``ttl <= 0`` — не кэшировать."""
+        if ttl is not None and ttl <= 0:
+            return
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl=ttl)
+        self._count("stores")
+
+    async def aset(self, key: str, value: ChatResult, ttl: Optional[float] = None) -> None:
+        """``set`` для event loop: запись в SQLite (``BEGIN IMMEDIATE`` ждёт другие воркеры) — в потоке."""
+        if ttl is not None and ttl <= 0:
+            return
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, ttl)
+        self._count("stores")
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            stats = self._stats.model_copy()
+        stats.evictions = self.memory.evictions
+        stats.memory_entries = len(self.memory)
+        return stats
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from .adapters.decoding import SSEDecoder
+from .pool import get_http_client
+from .providers import Provider
+from .shared import SharedState, get_shared_state
+
+
+class BackendCapabilities(BaseModel):
+    """Что умеет бэкенд; ``None`` — ещё не известно (пробуем и запоминаем результат)."""
+
+    response_format: Optional[bool] = None
+    # response_format с типом json_schema (vLLM, LM Studio, llama.cpp — да; старые серверы — только json_object)
+    json_schema: Optional[bool] = None
+    stream_usage: Optional[bool] = None
+    models: List[str] = []
+    probed_at: Optional[float] = None
+
+
+def _base(provider: Provider, base_url: str) -> str:
+    base = base_url.rstrip("/")
+    if Provider(provider) == Provider.OPENAI_COMPAT and base.endswith("/v1"):
+        base = base[:-3]
+    return base
+
+
+def _key(provider: Provider, base_url: str) -> str:
+    return f"{Provider(provider).value}|{_base(provider, base_url)}"
+
+
+class CapabilityRegistry:
+    """Возможности бэкендов на время жизни процесса; с ``path`` — ещё и в JSON-файле между запусками.
+
+    С ``shared`` (несколько воркеров) выученное одним воркером попадает в общий файл, а остальные
+    перечитывают его не чаще раза в ``refresh`` секунд. В event loop обмен с общим файлом идёт в потоке
+    ``SharedState`` без ожидания: до его окончания действует уже известное этому воркеру.
+    """
+
+    def __init__(self, path: Optional[str] = None, shared: Optional[SharedState] = None, refresh: float = 1.0) -> None:
+        self.path: Optional[str] = None
+        self.shared = shared
+        self.refresh = refresh
+        self._data: Dict[str, BackendCapabilities] = {}
+        self._lock = threading.Lock()
+        self._pulled = -math.inf
+        if path:
+            self.attach(path)
+
+    @classmethod
+    def from_env(cls) -> "CapabilityRegistry":
+        """GPTOSS_CAPABILITIES_PATH — файл для сохранения между перезапусками; GPTOSS_SHARED_STATE — общий с другими воркерами."""
+        return cls(path=os.getenv("GPTOSS_CAPABILITIES_PATH") or None, shared=get_shared_state())
+
+    def _pull(self) -> None:
+        now = time.monotonic()
+        if self.shared is None or now - self._pulled < self.refresh:
+            return
+        self._pulled = now
+        self.shared.defer(self.shared.capabilities).add_done_callback(self._pulled_done)
+
+    def _pulled_done(self, done: "Future[Dict[str, Dict[str, Any]]]") -> None:
+        if done.exception() is not None:
+            # общий файл недоступен: остаётся известное этому воркеру, попробуем на следующем круге
+            return
+        loaded = {k: BackendCapabilities.model_validate(v) for k, v in done.result().items()}
+        with self._lock:
+            self._data.update(loaded)
+
+    def _merged(self, key: str, done: "Future[Dict[str, Any]]") -> None:
+        if done.exception() is not None:
+            return
+        with self._lock:
+            self._data[key] = BackendCapabilities.model_validate(done.result())
+
+    def attach(self, path: str) -> None:
+        """Подключает файл: загружает сохранённое (без перезаписи уже известного) и дальше сохраняет изменения."""
+        path = os.path.expanduser(path)
+        loaded: Dict[str, BackendCapabilities] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                loaded = {k: BackendCapabilities.model_validate(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            self.path = path
+            for key, caps in loaded.items():
+                self._data.setdefault(key, caps)
+
+    def get(self, provider: Provider, base_url: str) -> BackendCapabilities:
+        self._pull()
+        with self._lock:
+            caps = self._data.get(_key(provider, base_url))
+            return caps.model_copy() if caps is not None else BackendCapabilities()
+
+    def update(self, provider: Provider, base_url: str, **fields: Any) -> None:
+        key = _key(provider, base_url)
+        with self._lock:
+            caps = self._data.get(key) or BackendCapabilities()
+            if all(getattr(caps, name) == value for name, value in fields.items()):
+                return
+            self._data[key] = caps.model_copy(update=fields)
+            snapshot = {k: v.model_dump() for k, v in self._data.items()} if self.path else None
+        if self.shared is not None:
+            # поверх того, что другие воркеры выучили с прошлого обновления
+            self.shared.defer(self.shared.merge_capabilities, key, fields).add_done_callback(partial(self._merged, key))
+        if snapshot is not None:
+            self._save(snapshot)
+
+    def learn(self, provider: Provider, base_url: str, **fields: Any) -> None:
+        """Как ``update``, но только для ещё неизвестных полей — дешёвый вызов на горячем пути."""
+        self._pull()
+        caps = self._data.get(_key(provider, base_url))
+        unknown = {k: v for k, v in fields.items() if caps is None or getattr(caps, k) is None}
+        if unknown:
+            self.update(provider, base_url, **unknown)
+
+    def forget(self, provider: Optional[Provider] = None, base_url: Optional[str] = None) -> None:
+        with self._lock:
+            if provider is None or base_url is None:
+                self._data.clear()
+            else:
+                self._data.pop(_key(provider, base_url), None)
+            snapshot = {k: v.model_dump() for k, v in self._data.items()} if self.path else None
+        if self.shared is not None:
+            self.shared.defer(self.shared.forget_capabilities, None if provider is None or base_url is None else _key(provider, base_url))
+        if snapshot is not None:
+            self._save(snapshot)
+
+    def snapshot(self) -> Dict[str, BackendCapabilities]:
+        self._pull()
+        with self._lock:
+            return {k: v.model_copy() for k, v in self._data.items()}
+
+    def _save(self, snapshot: Dict[str, Any]) -> None:
+        assert self.path is not None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError:
+            # кэш возможностей — оптимизация: ошибка записи не должна ронять запрос
+            pass
+
+
+CAPABILITIES = CapabilityRegistry.from_env()
+
+
+def probe(
+    provider: Provider,
+    base_url: str,
+    api_key: Optional[str] = None,
+    model: Optional[str] = None,
+    registry: Optional[CapabilityRegistry] = None,
+    timeout: float = 30.0,
+) -> BackendCapabilities:
+    """Явная проверка бэкенда: список моделей и минимальные запросы (1 токен) с ``response_format``
+    и ``stream_options.include_usage``. Результат записывается в реестр.
+    """
+    registry = registry or CAPABILITIES
+    provider = Provider(provider)
+    base = _base(provider, base_url)
+    client = get_http_client(provider, base_url, api_key)
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    if provider == Provider.OLLAMA:
+        resp = client.get(f"{base}/api/tags", timeout=timeout)
+        resp.raise_for_status()
+        models = [m.get("name", "") for m in resp.json().get("models", [])]
+        # у Ollama JSON-режим (format) и счётчики eval_count есть всегда
+        registry.update(provider, base_url, response_format=True, stream_usage=True, models=models, probed_at=time.time())
+        return registry.get(provider, base_url)
+
+    resp = client.get(f"{base}/v1/models", headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    models = [m.get("id", "") for m in resp.json().get("data", [])]
+    model = model or (models[0] if models else "default")
+    url = f"{base}/v1/chat/completions"
+    body: Dict[str, Any] = {"model": model, "messages": [{"role": "user", "content": "Reply with {}"}], "max_tokens": 1}
+
+    resp = client.post(url, headers=headers, json={**body, "response_format": {"type": "json_object"}}, timeout=timeout)
+    response_format = resp.status_code != 400
+    if response_format:
+        resp.raise_for_status()
+
+    stream_usage = False
+    stream_body = {**body, "stream": True, "stream_options": {"include_usage": True}}
+    try:
+        with client.stream("POST", url, headers=headers, json=stream_body, timeout=timeout) as sresp:
+            if sresp.status_code != 400:
+                sresp.raise_for_status()
+                decoder = SSEDecoder()
+                for chunk in sresp.iter_bytes():
+                    for event in decoder.feed(chunk):
+                        if isinstance(event, dict) and isinstance(event.get("usage"), dict):
+                            stream_usage = True
+    except httpx.HTTPError:
+        stream_usage = False
+
+    registry.update(
+        provider, base_url, response_format=response_format, stream_usage=stream_usage, models=models, probed_at=time.time()
+    )
+    return registry.get(provider, base_url)
@@ -1,15 +1,29 @@
 from __future__ import annotations
 import typer
-from rich.console import Console
-from rich.markdown import Markdown
-from typing import Optional
+from typing import Any, List, Optional
 
-from .client import LLMClient
-from .providers import Provider
-from .schema import GenerationParams
+from .providers import BalanceStrategy, Provider
+
+# Тяжёлые модули (httpx, pydantic, клиент, rich) импортируются внутри команд: короткие
+# скриптовые вызовы не платят за то, что им не нужно. Замеры — benchmarks/bench_import.py.
 
 app = typer.Typer(add_completion=False, no_args_is_help=True)
-console = Console()
+
+
+class _LazyConsole:
+    """rich.Console, создаваемая при первом выводе."""
+
+    _console: Any = None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._console is None:
+            from rich.console import Console
+
+            type(self)._console = Console()
+        return getattr(self._console, name)
+
+
+console: Any = _LazyConsole()
 
 
 @app.callback()
@@ -23,11 +37,168 @@ def serve(
     host: str = typer.Option("127.0.0.1", "--host"),
     port: int = typer.Option(8001, "--port"),
     reload: bool = typer.Option(False, "--reload"),
+    workers: int = typer.Option(1, "--workers", min=1, help="Число процессов-воркеров (общие лимиты, кэш, сессии и возможности бэкендов)"),
+    state_path: Optional[str] = typer.Option(
+        None, "--state-path", help="SQLite-файл общего состояния воркеров (по умолчанию — временный файл на время работы)"
+    ),
+    max_connections: Optional[int] = typer.Option(None, "--max-connections", help="Лимит соединений в пуле на бэкенд"),
+    max_keepalive: Optional[int] = typer.Option(None, "--max-keepalive", help="Лимит keep-alive соединений в пуле на бэкенд"),
+    http2: bool = typer.Option(False, "--http2", help="HTTP/2 к бэкендам (нужен пакет h2)"),
+    retries: Optional[int] = typer.Option(None, "--retries", help="Повторы при временных ошибках бэкенда (не для стримов)"),
+    hedge_ms: Optional[float] = typer.Option(None, "--hedge-ms", help="Дублировать запрос, если нет ответа/первого токена дольше N мс"),
+    max_concurrent: Optional[int] = typer.Option(None, "--max-concurrent", help="Admission control: генераций одновременно на бэкенд"),
+    queue_timeout: Optional[float] = typer.Option(None, "--queue-timeout", help="Admission control: максимум ожидания в очереди, секунд"),
+    warmup: Optional[List[str]] = typer.Option(
+        None, "--warmup", help="Прогреть модель при старте: [provider=]url[#model] или pool; повторите для нескольких"
+    ),
+    keepalive_interval: Optional[float] = typer.Option(None, "--keepalive-interval", help="Пинг прогретых моделей раз в N секунд (0 — выкл.)"),
+    connect_timeout: Optional[float] = typer.Option(None, "--connect-timeout", help="Таймаут подключения к бэкенду, секунд"),
+    first_token_timeout: Optional[float] = typer.Option(None, "--first-token-timeout", help="Ожидание первого токена (ответа), секунд"),
+    inter_token_timeout: Optional[float] = typer.Option(None, "--inter-token-timeout", help="Максимальная пауза между токенами стрима, секунд"),
 ):
     """Запуск REST-сервера (FastAPI) для интеграции (например, n8n)."""
+    import contextlib
+    import os
+    import tempfile
+    import uvicorn
+
+    if workers > 1 and reload:
+        raise typer.BadParameter("--reload works with a single worker only", param_hint="--workers")
+
+    # через переменные окружения, чтобы настройки пула дошли и до процесса с --reload
+    if max_connections is not None:
+        os.environ["GPTOSS_POOL_MAX_CONNECTIONS"] = str(max_connections)
+    if max_keepalive is not None:
+        os.environ["GPTOSS_POOL_MAX_KEEPALIVE"] = str(max_keepalive)
+    if http2:
+        os.environ["GPTOSS_HTTP2"] = "1"
+    if retries is not None:
+        os.environ["GPTOSS_RETRIES"] = str(retries)
+    if hedge_ms is not None:
+        os.environ["GPTOSS_HEDGE_DELAY_MS"] = str(hedge_ms)
+    if max_concurrent is not None:
+        os.environ["GPTOSS_MAX_CONCURRENT"] = str(max_concurrent)
+    if queue_timeout is not None:
+        os.environ["GPTOSS_QUEUE_TIMEOUT"] = str(queue_timeout)
+    if warmup:
+        os.environ["GPTOSS_WARMUP"] = ",".join(warmup)
+    if keepalive_interval is not None:
+        os.environ["GPTOSS_KEEPALIVE_INTERVAL"] = str(keepalive_interval)
+    if connect_timeout is not None:
+        os.environ["GPTOSS_CONNECT_TIMEOUT"] = str(connect_timeout)
+    if first_token_timeout is not None:
+        os.environ["GPTOSS_FIRST_TOKEN_TIMEOUT"] = str(first_token_timeout)
+    if inter_token_timeout is not None:
+        os.environ["GPTOSS_INTER_TOKEN_TIMEOUT"] = str(inter_token_timeout)
+
+    temporary: Optional[str] = None
+    if state_path is None and workers > 1:
+        fd, temporary = tempfile.mkstemp(prefix="gptoss-state-", suffix=".sqlite")
+        os.close(fd)
+        state_path = temporary
+    if state_path is not None:
+        # воркеры — отдельные процессы: путь передаётся через окружение, каждый открывает файл сам
+        os.environ["GPTOSS_SHARED_STATE"] = state_path
+    try:
+        uvicorn.run("gpt_oss_client.server:app", host=host, port=port, reload=reload, workers=workers)
+    finally:
+        if temporary is not None:
+            # рядом с файлом состояния — дисковый уровень кэша ответов (``ResponseCache.from_env``)
+            for base in (temporary, f"{temporary}.cache"):
+                for suffix in ("", "-wal", "-shm"):
+                    with contextlib.suppress(OSError):
+                        os.remove(base + suffix)
+
+
+@app.command()
+def mock(
+    host: str = typer.Option("127.0.0.1", "--host"),
+    port: int = typer.Option(9000, "--port"),
+    token_rate: float = typer.Option(200.0, "--token-rate", help="Токенов в секунду"),
+    first_token_delay: float = typer.Option(0.05, "--first-token-delay", help="Задержка первого токена, секунд"),
+    output_tokens: int = typer.Option(64, "--output-tokens", help="Длина ответа в токенах"),
+    trailing_tokens: int = typer.Option(0, "--trailing-tokens", help="Токенов «болтовни» после </final>"),
+):
+    """Локальный мок-бэкенд (OpenAI-совместимый /v1 и Ollama /api/chat) для тестов без GPU."""
     import uvicorn
+    from .mock_server import MockConfig, create_mock_app
 
-    uvicorn.run("gpt_oss_client.server:app", host=host, port=port, reload=reload)
+    cfg = MockConfig(
+        tokens_per_second=token_rate, first_token_delay=first_token_delay, output_tokens=output_tokens, trailing_tokens=trailing_tokens
+    )
+    uvicorn.run(create_mock_app(cfg), host=host, port=port)
+
+
+@app.command()
+def bench(
+    target: str = typer.Option("client", "--target", help="client | stream | server | server-stream"),
+    provider: Provider = typer.Option(Provider.OPENAI_COMPAT, "--provider", case_sensitive=False),
+    base_url: Optional[str] = typer.Option(None, "--base-url", help="Реальный бэкенд; по умолчанию поднимается мок"),
+    model: str = typer.Option("gpt-oss-20b", "--model"),
+    requests: int = typer.Option(200, "--requests", "-n"),
+    concurrency: int = typer.Option(16, "--concurrency", "-c"),
+    json_output: bool = typer.Option(False, "--json-output/--no-json-output"),
+    token_rate: float = typer.Option(200.0, "--token-rate", help="Мок: токенов в секунду"),
+    first_token_delay: float = typer.Option(0.05, "--first-token-delay", help="Мок: задержка первого токена, секунд"),
+    output_tokens: int = typer.Option(64, "--output-tokens", help="Мок: длина ответа в токенах"),
+    trailing_tokens: int = typer.Option(0, "--trailing-tokens", help="Мок: токенов «болтовни» после </final>"),
+    as_json: bool = typer.Option(False, "--json", help="Вывести отчёт JSON-строкой"),
+):
+    """Нагрузочный тест клиента, стриминга или REST-сервера: пропускная способность, p50/p95/p99, TTFT, CPU."""
+    from rich.table import Table
+    from .bench import BenchConfig, BenchTarget, run_bench
+    from .mock_server import MockConfig
+
+    try:
+        bench_target = BenchTarget(target)
+    except ValueError:
+        raise typer.BadParameter("ожидается client, stream, server или server-stream", param_hint="--target")
+    cfg = BenchConfig(
+        target=bench_target,
+        provider=provider,
+        base_url=base_url,
+        model=model,
+        requests=requests,
+        concurrency=concurrency,
+        json_output=json_output,
+        mock=MockConfig(
+            tokens_per_second=token_rate, first_token_delay=first_token_delay, output_tokens=output_tokens, trailing_tokens=trailing_tokens
+        ),
+    )
+    report = run_bench(cfg)
+    if as_json:
+        console.print_json(report.model_dump_json())
+        return
+    table = Table(title=f"gptoss bench: {report.target.value}")
+    table.add_column("Метрика")
+    table.add_column("Значение", justify="right")
+    for name, value in report.model_dump(exclude={"target"}).items():
+        if value is not None:
+            table.add_row(name, str(value))
+    console.print(table)
+
+
+@app.command()
+def probe(
+    provider: Provider = typer.Option(Provider.OPENAI_COMPAT, "--provider", case_sensitive=False),
+    base_url: str = typer.Option("http://localhost:1234/v1", "--base-url", help="Базовый URL API"),
+    model: Optional[str] = typer.Option(None, "--model", help="Модель для тестовых запросов; по умолчанию первая из списка"),
+    api_key: Optional[str] = typer.Option(None, "--api-key"),
+    capabilities_path: str = typer.Option("~/.cache/gptoss/capabilities.json", "--capabilities-path"),
+):
+    """Проверить возможности бэкенда (response_format, usage в стриме, модели) и сохранить результат."""
+    from rich.table import Table
+    from .capabilities import CAPABILITIES, probe as probe_backend
+
+    CAPABILITIES.attach(capabilities_path)
+    caps = probe_backend(provider, base_url, api_key=api_key, model=model)
+    table = Table(title=f"{provider.value} {base_url}")
+    table.add_column("Возможность")
+    table.add_column("Значение")
+    table.add_row("response_format", str(caps.response_format))
+    table.add_row("stream_usage", str(caps.stream_usage))
+    table.add_row("models", ", ".join(caps.models) or "-")
+    console.print(table)
 
 
 @app.command()
@@ -44,45 +215,221 @@ def chat(
     max_tokens: Optional[int] = typer.Option(None, "--max-tokens"),
     json_output: bool = typer.Option(False, "--json-output/--no-json-output"),
     strict_json: bool = typer.Option(False, "--strict-json/--no-strict-json"),
+    json_schema: Optional[str] = typer.Option(None, "--json-schema", help="JSON Schema ответа: путь к файлу или JSON-строка"),
+    cache: bool = typer.Option(False, "--cache/--no-cache", help="Кэшировать ответы (для детерминированных запросов)"),
+    cache_path: str = typer.Option("~/.cache/gptoss/responses.sqlite", "--cache-path", help="Файл SQLite для кэша ответов"),
+    cache_ttl: Optional[float] = typer.Option(None, "--cache-ttl", help="Время жизни записи кэша, секунд"),
+    backend: Optional[List[str]] = typer.Option(
+        None, "--backend", help="Реплика [provider=]url[#model]; повторите опцию для балансировки между несколькими"
+    ),
+    balance: BalanceStrategy = typer.Option(BalanceStrategy.LEAST_OUTSTANDING, "--balance", case_sensitive=False),
+    retries: int = typer.Option(0, "--retries", help="Повторы при временных ошибках бэкенда (не для стримов)"),
+    hedge_ms: Optional[float] = typer.Option(None, "--hedge-ms", help="Дублировать запрос, если нет ответа дольше N мс"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", help="Общий срок запроса, секунд"),
+    capabilities_path: str = typer.Option(
+        "~/.cache/gptoss/capabilities.json", "--capabilities-path", help="Файл с выученными возможностями бэкендов"
+    ),
+    use_daemon: bool = typer.Option(True, "--daemon/--no-daemon", help="Через `gptoss daemon`, если он запущен"),
+    daemon_socket: Optional[str] = typer.Option(None, "--daemon-socket", help="Unix-сокет демона"),
 ):
     if provider == Provider.OLLAMA and base_url.endswith("/v1"):
         base_url = base_url[:-3]
-
-    client = LLMClient(provider=provider, base_url=base_url, model=model, api_key=api_key)
-    gen = GenerationParams(
-        temperature=temperature,
-        top_p=top_p,
-        max_tokens=max_tokens,
-        json_output=json_output,
-        strict_json=strict_json,
+    gen_fields = dict(
+        temperature=temperature, top_p=top_p, max_tokens=max_tokens, json_output=json_output, strict_json=strict_json,
+        json_schema=_load_schema(json_schema), timeout=timeout,
     )
 
-    if stream:
-        console.rule("Стрим: рассуждения → финал")
+    # запущенный `gptoss daemon` отвечает быстрее: импорты прогреты, соединение с бэкендом уже открыто
+    if use_daemon and not (backend or cache or retries or hedge_ms):
+        from . import daemon as daemon_client
+
+        body = {
+            "op": "chat",
+            "message": message,
+            "provider": provider.value,
+            "base_url": base_url,
+            "model": model,
+            "api_key": api_key,
+            "gen": {k: v for k, v in gen_fields.items() if v is not None},
+            "stream": stream,
+        }
         try:
-            for channel, text in client.stream_chat(message, gen=gen):
-                if not text:
-                    continue
-                if channel == "reasoning":
-                    console.print(f"[dim]{text}[/dim]", end="")
+            events = daemon_client.request(body, daemon_socket)
+        except daemon_client.DaemonUnavailable:
+            pass
+        else:
+            try:
+                if stream:
+                    _print_stream((e["channel"], e["text"]) for e in events if "channel" in e)
                 else:
-                    console.print(f"[bold]{text}[/bold]", end="")
-            console.print()
-        except KeyboardInterrupt:
-            console.print("\n[red]Прервано пользователем[/red]")
+                    reply = next(events)
+                    _print_result(reply["reasoning"], reply["final"], reply["raw"] if show_raw else None)
+            except daemon_client.DaemonError as e:
+                console.print(f"[red]{e.error_type}: {e}[/red]")
+                raise typer.Exit(1)
+            return
+
+    from .balancer import Backend, BackendPool
+    from .cache import ResponseCache
+    from .capabilities import CAPABILITIES
+    from .client import LLMClient
+    from .retry import HedgePolicy, RetryPolicy
+    from .schema import GenerationParams
+
+    CAPABILITIES.attach(capabilities_path)
+    response_cache = ResponseCache(path=cache_path, ttl=cache_ttl) if cache else None
+    policies = {
+        "retry": RetryPolicy(max_attempts=retries + 1) if retries > 0 else None,
+        "hedge": HedgePolicy(delay=hedge_ms / 1000.0) if hedge_ms else None,
+    }
+    if backend:
+        # --api-key — общий ключ для реплик, у которых нет своего
+        backends = [Backend.parse(spec) for spec in backend]
+        pool = BackendPool([b.model_copy(update={"api_key": b.api_key or api_key}) for b in backends], strategy=balance)
+        client = LLMClient.from_pool(pool, model=model, cache=response_cache, **policies)
+    else:
+        client = LLMClient(provider=provider, base_url=base_url, model=model, api_key=api_key, cache=response_cache, **policies)
+    gen = GenerationParams(**gen_fields)
+
+    if stream:
+        _print_stream(client.stream_chat(message, gen=gen))
         return
 
     result = client.chat(message, gen=gen)
+    _print_result(result.reasoning, result.final_answer, result.raw if show_raw else None)
+
+
+def _load_schema(value: Optional[str]) -> Optional[Any]:
+    """--json-schema: JSON-строка или путь к файлу со схемой."""
+    if not value:
+        return None
+    import json
+
+    try:
+        if value.lstrip().startswith("{"):
+            return json.loads(value)
+        with open(value, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise typer.BadParameter(str(e), param_hint="--json-schema")
+
+
+def _print_stream(events: Any) -> None:
+    console.rule("Стрим: рассуждения → финал")
+    try:
+        for channel, text in events:
+            if not text:
+                continue
+            if channel == "reasoning":
+                console.print(f"[dim]{text}[/dim]", end="")
+            else:
+                console.print(f"[bold]{text}[/bold]", end="")
+        console.print()
+    except KeyboardInterrupt:
+        console.print("\n[red]Прервано пользователем[/red]")
+
+
+def _print_result(reasoning: Optional[str], final: Optional[str], raw: Any) -> None:
+    if reasoning:
+        from rich.markdown import Markdown
 
-    if result.reasoning:
         console.rule("Рассуждения")
-        console.print(Markdown(result.reasoning))
+        console.print(Markdown(reasoning))
     console.rule("Финальный ответ")
-    console.print(result.final_answer or "(пусто)")
+    console.print(final or "(пусто)")
 
-    if show_raw and result.raw is not None:
+    if raw is not None:
         console.rule("Raw JSON")
-        console.print_json(data=result.raw)
+        console.print_json(data=raw)
+
+
+@app.command()
+def daemon(
+    socket_file: Optional[str] = typer.Option(None, "--socket", help="Unix-сокет (по умолчанию GPTOSS_DAEMON_SOCKET или ~/.cache/gptoss/daemon.sock)"),
+    stop: bool = typer.Option(False, "--stop", help="Остановить запущенного демона"),
+):
+    """Тёплый фоновый процесс с пулом соединений; `gptoss chat` использует его автоматически, если он запущен."""
+    import os
+    from . import daemon as daemon_server
+
+    path = daemon_server.socket_path(socket_file)
+    if stop:
+        try:
+            list(daemon_server.request({"op": "shutdown"}, path))
+        except daemon_server.DaemonUnavailable:
+            console.print(f"Демон не запущен ({path})")
+            raise typer.Exit(1)
+        console.print("Демон остановлен")
+        return
+    try:
+        console.print(f"gptoss daemon: {path} (pid {os.getpid()})")
+        daemon_server.serve(path)
+    except RuntimeError as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(1)
+    except KeyboardInterrupt:
+        pass
+
+
+@app.command()
+def batch(
+    input_path: str = typer.Option(..., "--input", "-i", help="JSONL: строка промпта или объект {\"prompt\": ..., \"id\": ...}"),
+    output_path: str = typer.Option(..., "--output", "-o", help="JSONL с результатами (index, id, reasoning, final, parsed | error)"),
+    concurrency: int = typer.Option(8, "--concurrency", "-c", help="Одновременных запросов"),
+    provider: Provider = typer.Option(Provider.OPENAI_COMPAT, "--provider", case_sensitive=False),
+    base_url: str = typer.Option("http://localhost:1234/v1", "--base-url", help="Базовый URL API"),
+    model: str = typer.Option("gpt-oss-20b", "--model", help="Имя модели"),
+    api_key: Optional[str] = typer.Option(None, "--api-key", help="API ключ для OpenAI-совместимого сервера"),
+    system_prompt: Optional[str] = typer.Option(None, "--system", help="Системный промпт для всех запросов"),
+    temperature: Optional[float] = typer.Option(None, "--temperature", min=0.0, max=2.0),
+    top_p: Optional[float] = typer.Option(None, "--top-p", min=0.0, max=1.0),
+    max_tokens: Optional[int] = typer.Option(None, "--max-tokens"),
+    json_output: bool = typer.Option(False, "--json-output/--no-json-output"),
+    strict_json: bool = typer.Option(False, "--strict-json/--no-strict-json"),
+    json_schema: Optional[str] = typer.Option(None, "--json-schema", help="JSON Schema ответа: путь к файлу или JSON-строка"),
+    backend: Optional[List[str]] = typer.Option(None, "--backend", help="Реплика [provider=]url[#model]; можно несколько"),
+    balance: BalanceStrategy = typer.Option(BalanceStrategy.LEAST_OUTSTANDING, "--balance", case_sensitive=False),
+    retries: int = typer.Option(2, "--retries", help="Повторы при временных ошибках бэкенда"),
+    resume: bool = typer.Option(True, "--resume/--restart", help="Продолжить прерванный прогон по чекпойнту"),
+    capabilities_path: str = typer.Option(
+        "~/.cache/gptoss/capabilities.json", "--capabilities-path", help="Файл с выученными возможностями бэкендов"
+    ),
+):
+    """Пакетный прогон JSONL-файла: ленивое чтение, параллельные запросы, запись по мере готовности и чекпойнт."""
+    from .balancer import Backend, BackendPool
+    from .batch import checkpoint_path, run_batch
+    from .capabilities import CAPABILITIES
+    from .client import LLMClient
+    from .retry import RetryPolicy
+    from .schema import GenerationParams
+
+    if provider == Provider.OLLAMA and base_url.endswith("/v1"):
+        base_url = base_url[:-3]
+    CAPABILITIES.attach(capabilities_path)
+    retry = RetryPolicy(max_attempts=retries + 1) if retries > 0 else None
+    if backend:
+        backends = [Backend.parse(spec) for spec in backend]
+        pool = BackendPool([b.model_copy(update={"api_key": b.api_key or api_key}) for b in backends], strategy=balance)
+        client = LLMClient.from_pool(pool, model=model, retry=retry)
+    else:
+        client = LLMClient(provider=provider, base_url=base_url, model=model, api_key=api_key, retry=retry)
+    gen = GenerationParams(
+        temperature=temperature, top_p=top_p, max_tokens=max_tokens, json_output=json_output, strict_json=strict_json,
+        json_schema=_load_schema(json_schema),
+    )
+
+    try:
+        stats = run_batch(
+            client, input_path, output_path, concurrency=concurrency, system_prompt=system_prompt, gen=gen, resume=resume
+        )
+    except KeyboardInterrupt:
+        console.print(f"\n[red]Прервано[/red]; прогресс сохранён в {checkpoint_path(output_path)}, повторный запуск продолжит")
+        raise typer.Exit(130)
+    except ValueError as e:
+        raise typer.BadParameter(str(e), param_hint="--output")
+    console.print(
+        f"Готово: {stats.ok} ok, {stats.errors} ошибок, {stats.skipped} пропущено (уже готовы) за {stats.elapsed:.1f} с"
+    )
 
 
 if __name__ == "__main__":
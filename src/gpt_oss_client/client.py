@@ -1,60 +1,166 @@
 from __future__ import annotations
-from typing import Optional, List, Iterable, Tuple
+import asyncio
+import time
+import httpx
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, Iterator, Optional, List, Iterable, Sequence, Set, Tuple
 
+from .balancer import BackendNode, BackendPool
+from .cache import ResponseCache, cache_key
+from .coalesce import acoalesce_call, acoalesce_stream, coalesce_call, coalesce_stream
+from .retry import HedgePolicy, RetryPolicy
+from .metrics import EARLY_STOPS, TOKENS_SAVED, RequestObserver, usage_tokens
 from .providers import Provider
-from .schema import ChatResult, Message, GenerationParams
-from .harmony import build_system_instruction, build_json_system_instruction, parse_structured_output, parse_json_strict
-from .adapters.openai_compat import OpenAICompatAdapter
-from .adapters.ollama import OllamaAdapter
+from .schema import FINAL_STOP, BatchItem, ChatResult, Message, GenerationParams, Usage
+from .sessions import Session
+from .structured import SchemaStreamParser, compile_schema, split_json
+from .timeouts import CANCELLED, DeadlineExceeded, Timeouts, anext_within, deadline_after, remaining
+from .tracing import ClientHook, RequestTrace
+from .warmup import awarmup_target, warmup_target
+from .harmony import build_system_instruction, build_json_system_instruction, build_schema_system_instruction, parse_structured_output, parse_json_strict, HarmonyStreamParser
+from .adapters.openai_compat import OpenAICompatAdapter, AsyncOpenAICompatAdapter
+from .adapters.ollama import OllamaAdapter, AsyncOllamaAdapter
 
 
-class LLMClient:
+class _BaseLLMClient:
+    _adapter_classes: Dict[Provider, Any] = {}
+
     def __init__(
         self,
         provider: Provider,
         base_url: str,
         model: str,
         api_key: Optional[str] = None,
-        request_timeout: float = 90.0,
+        request_timeout: Optional[float] = None,
         default_gen: Optional[GenerationParams] = None,
+        http_client: Optional[Any] = None,
+        cache: Optional[ResponseCache] = None,
+        pool: Optional[BackendPool] = None,
+        retry: Optional[RetryPolicy] = None,
+        hedge: Optional[HedgePolicy] = None,
+        timeouts: Optional[Timeouts] = None,
+        hooks: Optional[Sequence[ClientHook]] = None,
     ) -> None:
-        self.provider = provider
+        """``timeouts`` — подключение, первый токен и пауза между токенами; ``request_timeout`` (устаревший)
+        задаёт только ожидание первого токена (ответа). ``hooks`` получают фазы каждого вызова (``ClientHook``)."""
+        self.provider = Provider(provider)
         self.base_url = base_url
         self.model = model
         self.api_key = api_key
-        self.request_timeout = request_timeout
+        if timeouts is None:
+            timeouts = Timeouts() if request_timeout is None else Timeouts(first_token=request_timeout)
+        self.timeouts = timeouts
+        self.request_timeout = timeouts.first_token
         self.default_gen = default_gen or GenerationParams()
+        self.cache = cache
+        self.pool = pool
+        self.retry = retry
+        self.hedge = hedge
+        self.hooks: List[ClientHook] = list(hooks or [])
+        self._adapter = self._make_adapter(self.provider, base_url, api_key, http_client)
+        self._node_adapters: Dict[str, Any] = {}
+
+    @classmethod
+    def from_pool(cls, pool: BackendPool, model: str, **kwargs: Any):
+        """Клиент поверх пула реплик: балансировка и failover между ними при каждом запросе."""
+        primary = pool.primary
+        return cls(provider=primary.provider, base_url=primary.base_url, model=model, api_key=primary.api_key, pool=pool, **kwargs)
+
+    def _make_adapter(self, provider: Provider, base_url: str, api_key: Optional[str], http_client: Optional[Any] = None) -> Any:
         if provider == Provider.OPENAI_COMPAT:
-            self._adapter = OpenAICompatAdapter(base_url=base_url, api_key=api_key, timeout=request_timeout)
-        elif provider == Provider.OLLAMA:
-            self._adapter = OllamaAdapter(base_url=base_url, timeout=request_timeout)
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
+            return self._adapter_classes[provider](
+                base_url=base_url, api_key=api_key, timeout=self.request_timeout, http_client=http_client, timeouts=self.timeouts
+            )
+        if provider == Provider.OLLAMA:
+            return self._adapter_classes[provider](base_url=base_url, timeout=self.request_timeout, http_client=http_client, timeouts=self.timeouts)
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    def _node_adapter(self, node: BackendNode) -> Any:
+        adapter = self._node_adapters.get(node.backend.key)
+        if adapter is None:
+            backend = node.backend
+            adapter = self._node_adapters.setdefault(backend.key, self._make_adapter(backend.provider, backend.base_url, backend.api_key))
+        return adapter
+
+    def _trace(self, kind: str) -> RequestTrace:
+        return RequestTrace(kind, self.provider.value, self.base_url, self.model, self.hooks)
+
+    def _warmup_targets(self) -> List[Tuple[Any, str]]:
+        """(адаптер, модель) для каждого бэкенда клиента: единственного или всех реплик пула."""
+        if self.pool is None:
+            return [(self._adapter, self.model)]
+        return [(self._node_adapter(node), node.backend.model or self.model) for node in self.pool.nodes]
 
     def _merge_gen(self, gen: Optional[GenerationParams]) -> GenerationParams:
-        if gen is None:
-            return self.default_gen
+        # всегда копия: вызывающий код дописывает параметры хода (json_output, keep_alive сессии)
         merged = self.default_gen.model_copy(deep=True)
-        for field in ["temperature", "top_p", "max_tokens", "json_output", "strict_json"]:
+        if gen is None:
+            return merged
+        for field in ["temperature", "top_p", "max_tokens", "json_output", "strict_json", "keep_alive", "stop", "json_schema", "timeout"]:
             value = getattr(gen, field)
             if value is not None and field not in ("json_output", "strict_json"):
                 setattr(merged, field, value)
             if field in ("json_output", "strict_json") and value is True:
                 setattr(merged, field, True)
+        if gen.early_stop is not None:
+            merged.early_stop = gen.early_stop
         return merged
 
-    def chat(self, user_prompt: str, system_prompt: Optional[str] = None, gen: Optional[GenerationParams] = None) -> ChatResult:
-        gen_params = self._merge_gen(gen)
-        system = system_prompt or (build_json_system_instruction() if gen_params.json_output else build_system_instruction())
-        messages: List[Message] = [
+    @staticmethod
+    def _system_instruction(gen_params: GenerationParams) -> str:
+        if gen_params.json_schema is not None:
+            return build_schema_system_instruction(gen_params.json_schema)
+        return build_json_system_instruction() if gen_params.json_output else build_system_instruction()
+
+    def _build_messages(self, user_prompt: str, system_prompt: Optional[str], gen_params: GenerationParams) -> List[Message]:
+        system = system_prompt or self._system_instruction(gen_params)
+        return [
             Message(role="system", content=system),
             Message(role="user", content=user_prompt),
         ]
-        response_json = self._adapter.chat(model=self.model, messages=messages, gen=gen_params)
-        if self.provider == Provider.OPENAI_COMPAT:
+
+    def _session_turn(self, session: Session, user_prompt: str, gen: Optional[GenerationParams]) -> Tuple[List[Message], GenerationParams]:
+        gen_params = self._merge_gen(gen)
+        if session.json_output:
+            gen_params.json_output = True
+        if gen_params.keep_alive is None:
+            gen_params.keep_alive = session.keep_alive
+        system = session.system_prompt or self._system_instruction(gen_params)
+        return session.build_messages(system, user_prompt, reserve_tokens=gen_params.max_tokens or 0), gen_params
+
+    def _request_key(self, messages: List[Message], gen_params: GenerationParams) -> str:
+        return cache_key(self.provider, self.base_url, self.model, messages, gen_params)
+
+    def _cache_key(self, messages: List[Message], gen_params: GenerationParams, use_cache: bool) -> Optional[str]:
+        if self.cache is None or not use_cache:
+            return None
+        return self._request_key(messages, gen_params)
+
+    def _to_result(
+        self,
+        response_json: Dict[str, Any],
+        gen_params: GenerationParams,
+        observer: Optional[RequestObserver] = None,
+        provider: Optional[Provider] = None,
+        trace: Optional[RequestTrace] = None,
+        final_stop: bool = False,
+    ) -> ChatResult:
+        started = time.perf_counter()
+        if (provider or self.provider) == Provider.OPENAI_COMPAT:
             raw_text = OpenAICompatAdapter.extract_text(response_json)
         else:
             raw_text = OllamaAdapter.extract_text(response_json)
+        if gen_params.json_schema is not None:
+            # схема: ответ — JSON-значение; текст до него (если бэкенд не ограничил формат) — рассуждение
+            schema = compile_schema(gen_params.json_schema)
+            reasoning, final = split_json(raw_text, schema.openers)
+            parsed = schema.parse(final)
+            elapsed = time.perf_counter() - started
+            if observer is not None:
+                observer.parsed(elapsed)
+            if trace is not None:
+                trace.parsed(elapsed)
+            return ChatResult(reasoning=reasoning, final_answer=final, parsed=parsed, raw=response_json, usage=Usage.from_response(response_json))
         if gen_params.json_output and gen_params.strict_json:
             reasoning, final = parse_json_strict(raw_text)
             if final is None:
@@ -62,44 +168,576 @@ class LLMClient:
                 reasoning, final = parse_structured_output(raw_text)
         else:
             reasoning, final = parse_structured_output(raw_text)
-        return ChatResult(reasoning=reasoning, final_answer=final, raw=response_json)
+        elapsed = time.perf_counter() - started
+        if trace is not None:
+            trace.parsed(elapsed)
+        if observer is not None:
+            observer.parsed(elapsed)
+            if final_stop and _stopped_on_final(response_json, raw_text):
+                generated = usage_tokens(response_json, 0.0)[0]
+                observer.early_stop("stop_sequence", _tokens_saved(gen_params, generated))
+        return ChatResult(reasoning=reasoning, final_answer=final, raw=response_json, usage=Usage.from_response(response_json))
+
+    def _record_early_stop(self, reason: str, gen_params: GenerationParams, chunks: int, trace: RequestTrace) -> None:
+        # число чанков стрима ≈ число токенов у OpenAI-совместимых серверов и Ollama
+        saved = _tokens_saved(gen_params, chunks)
+        # метки — реплика пула, которая отвечала
+        labels = trace.backend or (self.provider.value, self._adapter.base_url, self.model)
+        EARLY_STOPS.labels(*labels, reason).inc()
+        if saved:
+            TOKENS_SAVED.labels(*labels).inc(saved)
+
+    @staticmethod
+    def _stream_parser(gen_params: GenerationParams) -> Any:
+        if gen_params.json_schema is not None:
+            return SchemaStreamParser(compile_schema(gen_params.json_schema))
+        return HarmonyStreamParser()
+
+    @staticmethod
+    def _end_stream(trace: RequestTrace, parser: Any, last: Optional[float], parse_time: float, error: Optional[BaseException]) -> None:
+        """Итог стрима: usage и timings доступны в ``parser.usage``/``parser.timings``."""
+        if last is not None:
+            trace.mark("last_token", last)
+        if parse_time:
+            trace.parsed(parse_time)
+        parser.usage = trace.usage
+        parser.timings = trace.end(error)
+
+
+def _finished(result: ChatResult, trace: RequestTrace) -> ChatResult:
+    if result.usage is None:
+        result.usage = trace.usage
+    else:
+        trace.usage = result.usage
+    result.timings = trace.end()
+    return result
+
+
+def _with_parsed(result: ChatResult, gen_params: GenerationParams) -> ChatResult:
+    """Дисковый кэш хранит ``parsed`` как JSON: экземпляр pydantic-модели восстанавливается при чтении."""
+    if gen_params.json_schema is None or result.parsed is None:
+        return result
+    model = compile_schema(gen_params.json_schema).model
+    if model is None or isinstance(result.parsed, model):
+        return result
+    return result.model_copy(update={"parsed": model.model_validate(result.parsed)})
+
+
+def _tokens_saved(gen_params: GenerationParams, generated: Optional[int]) -> Optional[int]:
+    if gen_params.max_tokens is None or generated is None:
+        return None
+    return max(gen_params.max_tokens - generated, 0)
+
+
+def _stopped_on_final(response_json: Dict[str, Any], raw_text: str) -> bool:
+    """Генерация остановлена стоп-последовательностью </final>: final открыт, не закрыт, причина — stop."""
+    if "<final>" not in raw_text or FINAL_STOP in raw_text:
+        return False
+    try:
+        reason = response_json["choices"][0].get("finish_reason")
+    except (KeyError, IndexError, TypeError, AttributeError):
+        reason = response_json.get("done_reason") if isinstance(response_json, dict) else None
+    return reason == "stop"
+
+
+class LLMClient(_BaseLLMClient):
+    _adapter_classes = {
+        Provider.OPENAI_COMPAT: OpenAICompatAdapter,
+        Provider.OLLAMA: OllamaAdapter,
+    }
+
+    def chat(
+        self,
+        user_prompt: str,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+        use_cache: bool = True,
+        cache_ttl: Optional[float] = None,
+        coalesce: bool = False,
+    ) -> ChatResult:
+        """``coalesce=True`` — одинаковые одновременные запросы разделяют один вызов бэкенда."""
+        trace = self._trace("chat")
+        try:
+            gen_params = self._merge_gen(gen)
+            messages = self._build_messages(user_prompt, system_prompt, gen_params)
+            trace.mark("build")
+            result = self._chat_messages(messages, gen_params, trace, use_cache, cache_ttl, coalesce)
+        except BaseException as e:
+            trace.end(e)
+            raise
+        return _finished(result, trace)
+
+    def chat_session(self, session: Session, user_prompt: str, gen: Optional[GenerationParams] = None) -> ChatResult:
+        """Очередной ход диалога: история из сессии, ответ добавляется в неё. Один ход на сессию за раз."""
+        trace = self._trace("chat")
+        try:
+            messages, gen_params = self._session_turn(session, user_prompt, gen)
+            trace.mark("build")
+            result = self._chat_messages(messages, gen_params, trace, use_cache=False)
+        except BaseException as e:
+            trace.end(e)
+            raise
+        session.record(user_prompt, result)
+        return _finished(result, trace)
+
+    def warmup(self, keep_alive: Optional[str] = "30m", timeout: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """Загружает модель на бэкенде (на всех репликах пула) до первого запроса, чтобы он не ждал загрузки весов.
+
+        Ollama — пустой /api/chat с ``keep_alive``, OpenAI-совместимые серверы — completion на 1 токен.
+        Возвращает время прогрева по бэкендам (None — бэкенд недоступен).
+        """
+        return {
+            f"{adapter.provider.value}|{adapter.base_url}#{model}": warmup_target(adapter, model, keep_alive, timeout=timeout)
+            for adapter, model in self._warmup_targets()
+        }
+
+    def _chat_messages(
+        self,
+        messages: List[Message],
+        gen_params: GenerationParams,
+        trace: RequestTrace,
+        use_cache: bool = True,
+        cache_ttl: Optional[float] = None,
+        coalesce: bool = False,
+    ) -> ChatResult:
+        key = self._cache_key(messages, gen_params, use_cache)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                trace.cache_hit()
+                return _with_parsed(cached, gen_params)
+        if coalesce:
+            result, shared = coalesce_call(self._request_key(messages, gen_params), lambda: self._complete(messages, gen_params, trace))
+            if shared:
+                return result.model_copy()
+        else:
+            result = self._complete(messages, gen_params, trace)
+        if key is not None:
+            # копия: вызывающий код и _finished меняют результат (usage, timings, parsed)
+            self.cache.set(key, result.model_copy(deep=True), ttl=cache_ttl)
+        return result
+
+    def _chat_on(
+        self, provider: Provider, adapter: Any, model: str, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace
+    ) -> ChatResult:
+        trace.count("attempt", base_url=adapter.base_url)
+        with RequestObserver(provider.value, adapter.base_url, model, "chat") as observer:
+            response_json = adapter.chat(model=model, messages=messages, gen=gen_params, trace=trace)
+            trace.mark("last_token")
+            observer.usage(response_json)
+            return self._to_result(response_json, gen_params, observer, provider, trace, gen_params.stops_on_final(messages))
+
+    def _complete(self, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace) -> ChatResult:
+        deadline = deadline_after(gen_params.timeout)
+
+        def once() -> ChatResult:
+            # каждая попытка получает остаток общего срока, а не весь срок заново
+            params = gen_params if deadline is None else gen_params.model_copy(update={"timeout": remaining(deadline)})
+            if self.hedge is not None:
+                return self.hedge.call(lambda: self._complete_once(messages, params, trace))
+            return self._complete_once(messages, params, trace)
+
+        return self.retry.call(once) if self.retry is not None else once()
+
+    def _complete_once(self, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace) -> ChatResult:
+        if self.pool is None:
+            return self._chat_on(self.provider, self._adapter, self.model, messages, gen_params, trace)
+        return self.pool.call(
+            lambda node: self._chat_on(node.backend.provider, self._node_adapter(node), node.backend.model or self.model, messages, gen_params, trace)
+        )
+
+    def _stream_on(
+        self, provider: Provider, adapter: Any, model: str, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace
+    ) -> Iterator[str]:
+        trace.count("attempt", base_url=adapter.base_url)
+        trace.backend = (provider.value, adapter.base_url, model)
+        with RequestObserver(provider.value, adapter.base_url, model, "stream") as observer:
+            for chunk in adapter.stream_chat(model=model, messages=messages, gen=gen_params, trace=trace):
+                observer.first_token()
+                yield chunk
+
+    def _stream_chunks(self, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace) -> Iterator[str]:
+        if self.pool is None:
+            return self._stream_on(self.provider, self._adapter, self.model, messages, gen_params, trace)
+        return self.pool.stream(
+            lambda node: self._stream_on(node.backend.provider, self._node_adapter(node), node.backend.model or self.model, messages, gen_params, trace)
+        )
 
-    def stream_chat(self, user_prompt: str, system_prompt: Optional[str] = None, gen: Optional[GenerationParams] = None) -> Iterable[Tuple[str, str]]:
+    def _batch_item(self, index: int, user_prompt: str, system_prompt: Optional[str], gen: Optional[GenerationParams]) -> BatchItem:
+        try:
+            return BatchItem(index=index, result=self.chat(user_prompt, system_prompt=system_prompt, gen=gen))
+        except Exception as e:
+            return BatchItem(index=index, error=str(e))
+
+    def iter_chat_many(
+        self,
+        prompts: Iterable[str],
+        concurrency: int = 8,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+    ) -> Iterator[BatchItem]:
+        """Выполняет запросы параллельно и отдаёт результаты по мере готовности (не по порядку).
+
+        Входные данные читаются лениво: в работе одновременно не больше ``2 * concurrency`` запросов.
+        """
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending: Set[Future] = set()
+            for index, prompt in enumerate(prompts):
+                pending.add(executor.submit(self._batch_item, index, prompt, system_prompt, gen))
+                if len(pending) >= 2 * concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+    def chat_many(
+        self,
+        prompts: Iterable[str],
+        concurrency: int = 8,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+    ) -> List[BatchItem]:
+        """Параллельный чат по списку промптов; ошибки хранятся по элементам, порядок — как во входе."""
+        items = list(self.iter_chat_many(prompts, concurrency=concurrency, system_prompt=system_prompt, gen=gen))
+        return sorted(items, key=lambda item: item.index)
+
+    def stream_chat(
+        self,
+        user_prompt: str,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+        parser: Optional[HarmonyStreamParser] = None,
+        coalesce: bool = False,
+    ) -> Iterable[Tuple[str, str]]:
+        """Стрим событий (channel, text); итоговое разбиение после стрима — ``parser.result()``.
+
+        ``coalesce=True`` — одинаковые одновременные стримы читают один upstream; подключившийся позже
+        сначала получает уже накопленные чанки, затем продолжает вживую. После стрима usage и фазы
+        запроса — в ``parser.usage`` и ``parser.timings``.
+        """
+        trace = self._trace("stream")
         gen_params = self._merge_gen(gen)
-        system = system_prompt or (build_json_system_instruction() if gen_params.json_output else build_system_instruction())
-        messages: List[Message] = [
-            Message(role="system", content=system),
-            Message(role="user", content=user_prompt),
-        ]
-        if self.provider == Provider.OPENAI_COMPAT:
-            stream = self._adapter.stream_chat(model=self.model, messages=messages, gen=gen_params)
+        messages = self._build_messages(user_prompt, system_prompt, gen_params)
+        parser = parser or self._stream_parser(gen_params)
+        trace.mark("build")
+        if coalesce:
+            chunks = coalesce_stream(self._request_key(messages, gen_params), lambda: self._stream_chunks(messages, gen_params, trace))
         else:
-            stream = self._adapter.stream_chat(model=self.model, messages=messages, gen=gen_params)
-
-        current_channel: str = "reasoning"
-        buffer: str = ""
-        for chunk in stream:
-            buffer += chunk
-            while True:
-                start_idx = buffer.lower().find("<final>")
-                end_idx = buffer.lower().find("</final>")
-                if current_channel == "reasoning" and start_idx != -1:
-                    pre = buffer[:start_idx]
-                    if pre:
-                        yield ("reasoning", pre)
-                    buffer = buffer[start_idx + len("<final>") :]
-                    current_channel = "final"
-                    continue
-                if current_channel == "final" and end_idx != -1:
-                    pre = buffer[:end_idx]
-                    if pre:
-                        yield ("final", pre)
-                    buffer = buffer[end_idx + len("</final>") :]
-                    current_channel = "final"
+            chunks = self._stream_chunks(messages, gen_params, trace)
+        received = 0
+        deadline = deadline_after(gen_params.timeout)
+        last: Optional[float] = None
+        parse_time = 0.0
+        error: Optional[BaseException] = None
+        try:
+            try:
+                for chunk in chunks:
+                    received += 1
+                    if deadline is not None:
+                        # чтение из сокета ограничено остатком срока при старте запроса; здесь — проверка между чанками
+                        remaining(deadline)
+                    now = time.perf_counter()
+                    if last is None:
+                        trace.mark("first_token", now)
+                    last = now
+                    events = parser.feed(chunk)
+                    parse_time += time.perf_counter() - now
+                    if events and trace.watching:
+                        trace.channels(events)
+                    yield from events
+                    if gen_params.closes_stream(parser.finished, messages):
+                        # финальный ответ завершён: закрываем соединение, чтобы бэкенд прекратил генерацию
+                        self._record_early_stop(parser.finished, gen_params, received, trace)
+                        break
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+            yield from parser.close()
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._end_stream(trace, parser, last, parse_time, error)
+
+
+class AsyncLLMClient(_BaseLLMClient):
+    """Асинхронный клиент: те же параметры и результат, что у LLMClient, но на httpx.AsyncClient."""
+
+    _adapter_classes = {
+        Provider.OPENAI_COMPAT: AsyncOpenAICompatAdapter,
+        Provider.OLLAMA: AsyncOllamaAdapter,
+    }
+
+    def __init__(self, *args: Any, admission: Optional[Callable[[], AsyncContextManager[Any]]] = None, **kwargs: Any) -> None:
+        """``admission`` — фабрика контекстных менеджеров, которые держат слот на время запроса к бэкенду
+        (например, ``lambda: controller.slot(...)`` сервера); объединённые запросы слот не занимают."""
+        super().__init__(*args, **kwargs)
+        self.admission = admission
+
+    async def chat(
+        self,
+        user_prompt: str,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+        use_cache: bool = True,
+        cache_ttl: Optional[float] = None,
+        coalesce: bool = False,
+    ) -> ChatResult:
+        trace = self._trace("chat")
+        try:
+            gen_params = self._merge_gen(gen)
+            messages = self._build_messages(user_prompt, system_prompt, gen_params)
+            trace.mark("build")
+            result = await self._chat_messages(messages, gen_params, trace, use_cache, cache_ttl, coalesce)
+        except BaseException as e:
+            trace.end(e)
+            raise
+        return _finished(result, trace)
+
+    async def chat_session(self, session: Session, user_prompt: str, gen: Optional[GenerationParams] = None) -> ChatResult:
+        trace = self._trace("chat")
+        try:
+            messages, gen_params = self._session_turn(session, user_prompt, gen)
+            trace.mark("build")
+            result = await self._chat_messages(messages, gen_params, trace, use_cache=False)
+        except BaseException as e:
+            trace.end(e)
+            raise
+        session.record(user_prompt, result)
+        return _finished(result, trace)
+
+    async def warmup(self, keep_alive: Optional[str] = "30m", timeout: Optional[float] = None) -> Dict[str, Optional[float]]:
+        """Параллельный прогрев модели на всех бэкендах клиента (см. ``LLMClient.warmup``)."""
+        targets = self._warmup_targets()
+        results = await asyncio.gather(*(awarmup_target(adapter, model, keep_alive, timeout=timeout) for adapter, model in targets))
+        return {f"{adapter.provider.value}|{adapter.base_url}#{model}": r for (adapter, model), r in zip(targets, results)}
+
+    async def _chat_messages(
+        self,
+        messages: List[Message],
+        gen_params: GenerationParams,
+        trace: RequestTrace,
+        use_cache: bool = True,
+        cache_ttl: Optional[float] = None,
+        coalesce: bool = False,
+    ) -> ChatResult:
+        key = self._cache_key(messages, gen_params, use_cache)
+        if key is not None:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                trace.cache_hit()
+                return _with_parsed(cached, gen_params)
+        if coalesce:
+            result, shared = await acoalesce_call(self._request_key(messages, gen_params), lambda: self._complete(messages, gen_params, trace))
+            if shared:
+                return result.model_copy()
+        else:
+            result = await self._complete(messages, gen_params, trace)
+        if key is not None:
+            # копия: вызывающий код и _finished меняют результат (usage, timings, parsed)
+            await self.cache.aset(key, result.model_copy(deep=True), ttl=cache_ttl)
+        return result
+
+    async def _chat_on(
+        self, provider: Provider, adapter: Any, model: str, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace
+    ) -> ChatResult:
+        trace.count("attempt", base_url=adapter.base_url)
+        with RequestObserver(provider.value, adapter.base_url, model, "chat") as observer:
+            response_json = await adapter.chat(model=model, messages=messages, gen=gen_params, trace=trace)
+            trace.mark("last_token")
+            observer.usage(response_json)
+            return self._to_result(response_json, gen_params, observer, provider, trace, gen_params.stops_on_final(messages))
+
+    async def _complete(self, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace) -> ChatResult:
+        async def once() -> ChatResult:
+            if self.hedge is not None:
+                return await self.hedge.acall(lambda: self._complete_once(messages, gen_params, trace))
+            return await self._complete_once(messages, gen_params, trace)
+
+        async def call() -> ChatResult:
+            return await self.retry.acall(once) if self.retry is not None else await once()
+
+        async def admitted() -> ChatResult:
+            if self.admission is None:
+                return await call()
+            async with self.admission():
+                return await call()
+
+        if gen_params.timeout is None:
+            return await admitted()
+        try:
+            # по истечении срока запрос к бэкенду отменяется (соединение закрывается, генерация прекращается)
+            return await asyncio.wait_for(admitted(), gen_params.timeout)
+        except asyncio.TimeoutError:
+            CANCELLED.labels("deadline").inc()
+            raise DeadlineExceeded("request deadline exceeded") from None
+
+    async def _complete_once(self, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace) -> ChatResult:
+        if self.pool is None:
+            return await self._chat_on(self.provider, self._adapter, self.model, messages, gen_params, trace)
+        return await self.pool.acall(
+            lambda node: self._chat_on(node.backend.provider, self._node_adapter(node), node.backend.model or self.model, messages, gen_params, trace)
+        )
+
+    async def _stream_on(
+        self, provider: Provider, adapter: Any, model: str, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace
+    ) -> AsyncIterator[str]:
+        trace.count("attempt", base_url=adapter.base_url)
+        trace.backend = (provider.value, adapter.base_url, model)
+        with RequestObserver(provider.value, adapter.base_url, model, "stream") as observer:
+            chunks = adapter.stream_chat(model=model, messages=messages, gen=gen_params, trace=trace)
+            limit, reason = self.timeouts.first_token, "first_token_timeout"
+            try:
+                while True:
+                    try:
+                        chunk = await anext_within(chunks, limit)
+                    except StopAsyncIteration:
+                        return
+                    except asyncio.TimeoutError:
+                        # как сетевой таймаут: пул переключается на другую реплику, хеджирование учитывает ошибку
+                        CANCELLED.labels(reason).inc()
+                        raise httpx.ReadTimeout(f"{reason.replace('_', ' ')} after {limit} s: {adapter.base_url}") from None
+                    observer.first_token()
+                    limit, reason = self.timeouts.inter_token, "inter_token_timeout"
+                    yield chunk
+            finally:
+                await chunks.aclose()
+
+    def _stream_chunks(self, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace) -> AsyncIterator[str]:
+        # стримы не повторяются (часть токенов уже отдана), но хеджируются по первому токену
+        if self.hedge is not None:
+            chunks = self.hedge.astream(lambda: self._stream_once(messages, gen_params, trace))
+        else:
+            chunks = self._stream_once(messages, gen_params, trace)
+        return chunks if self.admission is None else self._admitted(chunks)
+
+    async def _admitted(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        assert self.admission is not None
+        async with self.admission():
+            async for chunk in chunks:
+                yield chunk
+
+    def _stream_once(self, messages: List[Message], gen_params: GenerationParams, trace: RequestTrace) -> AsyncIterator[str]:
+        if self.pool is None:
+            return self._stream_on(self.provider, self._adapter, self.model, messages, gen_params, trace)
+        return self.pool.astream(
+            lambda node: self._stream_on(node.backend.provider, self._node_adapter(node), node.backend.model or self.model, messages, gen_params, trace)
+        )
+
+    async def iter_chat_many(
+        self,
+        prompts: Iterable[str],
+        concurrency: int = 8,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+    ) -> AsyncIterator[BatchItem]:
+        """Выполняет запросы с ограничением параллелизма и отдаёт результаты по мере готовности.
+
+        ``concurrency`` воркеров берут промпты из общего ленивого итератора, поэтому вход
+        может быть генератором произвольной длины.
+        """
+        items = iter(enumerate(prompts))
+        queue: "asyncio.Queue[Optional[BatchItem]]" = asyncio.Queue()
+
+        async def worker() -> None:
+            try:
+                for index, prompt in items:
+                    try:
+                        result = await self.chat(prompt, system_prompt=system_prompt, gen=gen)
+                        queue.put_nowait(BatchItem(index=index, result=result))
+                    except Exception as e:
+                        queue.put_nowait(BatchItem(index=index, error=str(e)))
+            finally:
+                queue.put_nowait(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        running = len(workers)
+        try:
+            while running:
+                item = await queue.get()
+                if item is None:
+                    running -= 1
                     continue
-                break
-            if buffer and ("<final>" not in buffer.lower() and "</final>" not in buffer.lower()):
-                yield (current_channel, buffer)
-                buffer = ""
-        if buffer:
-            yield (current_channel, buffer)
+                yield item
+        finally:
+            for task in workers:
+                task.cancel()
+
+    async def chat_many(
+        self,
+        prompts: Iterable[str],
+        concurrency: int = 8,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+    ) -> List[BatchItem]:
+        """Параллельный чат по списку промптов; ошибки хранятся по элементам, порядок — как во входе."""
+        items = [item async for item in self.iter_chat_many(prompts, concurrency=concurrency, system_prompt=system_prompt, gen=gen)]
+        return sorted(items, key=lambda item: item.index)
+
+    async def stream_chat(
+        self,
+        user_prompt: str,
+        system_prompt: Optional[str] = None,
+        gen: Optional[GenerationParams] = None,
+        parser: Optional[HarmonyStreamParser] = None,
+        coalesce: bool = False,
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Стрим событий (channel, text); итоговое разбиение после стрима — ``parser.result()``,
+        usage и фазы запроса — ``parser.usage`` и ``parser.timings``."""
+        trace = self._trace("stream")
+        gen_params = self._merge_gen(gen)
+        messages = self._build_messages(user_prompt, system_prompt, gen_params)
+        parser = parser or self._stream_parser(gen_params)
+        trace.mark("build")
+        if coalesce:
+            chunks = acoalesce_stream(self._request_key(messages, gen_params), lambda: self._stream_chunks(messages, gen_params, trace))
+        else:
+            chunks = self._stream_chunks(messages, gen_params, trace)
+        received = 0
+        deadline = deadline_after(gen_params.timeout)
+        iterator = chunks.__aiter__()
+        last: Optional[float] = None
+        parse_time = 0.0
+        error: Optional[BaseException] = None
+        try:
+            try:
+                while True:
+                    left = remaining(deadline)
+                    try:
+                        chunk = await anext_within(iterator, left)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        CANCELLED.labels("deadline").inc()
+                        raise DeadlineExceeded("request deadline exceeded") from None
+                    received += 1
+                    now = time.perf_counter()
+                    if last is None:
+                        trace.mark("first_token", now)
+                    last = now
+                    events = parser.feed(chunk)
+                    parse_time += time.perf_counter() - now
+                    if events and trace.watching:
+                        trace.channels(events)
+                    for item in events:
+                        yield item
+                    if gen_params.closes_stream(parser.finished, messages):
+                        self._record_early_stop(parser.finished, gen_params, received, trace)
+                        break
+            finally:
+                aclose = getattr(chunks, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            for item in parser.close():
+                yield item
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._end_stream(trace, parser, last, parse_time, error)
@@ -0,0 +1,222 @@
+from __future__ import annotations
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from .metrics import Counter
+
+
+# Single-flight: одинаковые одновременные запросы (ключ — канонический запрос, как у кэша)
+# разделяют один вызов бэкенда. Реестры общие на процесс, т.к. сервер создаёт клиента на каждый запрос.
+
+T = TypeVar("T")
+
+COALESCED = Counter("gptoss_coalesced_requests", "Requests served by joining an identical in-flight request", ("kind",))
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_calls: Dict[str, _Call] = {}
+_calls_lock = threading.Lock()
+
+
+def coalesce_call(key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+    """Выполняет fn один раз на ключ; возвращает (результат, получен ли он от чужого вызова)."""
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if call is None:
+            call = _calls[key] = _Call()
+    if not leader:
+        COALESCED.labels("chat").inc()
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+    try:
+        call.result = fn()
+        return call.result, False
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.event.set()
+
+
+class _AsyncCall:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Future[Any]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+_async_calls: Dict[Tuple[int, str], _AsyncCall] = {}
+
+
+async def acoalesce_call(key: str, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+    """Async-вариант: вызов идёт отдельной задачей и отменяется, только когда ушли все ожидающие."""
+    loop_key = (id(asyncio.get_running_loop()), key)
+    call = _async_calls.get(loop_key)
+    shared = call is not None
+    if call is None:
+        call = _async_calls[loop_key] = _AsyncCall(asyncio.ensure_future(fn()))
+        entry = call
+        call.task.add_done_callback(lambda _: _async_calls.pop(loop_key, None) if _async_calls.get(loop_key) is entry else None)
+    else:
+        COALESCED.labels("chat").inc()
+    call.waiters += 1
+    try:
+        return await asyncio.shield(call.task), shared
+    finally:
+        call.waiters -= 1
+        if call.waiters == 0 and not call.task.done():
+            call.task.cancel()
+
+
+class _Broadcast:
+    """Буфер чанков стрима: подписчики сначала проигрывают накопленное, затем читают вживую."""
+
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+
+
+class _SyncBroadcast(_Broadcast):
+    def __init__(self) -> None:
+        super().__init__()
+        self.cond = threading.Condition()
+        self.abandoned = False
+
+
+_streams: Dict[str, _SyncBroadcast] = {}
+
+
+def _pump(key: str, b: _SyncBroadcast, source: Iterator[str]) -> None:
+    try:
+        for chunk in source:
+            with b.cond:
+                if b.abandoned:
+                    break
+                b.chunks.append(chunk)
+                b.cond.notify_all()
+    except BaseException as e:
+        b.error = e
+    finally:
+        close = getattr(source, "close", None)
+        if close is not None:
+            close()
+        with _calls_lock:
+            if _streams.get(key) is b:
+                del _streams[key]
+        with b.cond:
+            b.done = True
+            b.cond.notify_all()
+
+
+def coalesce_stream(key: str, make: Callable[[], Iterator[str]]) -> Iterator[str]:
+    """Общий стрим на ключ: upstream читается в фоновом потоке и закрывается, когда уходят все подписчики."""
+    with _calls_lock:
+        b = _streams.get(key)
+        if b is None:
+            b = _streams[key] = _SyncBroadcast()
+            threading.Thread(target=_pump, args=(key, b, make()), name="gptoss-coalesce", daemon=True).start()
+        else:
+            COALESCED.labels("stream").inc()
+    return _follow(b)
+
+
+def _follow(b: _SyncBroadcast) -> Iterator[str]:
+    with b.cond:
+        b.subscribers += 1
+    i = 0
+    try:
+        while True:
+            with b.cond:
+                while i >= len(b.chunks) and not b.done:
+                    b.cond.wait()
+                pending = b.chunks[i:]
+                finished = b.done
+            for chunk in pending:
+                yield chunk
+            i += len(pending)
+            if finished and i >= len(b.chunks):
+                if b.error is not None:
+                    raise b.error
+                return
+    finally:
+        with b.cond:
+            b.subscribers -= 1
+            if b.subscribers == 0 and not b.done:
+                b.abandoned = True
+
+
+class _AsyncBroadcast(_Broadcast):
+    def __init__(self) -> None:
+        super().__init__()
+        self.changed = asyncio.Event()
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def notify(self) -> None:
+        event, self.changed = self.changed, asyncio.Event()
+        event.set()
+
+
+_async_streams: Dict[Tuple[int, str], _AsyncBroadcast] = {}
+
+
+async def _apump(loop_key: Tuple[int, str], b: _AsyncBroadcast, source: AsyncIterator[str]) -> None:
+    try:
+        async for chunk in source:
+            b.chunks.append(chunk)
+            b.notify()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        b.error = e
+    finally:
+        if _async_streams.get(loop_key) is b:
+            del _async_streams[loop_key]
+        b.done = True
+        b.notify()
+
+
+def acoalesce_stream(key: str, make: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+    loop_key = (id(asyncio.get_running_loop()), key)
+    b = _async_streams.get(loop_key)
+    if b is None:
+        b = _async_streams[loop_key] = _AsyncBroadcast()
+        b.task = asyncio.ensure_future(_apump(loop_key, b, make()))
+    else:
+        COALESCED.labels("stream").inc()
+    return _afollow(b)
+
+
+async def _afollow(b: _AsyncBroadcast) -> AsyncIterator[str]:
+    b.subscribers += 1
+    i = 0
+    try:
+        while True:
+            while i < len(b.chunks):
+                yield b.chunks[i]
+                i += 1
+            if b.done:
+                if b.error is not None:
+                    raise b.error
+                return
+            await b.changed.wait()
+    finally:
+        b.subscribers -= 1
+        if b.subscribers == 0 and b.task is not None and not b.task.done():
+            b.task.cancel()
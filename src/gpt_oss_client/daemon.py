@@ -0,0 +1,172 @@
+from __future__ import annotations
+import importlib
+import json
+import os
+import socket
+import socketserver
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Модуль импортируется из CLI на каждом `gptoss chat`, поэтому на верхнем уровне — только стандартная
+# библиотека: клиентская часть не должна тянуть httpx/pydantic, серверная загружает их при старте.
+
+DEFAULT_SOCKET = "~/.cache/gptoss/daemon.sock"
+
+
+def socket_path(path: Optional[str] = None) -> str:
+    """Путь к сокету: аргумент, GPTOSS_DAEMON_SOCKET или ~/.cache/gptoss/daemon.sock."""
+    return os.path.expanduser(path or os.getenv("GPTOSS_DAEMON_SOCKET") or DEFAULT_SOCKET)
+
+
+class DaemonUnavailable(RuntimeError):
+    pass
+
+
+class DaemonError(RuntimeError):
+    """Ошибка запроса на стороне демона (бэкенд недоступен, ответ с ошибкой и т.п.)."""
+
+    def __init__(self, message: str, error_type: str) -> None:
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def connect(path: Optional[str] = None, timeout: float = 0.2) -> socket.socket:
+    """Подключение к запущенному демону; ``DaemonUnavailable``, если его нет (сокет не существует или устарел)."""
+    path = socket_path(path)
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        raise DaemonUnavailable(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise DaemonUnavailable(path)
+    # таймаут нужен только на подключение: генерация может идти долго
+    sock.settimeout(None)
+    return sock
+
+
+def request(body: Dict[str, Any], path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Отправляет запрос демону и возвращает итератор строк ответа (JSON по строке).
+
+    Подключение — сразу, до первой итерации: ``DaemonUnavailable`` позволяет вызывающему выполнить запрос сам.
+    """
+    sock = connect(path)
+    f = sock.makefile("rwb")
+    f.write(json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n")
+    f.flush()
+    return _events(sock, f)
+
+
+def _events(sock: socket.socket, f: Any) -> Iterator[Dict[str, Any]]:
+    with sock, f:
+        for line in f:
+            event = json.loads(line)
+            if "error" in event:
+                raise DaemonError(event["error"], event.get("type", "Exception"))
+            yield event
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "DaemonServer"
+
+    def _send(self, event: Dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            body = json.loads(line)
+            op = body.get("op", "chat")
+            if op == "ping":
+                self._send({"ok": True, "pid": os.getpid()})
+            elif op == "shutdown":
+                self._send({"ok": True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            elif op == "chat":
+                self._chat(body)
+            else:
+                self._send({"error": f"unknown op: {op}", "type": "ValueError"})
+        except (BrokenPipeError, ConnectionResetError):
+            # клиент ушёл (Ctrl+C): стрим к бэкенду закрывается вместе с генератором
+            pass
+        except Exception as e:
+            try:
+                self._send({"error": str(e), "type": type(e).__name__})
+            except OSError:
+                pass
+
+    def _chat(self, body: Dict[str, Any]) -> None:
+        from .schema import GenerationParams
+
+        client = self.server.client(body)
+        gen = GenerationParams(**(body.get("gen") or {}))
+        message = body["message"]
+        system_prompt = body.get("system_prompt")
+        if body.get("stream"):
+            events = client.stream_chat(message, system_prompt=system_prompt, gen=gen)
+            try:
+                for channel, text in events:
+                    self._send({"channel": channel, "text": text})
+            finally:
+                events.close()  # type: ignore[attr-defined]
+            self._send({"done": True})
+            return
+        result = client.chat(message, system_prompt=system_prompt, gen=gen)
+        self._send({"reasoning": result.reasoning, "final": result.final_answer, "parsed": result.parsed, "raw": result.raw})
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Тёплый процесс: импорты уже выполнены, соединения с бэкендами остаются в пуле между вызовами CLI."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str) -> None:
+        # прогрев импорта до первого запроса
+        importlib.import_module(".client", __package__)
+
+        self._clients: Dict[Tuple[str, str, str, Optional[str]], Any] = {}
+        self._lock = threading.Lock()
+        super().__init__(path, _Handler)
+
+    def client(self, body: Dict[str, Any]) -> Any:
+        from .client import LLMClient
+
+        key = (body.get("provider", "openai"), body["base_url"], body["model"], body.get("api_key"))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = LLMClient(provider=key[0], base_url=key[1], model=key[2], api_key=key[3])
+            return client
+
+
+def serve(path: Optional[str] = None) -> None:
+    """Запускает демона на Unix-сокете (доступ только владельцу) и обслуживает запросы до ``shutdown``."""
+    path = socket_path(path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(path):
+        try:
+            connect(path).close()
+        except DaemonUnavailable:
+            os.unlink(path)  # сокет остался от упавшего процесса
+        else:
+            raise RuntimeError(f"daemon is already running on {path}")
+    old_umask = os.umask(0o177)
+    try:
+        server = DaemonServer(path)
+    finally:
+        os.umask(old_umask)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
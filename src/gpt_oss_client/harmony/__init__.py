@@ -1,8 +1,11 @@
-from .parser import build_system_instruction, build_json_system_instruction, parse_structured_output, parse_json_strict
+from .parser import build_system_instruction, build_json_system_instruction, build_schema_system_instruction, parse_structured_output, parse_json_strict
+from .stream import HarmonyStreamParser
 
 __all__ = [
     "build_system_instruction",
     "build_json_system_instruction",
+    "build_schema_system_instruction",
     "parse_structured_output",
     "parse_json_strict",
+    "HarmonyStreamParser",
 ]
@@ -4,14 +4,10 @@ from typing import Optional, Tuple, Union
 from pydantic import BaseModel, ValidationError
 
 
-_REASONING_TAG_RE = re.compile(r"<thinking>([\s\S]*?)</thinking>", re.IGNORECASE)
-_FINAL_TAG_RE = re.compile(r"<final>([\s\S]*?)</final>", re.IGNORECASE)
-_FINAL_OPEN_RE = re.compile(r"<final>", re.IGNORECASE)
-_THINKING_OPEN_RE = re.compile(r"<thinking>", re.IGNORECASE)
-_THINKING_CLOSE_RE = re.compile(r"</thinking>", re.IGNORECASE)
-
-# LM Studio / Harmony-подобные маркеры
-_CHANNEL_BLOCK_RE = re.compile(r"<\|channel\|>[\s\S]*?<\|message\|>([\s\S]+)$", re.IGNORECASE)
+# Все маркеры, от которых зависит выбор стратегии, находятся одним проходом по тексту
+_MARKER_SCAN_RE = re.compile(r"<(/?)(thinking|final)>|<\|(channel|message)\|>", re.IGNORECASE)
+_TRAILING_TAG_RE = re.compile(r"<[^>]+>$")
+_JSON_OBJECT_START_RE = re.compile(r"\s*\{")
 
 
 def build_system_instruction() -> str:
@@ -31,39 +27,93 @@ def build_json_system_instruction() -> str:
     )
 
 
+def build_schema_system_instruction(schema: dict) -> str:
+    return (
+        "Вы ассистент. Отвечайте строго JSON-значением, соответствующим JSON Schema ниже, без пояснений и префиксов.\n"
+        f"JSON Schema: {json.dumps(schema, ensure_ascii=False, separators=(',', ':'))}\n"
+        "Никакого текста вне JSON. Никаких XML-тегов и Markdown."
+    )
+
+
 class HarmonyJSON(BaseModel):
     reasoning: Optional[str] = None
     final: Union[str, int, float]
 
 
-def _extract_by_tags(text: str) -> Tuple[Optional[str], Optional[str]]:
-    thinking_match = _REASONING_TAG_RE.search(text or "")
-    final_match = _FINAL_TAG_RE.search(text or "")
-    reasoning = thinking_match.group(1).strip() if thinking_match else None
-    final = final_match.group(1).strip() if final_match else None
+class _Markers:
+    """Позиции первых вхождений маркеров, найденные за один проход ``_scan_markers``."""
+
+    __slots__ = ("think_open", "think_close", "think_close_after_open", "final_open", "final_close_after_open", "channel", "message_after_channel")
+
+    def __init__(self) -> None:
+        self.think_open: Optional[re.Match] = None
+        self.think_close: Optional[re.Match] = None
+        self.think_close_after_open: Optional[re.Match] = None
+        self.final_open: Optional[re.Match] = None
+        self.final_close_after_open: Optional[re.Match] = None
+        self.channel: Optional[re.Match] = None
+        self.message_after_channel: Optional[re.Match] = None
+
+
+def _scan_markers(text: str) -> _Markers:
+    mk = _Markers()
+    for m in _MARKER_SCAN_RE.finditer(text):
+        tag = m.group(2)
+        if tag is not None:
+            closing = bool(m.group(1))
+            if tag.lower() == "thinking":
+                if not closing:
+                    if mk.think_open is None:
+                        mk.think_open = m
+                else:
+                    if mk.think_close is None:
+                        mk.think_close = m
+                    if mk.think_open is not None and mk.think_close_after_open is None:
+                        mk.think_close_after_open = m
+            elif not closing:
+                if mk.final_open is None:
+                    mk.final_open = m
+            elif mk.final_open is not None and mk.final_close_after_open is None:
+                mk.final_close_after_open = m
+        elif m.group(3).lower() == "channel":
+            if mk.channel is None:
+                mk.channel = m
+        elif mk.channel is not None and mk.message_after_channel is None:
+            mk.message_after_channel = m
+        if (
+            mk.think_close_after_open is not None
+            and mk.final_close_after_open is not None
+            and mk.message_after_channel is not None
+        ):
+            break
+    return mk
+
+
+def _extract_by_tags(text: str, mk: _Markers) -> Tuple[Optional[str], Optional[str]]:
+    reasoning: Optional[str] = None
+    final: Optional[str] = None
+    if mk.think_open is not None and mk.think_close_after_open is not None:
+        reasoning = text[mk.think_open.end():mk.think_close_after_open.start()].strip()
+    if mk.final_open is not None and mk.final_close_after_open is not None:
+        final = text[mk.final_open.end():mk.final_close_after_open.start()].strip()
     return reasoning, final
 
 
-def _extract_unclosed_final(text: str) -> Tuple[Optional[str], Optional[str]]:
-    if not text:
+def _extract_unclosed_final(text: str, mk: _Markers) -> Tuple[Optional[str], Optional[str]]:
+    # Есть <final>, но нет </final>
+    if mk.final_open is None or mk.final_close_after_open is not None:
         return None, None
-    # Найти thinking блок даже если final не закрыт
-    think_open = _THINKING_OPEN_RE.search(text)
-    think_close = _THINKING_CLOSE_RE.search(text)
-    final_open = _FINAL_OPEN_RE.search(text)
-    if final_open and not _FINAL_TAG_RE.search(text):
-        # Есть <final>, но нет </final>
-        reasoning: Optional[str] = None
-        if think_open and think_close and think_close.start() > think_open.end():
-            reasoning = text[think_open.end():think_close.start()].strip()
-        else:
-            # если нет полноценного thinking, возьмём всё до <final>
-            reasoning = text[:final_open.start()].strip() or None
-        final = text[final_open.end():].strip()
-        # Уберём возможные хвостовые теги или маркеры каналов
-        final = re.sub(r"<[^>]+>$", "", final).strip()
-        return reasoning, (final or None)
-    return None, None
+    reasoning: Optional[str] = None
+    # thinking блок берём, даже если final не закрыт
+    if mk.think_open is not None and mk.think_close is not None and mk.think_close.start() > mk.think_open.end():
+        reasoning = text[mk.think_open.end():mk.think_close.start()].strip()
+    else:
+        # если нет полноценного thinking, возьмём всё до <final>
+        reasoning = text[:mk.final_open.start()].strip() or None
+    final = text[mk.final_open.end():].strip()
+    # Уберём возможные хвостовые теги или маркеры каналов
+    final = _TRAILING_TAG_RE.sub("", final).strip()
+    return reasoning, (final or None)
 
 
 def _extract_from_json(text: str) -> Tuple[Optional[str], Optional[str]]:
@@ -86,13 +136,11 @@ def _extract_from_json(text: str) -> Tuple[Optional[str], Optional[str]]:
         return None, None
 
 
-def _extract_from_lmstudio_channels(text: str) -> Tuple[Optional[str], Optional[str]]:
-    if not text:
+def _extract_from_lmstudio_channels(text: str, mk: _Markers) -> Tuple[Optional[str], Optional[str]]:
+    # LM Studio / Harmony-подобные маркеры: <|channel|>…<|message|>{json}
+    if mk.channel is None or mk.message_after_channel is None or mk.message_after_channel.end() >= len(text):
         return None, None
-    m = _CHANNEL_BLOCK_RE.search(text)
-    if not m:
-        return None, None
-    json_part = m.group(1).strip()
+    json_part = text[mk.message_after_channel.end():].strip()
     json_obj: Optional[dict] = None
     start = json_part.find('{')
     end = json_part.rfind('}')
@@ -102,7 +150,7 @@ def _extract_from_lmstudio_channels(text: str) -> Tuple[Optional[str], Optional[
             json_obj = json.loads(candidate)
         except Exception:
             json_obj = None
-    pre_text = text[: m.start()].strip()
+    pre_text = text[: mk.channel.start()].strip()
     reasoning = pre_text or None
     if json_obj is not None:
         final_value = (
@@ -139,6 +187,9 @@ def _extract_trailing_json(text: str) -> Tuple[Optional[str], Optional[str]]:
 
 
 def parse_json_strict(text: str) -> Tuple[Optional[str], Optional[str]]:
+    if not text or _JSON_OBJECT_START_RE.match(text) is None:
+        # только JSON-объект может пройти валидацию HarmonyJSON
+        return _extract_trailing_json(text)
     try:
         data = json.loads(text)
         obj = HarmonyJSON.model_validate(data)
@@ -148,16 +199,25 @@ def parse_json_strict(text: str) -> Tuple[Optional[str], Optional[str]]:
 
 
 def parse_structured_output(text: str) -> Tuple[Optional[str], Optional[str]]:
-    reasoning, final = _extract_by_tags(text)
-    if reasoning or final:
-        return reasoning, final
-    reasoning, final = _extract_unclosed_final(text)
+    if not text:
+        return None, None
+    mk = _scan_markers(text)
+    reasoning, final = _extract_by_tags(text, mk)
+    if final is None and mk.final_open is not None and mk.final_close_after_open is None:
+        # генерация остановлена на стоп-последовательности </final> (или по max_tokens);
+        # без <thinking> рассуждение — текст до <final>, как и раньше
+        unclosed_reasoning, final = _extract_unclosed_final(text, mk)
+        reasoning = reasoning or unclosed_reasoning
     if reasoning or final:
         return reasoning, final
-    reasoning, final = _extract_from_lmstudio_channels(text)
+    reasoning, final = _extract_unclosed_final(text, mk)
     if reasoning or final:
         return reasoning, final
-    reasoning, final = _extract_from_json(text)
+    reasoning, final = _extract_from_lmstudio_channels(text, mk)
     if reasoning or final:
         return reasoning, final
-    return None, (text or None)
+    if _JSON_OBJECT_START_RE.match(text) is not None:
+        reasoning, final = _extract_from_json(text)
+        if reasoning or final:
+            return reasoning, final
+    return None, text
@@ -0,0 +1,325 @@
+from __future__ import annotations
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+from .parser import parse_json_strict, parse_structured_output
+
+
+Event = Tuple[str, str]
+
+REASONING = "reasoning"
+FINAL = "final"
+
+_REASONING_KEYS = ("reasoning", "chain_of_thought", "thinking")
+_FINAL_KEYS = ("final", "answer", "output")
+
+# <thinking>, </thinking>, <final>, </final> и служебные маркеры LM Studio/Harmony вида <|channel|>
+_MARKER_RE = re.compile(r"</?(?:thinking|final)>|<\|[a-z_]{1,30}\|>", re.IGNORECASE)
+_PARTIAL_SPECIAL_RE = re.compile(r"<\|[a-z_]{0,30}\|?\Z", re.IGNORECASE)
+_XML_TAGS = ("<thinking>", "</thinking>", "<final>", "</final>")
+_MAX_MARKER_LEN = 34
+_STRING_SPECIAL_RE = re.compile(r'["\\]')
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def _is_partial_marker(rest: str) -> bool:
+    low = rest.lower()
+    if any(tag.startswith(low) for tag in _XML_TAGS):
+        return True
+    return _PARTIAL_SPECIAL_RE.match(low) is not None
+
+
+def _channel_for_key(key: Optional[str]) -> Optional[str]:
+    if key in _REASONING_KEYS:
+        return REASONING
+    if key in _FINAL_KEYS:
+        return FINAL
+    return None
+
+
+class _JsonFieldStream:
+    """Инкрементальный разбор JSON-объекта: отдаёт содержимое полей reasoning/final по мере прихода."""
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_string = False
+        self.expect_key = False
+        self.reading_key = False
+        self.key: Optional[str] = None
+        self.key_buf: List[str] = []
+        self.target: Optional[str] = None
+        self.scalar: List[str] = []
+        self.pending = ""
+        self.saw_final = False
+
+    def feed(self, text: str, out: List[Event]) -> int:
+        """Разбирает text, добавляя события в out. Возвращает индекс конца объекта или -1."""
+        if self.pending:
+            text = self.pending + text
+            self.pending = ""
+        i, n = 0, len(text)
+        while i < n:
+            if self.in_string:
+                m = _STRING_SPECIAL_RE.search(text, i)
+                j = m.start() if m else n
+                if j > i:
+                    self._string_part(text[i:j], out)
+                if j == n:
+                    return -1
+                if text[j] == '"':
+                    self._end_string()
+                    i = j + 1
+                    continue
+                decoded, size = self._decode_escape(text, j)
+                if size == 0:
+                    self.pending = text[j:]
+                    return -1
+                self._string_part(decoded, out)
+                i = j + size
+                continue
+            c = text[i]
+            if c == '"':
+                self._flush_scalar(out)
+                self.in_string = True
+                if self.depth == 1 and self.expect_key:
+                    self.reading_key = True
+                    self.key_buf = []
+                elif self.depth == 1:
+                    self.target = _channel_for_key(self.key)
+            elif c in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = c == "{"
+            elif c in "}]":
+                self._flush_scalar(out)
+                self.depth -= 1
+                if self.depth <= 0:
+                    return i + 1
+            elif self.depth == 1 and c == ":":
+                self.expect_key = False
+            elif self.depth == 1 and c == ",":
+                self._flush_scalar(out)
+                self.expect_key = True
+                self.key = None
+            elif self.depth == 1 and not self.expect_key and not c.isspace() and _channel_for_key(self.key):
+                self.scalar.append(c)
+            i += 1
+        return -1
+
+    def _string_part(self, s: str, out: List[Event]) -> None:
+        if self.reading_key:
+            self.key_buf.append(s)
+        elif self.target is not None:
+            self.saw_final = self.saw_final or self.target == FINAL
+            out.append((self.target, s))
+
+    def _end_string(self) -> None:
+        self.in_string = False
+        if self.reading_key:
+            self.key = "".join(self.key_buf)
+            self.reading_key = False
+        self.target = None
+
+    def _flush_scalar(self, out: List[Event]) -> None:
+        if self.scalar:
+            value = "".join(self.scalar)
+            self.scalar = []
+            if value not in ("null", "true", "false"):
+                channel = _channel_for_key(self.key)
+                if channel:
+                    self.saw_final = self.saw_final or channel == FINAL
+                    out.append((channel, value))
+
+    @staticmethod
+    def _decode_escape(text: str, j: int) -> Tuple[str, int]:
+        # (декодированный символ, длина escape-последовательности) или ("", 0), если она ещё не дошла
+        n = len(text)
+        if j + 1 >= n:
+            return "", 0
+        c = text[j + 1]
+        if c != "u":
+            return _JSON_ESCAPES.get(c, c), 2
+        if j + 6 > n:
+            return "", 0
+        seq = text[j:j + 6]
+        code = int(seq[2:], 16) if all(ch in "0123456789abcdefABCDEF" for ch in seq[2:]) else -1
+        if code < 0:
+            return seq, 6
+        if 0xD800 <= code < 0xDC00:
+            if j + 12 > n:
+                return "", 0
+            if text[j + 6:j + 8] == "\\u":
+                try:
+                    return json.loads('"' + text[j:j + 12] + '"'), 12
+                except ValueError:
+                    pass
+        return chr(code), 6
+
+
+class HarmonyStreamParser:
+    """Потоковый парсер вывода модели, работающий за O(общей длины).
+
+    Понимает те же форматы, что и ``parse_structured_output``: теги
+    ``<thinking>``/``<final>``, маркеры LM Studio ``<|channel|>…<|message|>`` и
+    JSON-объекты ``{"reasoning": …, "final": …}``. ``feed`` возвращает события
+    ``(channel, text)`` без служебных тегов; в конце чанка удерживается только
+    незавершённый тег. Итоговое разбиение (как у нестримингового парсера)
+    возвращает ``result()``. ``finished`` становится непустым (причина), как только
+    финальный ответ завершён: ``</final>``, ``<|return|>`` или закрытый JSON-объект
+    с полем final — дальше поток можно не читать.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: List[str] = []
+        self._pending = ""
+        self._mode = "begin"
+        self._channel: Optional[str] = REASONING
+        self._outside: Optional[str] = REASONING
+        self._after_final = False
+        self._header: List[str] = []
+        self._json: Optional[_JsonFieldStream] = None
+        self._closed = False
+        self.finished: Optional[str] = None
+        # usage и фазы запроса (``Usage``, ``Timings``): заполняет клиент по окончании стрима
+        self.usage: Any = None
+        self.timings: Any = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> List[Event]:
+        if not chunk:
+            return []
+        self._chunks.append(chunk)
+        out: List[Event] = []
+        text = self._pending + chunk if self._pending else chunk
+        self._pending = ""
+        self._process(text, out)
+        return _merge(out)
+
+    def close(self) -> List[Event]:
+        if self._closed:
+            return []
+        self._closed = True
+        out: List[Event] = []
+        if self._pending and self._mode == "text":
+            # незавершённый «тег» в конце потока — это обычный текст
+            self._emit(self._pending, out)
+        self._pending = ""
+        return _merge(out)
+
+    def result(self, strict_json: bool = False) -> Tuple[Optional[str], Optional[str]]:
+        text = self.text
+        if strict_json:
+            reasoning, final = parse_json_strict(text)
+            if final is not None:
+                return reasoning, final
+        return parse_structured_output(text)
+
+    def _emit(self, s: str, out: List[Event]) -> None:
+        if not s:
+            return
+        if self._mode == "header":
+            self._header.append(s)
+        elif self._mode == "text" and self._channel is not None:
+            out.append((self._channel, s))
+
+    def _process(self, text: str, out: List[Event]) -> None:
+        i, n = 0, len(text)
+        while i < n:
+            if self._mode in ("begin", "body"):
+                # пропускаем пробелы, чтобы понять, начинается ли тело с JSON-объекта
+                j = i
+                while j < n and text[j].isspace():
+                    j += 1
+                if j == n:
+                    self._pending = text[i:]
+                    return
+                if text[j] == "{":
+                    self._mode = "json"
+                    self._json = _JsonFieldStream()
+                    i = j
+                else:
+                    self._mode = "text"
+                continue
+            if self._mode == "json":
+                assert self._json is not None
+                end = self._json.feed(text[i:] if i else text, out)
+                if end < 0:
+                    return
+                i += end
+                if self._json.saw_final and self.finished is None:
+                    self.finished = "json_complete"
+                self._json = None
+                self._mode = "text"
+                self._channel = self._outside
+                continue
+            j = text.find("<", i)
+            if j == -1:
+                self._emit(text[i:], out)
+                return
+            self._emit(text[i:j], out)
+            m = _MARKER_RE.match(text, j)
+            if m is None:
+                if n - j < _MAX_MARKER_LEN and _is_partial_marker(text[j:]):
+                    self._pending = text[j:]
+                    return
+                self._emit("<", out)
+                i = j + 1
+                continue
+            self._on_marker(m.group(0).lower())
+            i = m.end()
+
+    def _on_marker(self, marker: str) -> None:
+        if self._mode == "role":
+            self._mode = "text"
+        if marker == "<thinking>":
+            self._mode = "text"
+            self._channel = REASONING
+        elif marker == "</thinking>":
+            self._channel = self._outside
+        elif marker == "<final>":
+            self._mode = "text"
+            self._channel = None if self._after_final else FINAL
+        elif marker == "</final>":
+            self.finished = self.finished or "final_closed"
+            self._after_final = True
+            self._outside = None
+            self._channel = None
+        elif marker == "<|channel|>":
+            self._mode = "header"
+            self._header = []
+        elif marker == "<|message|>":
+            header = "".join(self._header).strip().lower()
+            self._header = []
+            self._channel = FINAL if header.startswith("final") else REASONING
+            self._mode = "body"
+        elif marker == "<|start|>":
+            self._mode = "role"
+        elif self._mode == "header":
+            # <|constrain|> и прочие маркеры внутри заголовка канала
+            return
+        else:
+            # <|end|>, <|return|>, <|call|> и т.п. закрывают сообщение
+            if marker == "<|return|>" and self._channel == FINAL:
+                self.finished = self.finished or "final_closed"
+            self._mode = "text"
+            self._channel = self._outside
+
+
+def _merge(events: List[Event]) -> List[Event]:
+    if len(events) < 2:
+        return events
+    merged: List[Event] = []
+    parts: List[str] = [events[0][1]]
+    channel = events[0][0]
+    for ch, s in events[1:]:
+        if ch == channel:
+            parts.append(s)
+        else:
+            merged.append((channel, "".join(parts)))
+            channel, parts = ch, [s]
+    merged.append((channel, "".join(parts)))
+    return merged
@@ -0,0 +1,313 @@
+from __future__ import annotations
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+# Лёгкая реализация метрик в текстовом формате Prometheus (без зависимости от prometheus_client)
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BACKEND_LABELS = ("provider", "base_url", "model")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional["Registry"] = None) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values: Any) -> Any:
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {key}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    @property
+    def family(self) -> str:
+        # имя семейства сэмплов в HELP/TYPE (формат 0.0.4)
+        return self.name
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.family} {self.documentation}", f"# TYPE {self.family} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    @property
+    def family(self) -> str:
+        return f"{self.name}_total"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            i = bisect_left(self.buckets, value)
+            if i < len(self.counts):
+                self.counts[i] += 1
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional["Registry"] = None,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {child.count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(child.sum)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {child.count}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Функция, возвращающая готовые строки экспозиции (вызывается при каждом scrape)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics):
+            lines.extend(metric.expose())
+        for collector in list(self._collectors):
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = Counter("gptoss_requests", "Requests sent to LLM backends", BACKEND_LABELS + ("kind",))
+REQUEST_ERRORS = Counter("gptoss_request_errors", "Failed backend requests by exception type", BACKEND_LABELS + ("error_type",))
+REQUESTS_IN_FLIGHT = Gauge("gptoss_requests_in_flight", "Backend requests currently in flight", BACKEND_LABELS)
+REQUEST_LATENCY = Histogram("gptoss_request_duration_seconds", "End-to-end backend request latency", BACKEND_LABELS + ("kind",))
+TIME_TO_FIRST_TOKEN = Histogram("gptoss_time_to_first_token_seconds", "Time to first streamed token", BACKEND_LABELS)
+PARSE_LATENCY = Histogram(
+    "gptoss_parse_duration_seconds",
+    "Time spent parsing model output",
+    BACKEND_LABELS,
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+RESPONSE_FORMAT_FALLBACKS = Counter("gptoss_response_format_fallbacks", "Requests resent without response_format after HTTP 400", BACKEND_LABELS)
+MALFORMED_FRAMES = Counter(
+    "gptoss_stream_malformed_frames",
+    "Undecodable SSE/NDJSON frames skipped in backend streams",
+    BACKEND_LABELS + ("format",),
+)
+COMPLETION_TOKENS = Counter("gptoss_completion_tokens", "Completion tokens reported by backends", BACKEND_LABELS)
+TOKENS_PER_SECOND = Histogram(
+    "gptoss_tokens_per_second",
+    "Generation throughput reported by backends (usage / eval_count)",
+    BACKEND_LABELS,
+    buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500, 1000),
+)
+EARLY_STOPS = Counter("gptoss_early_stops", "Generations stopped as soon as the final answer was complete", BACKEND_LABELS + ("reason",))
+TOKENS_SAVED = Counter(
+    "gptoss_tokens_saved",
+    "Estimated completion tokens not generated thanks to early termination (unused max_tokens budget, upper bound)",
+    BACKEND_LABELS,
+)
+
+COLD_REQUEST_LATENCY = Histogram(
+    "gptoss_cold_request_duration_seconds",
+    "Latency of the first request to a model after start or idle (cold start); warmed = preloaded by warmup",
+    BACKEND_LABELS + ("kind", "warmed"),
+)
+WARMUP_LATENCY = Histogram("gptoss_warmup_duration_seconds", "Model preload and keep-alive ping latency", BACKEND_LABELS + ("kind",))
+WARMUP_ERRORS = Counter("gptoss_warmup_errors", "Failed model preloads and keep-alive pings", BACKEND_LABELS)
+
+# Запрос считается «холодным», если к модели не было запросов дольше COLD_AFTER секунд
+# (по умолчанию 5 минут — столько Ollama держит модель без keep_alive).
+COLD_AFTER = 300.0
+_last_request: Dict[Tuple[str, str, str], float] = {}
+_last_warmup: Dict[Tuple[str, str, str], float] = {}
+
+
+def last_request(provider: str, base_url: str, model: str) -> Optional[float]:
+    """Время (time.monotonic) последнего запроса к модели; None — запросов ещё не было."""
+    return _last_request.get((provider, base_url, model))
+
+
+def note_warmup(provider: str, base_url: str, model: str) -> None:
+    _last_warmup[(provider, base_url, model)] = time.monotonic()
+
+
+def usage_tokens(response_json: Any, elapsed: float) -> Tuple[Optional[int], Optional[float]]:
+    """(число сгенерированных токенов, токенов в секунду) из ответа OpenAI (usage) или Ollama (eval_*)."""
+    if not isinstance(response_json, dict):
+        return None, None
+    usage = response_json.get("usage")
+    if isinstance(usage, dict) and isinstance(usage.get("completion_tokens"), int):
+        tokens = usage["completion_tokens"]
+        return tokens, (tokens / elapsed if elapsed > 0 else None)
+    eval_count = response_json.get("eval_count")
+    if isinstance(eval_count, int):
+        eval_duration = response_json.get("eval_duration")
+        if isinstance(eval_duration, (int, float)) and eval_duration > 0:
+            return eval_count, eval_count / (eval_duration / 1e9)
+        return eval_count, (eval_count / elapsed if elapsed > 0 else None)
+    return None, None
+
+
+class RequestObserver:
+    """Собирает метрики одного запроса к бэкенду; используется как контекстный менеджер."""
+
+    def __init__(self, provider: str, base_url: str, model: str, kind: str) -> None:
+        self.labels = (provider, base_url, model)
+        self.kind = kind
+        self.started = 0.0
+        self.first_token_at: Optional[float] = None
+        self.cold = False
+
+    def __enter__(self) -> "RequestObserver":
+        self.started = time.perf_counter()
+        now = time.monotonic()
+        previous = _last_request.get(self.labels)
+        _last_request[self.labels] = now
+        self.cold = previous is None or now - previous > COLD_AFTER
+        REQUESTS.labels(*self.labels, self.kind).inc()
+        REQUESTS_IN_FLIGHT.labels(*self.labels).inc()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        REQUESTS_IN_FLIGHT.labels(*self.labels).dec()
+        elapsed = time.perf_counter() - self.started
+        REQUEST_LATENCY.labels(*self.labels, self.kind).observe(elapsed)
+        if self.cold and (exc_type is None or exc_type is GeneratorExit):
+            warmed_at = _last_warmup.get(self.labels)
+            warmed = warmed_at is not None and time.monotonic() - elapsed - warmed_at <= COLD_AFTER
+            COLD_REQUEST_LATENCY.labels(*self.labels, self.kind, "true" if warmed else "false").observe(elapsed)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            REQUEST_ERRORS.labels(*self.labels, exc_type.__name__).inc()
+
+    def first_token(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            TIME_TO_FIRST_TOKEN.labels(*self.labels).observe(self.first_token_at - self.started)
+
+    def parsed(self, seconds: float) -> None:
+        PARSE_LATENCY.labels(*self.labels).observe(seconds)
+
+    def early_stop(self, reason: str, tokens_saved: Optional[int] = None) -> None:
+        EARLY_STOPS.labels(*self.labels, reason).inc()
+        if tokens_saved:
+            TOKENS_SAVED.labels(*self.labels).inc(tokens_saved)
+
+    def usage(self, response_json: Any) -> None:
+        tokens, rate = usage_tokens(response_json, time.perf_counter() - self.started)
+        if tokens is not None:
+            COMPLETION_TOKENS.labels(*self.labels).inc(tokens)
+        if rate is not None:
+            TOKENS_PER_SECOND.labels(*self.labels).observe(rate)
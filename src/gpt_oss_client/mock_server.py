@@ -0,0 +1,142 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+
+class MockConfig(BaseModel):
+    """Параметры имитации бэкенда: скорость генерации, задержка первого токена, длина ответа."""
+
+    tokens_per_second: float = 200.0
+    first_token_delay: float = 0.05
+    output_tokens: int = 64
+    # «болтовня» модели после </final> — чтобы было видно эффект ранней остановки
+    trailing_tokens: int = 0
+
+    @classmethod
+    def from_env(cls) -> "MockConfig":
+        cfg = cls()
+        if os.getenv("GPTOSS_MOCK_TOKEN_RATE"):
+            cfg.tokens_per_second = float(os.environ["GPTOSS_MOCK_TOKEN_RATE"])
+        if os.getenv("GPTOSS_MOCK_FIRST_TOKEN_DELAY"):
+            cfg.first_token_delay = float(os.environ["GPTOSS_MOCK_FIRST_TOKEN_DELAY"])
+        if os.getenv("GPTOSS_MOCK_OUTPUT_TOKENS"):
+            cfg.output_tokens = int(os.environ["GPTOSS_MOCK_OUTPUT_TOKENS"])
+        if os.getenv("GPTOSS_MOCK_TRAILING_TOKENS"):
+            cfg.trailing_tokens = int(os.environ["GPTOSS_MOCK_TRAILING_TOKENS"])
+        return cfg
+
+    def to_env(self) -> Dict[str, str]:
+        return {
+            "GPTOSS_MOCK_TOKEN_RATE": str(self.tokens_per_second),
+            "GPTOSS_MOCK_FIRST_TOKEN_DELAY": str(self.first_token_delay),
+            "GPTOSS_MOCK_OUTPUT_TOKENS": str(self.output_tokens),
+            "GPTOSS_MOCK_TRAILING_TOKENS": str(self.trailing_tokens),
+        }
+
+
+def _tokens(cfg: MockConfig, json_output: bool, stop: Optional[List[str]] = None) -> List[str]:
+    n = max(cfg.output_tokens, 4)
+    thinking = max(n // 2, 1)
+    words = [f" word{i}" for i in range(n - thinking)]
+    if json_output:
+        body = json.dumps({"reasoning": "".join(f" step{i}" for i in range(thinking)).strip(), "final": "".join(words).strip()})
+        size = max(len(body) // n, 1)
+        chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        return chunks + [" "] * cfg.trailing_tokens
+    tokens = ["<thinking>"] + [f" step{i}" for i in range(thinking)] + ["</thinking><final>"] + words + ["</final>"]
+    tokens += [f" more{i}" for i in range(cfg.trailing_tokens)]
+    for i, token in enumerate(tokens):
+        # как настоящий сервер: генерация обрывается на стоп-строке, сама строка не выводится
+        if stop and any(s in token for s in stop):
+            return tokens[:i]
+    return tokens
+
+
+async def _paced(cfg: MockConfig, tokens: List[str]) -> AsyncIterator[str]:
+    await asyncio.sleep(cfg.first_token_delay)
+    interval = 1.0 / cfg.tokens_per_second if cfg.tokens_per_second > 0 else 0.0
+    started = time.perf_counter()
+    for i, token in enumerate(tokens):
+        if interval:
+            # выдерживаем заданную скорость без накопления погрешности sleep
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield token
+
+
+async def _generate(cfg: MockConfig, tokens: List[str]) -> str:
+    parts = [token async for token in _paced(cfg, tokens)]
+    return "".join(parts)
+
+
+def create_mock_app(cfg: MockConfig) -> FastAPI:
+    """Локальный мок бэкенда: OpenAI-совместимый /v1/chat/completions (SSE) и Ollama /api/chat (NDJSON)."""
+    mock = FastAPI(title="gpt-oss-client mock backend")
+
+    @mock.get("/v1/models")
+    async def models() -> Dict[str, Any]:
+        return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+    @mock.get("/api/tags")
+    async def tags() -> Dict[str, Any]:
+        return {"models": [{"name": "mock"}]}
+
+    @mock.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Any:
+        body = await request.json()
+        tokens = _tokens(cfg, "response_format" in body, body.get("stop"))
+        usage = {"prompt_tokens": 16, "completion_tokens": len(tokens), "total_tokens": 16 + len(tokens)}
+        if not body.get("stream"):
+            text = await _generate(cfg, tokens)
+            return {
+                "id": "mock",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events() -> AsyncIterator[str]:
+            async for token in _paced(cfg, tokens):
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @mock.post("/api/chat")
+    async def ollama_chat(request: Request) -> Any:
+        body = await request.json()
+        tokens = _tokens(cfg, body.get("format") == "json" or isinstance(body.get("format"), dict), (body.get("options") or {}).get("stop"))
+        started = time.perf_counter_ns()
+        if not body.get("stream", True):
+            text = await _generate(cfg, tokens)
+            return {
+                "model": body.get("model"),
+                "message": {"role": "assistant", "content": text},
+                "done": True,
+                "done_reason": "stop",
+                "eval_count": len(tokens),
+                "eval_duration": time.perf_counter_ns() - started,
+            }
+
+        async def lines() -> AsyncIterator[str]:
+            async for token in _paced(cfg, tokens):
+                yield json.dumps({"message": {"role": "assistant", "content": token}, "done": False}) + "\n"
+            done = {"message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "stop", "eval_count": len(tokens), "eval_duration": time.perf_counter_ns() - started}
+            yield json.dumps(done) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return mock
+
+
+app = create_mock_app(MockConfig.from_env())
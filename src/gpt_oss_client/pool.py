@@ -0,0 +1,119 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+
+from .providers import Provider
+
+
+PoolKey = Tuple[str, str, Optional[str]]
+
+
+class PoolLimits(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls) -> "PoolLimits":
+        """Значения по умолчанию с переопределением через GPTOSS_POOL_* / GPTOSS_HTTP2."""
+        limits = cls()
+        if os.getenv("GPTOSS_POOL_MAX_CONNECTIONS"):
+            limits.max_connections = int(os.environ["GPTOSS_POOL_MAX_CONNECTIONS"])
+        if os.getenv("GPTOSS_POOL_MAX_KEEPALIVE"):
+            limits.max_keepalive_connections = int(os.environ["GPTOSS_POOL_MAX_KEEPALIVE"])
+        if os.getenv("GPTOSS_POOL_KEEPALIVE_EXPIRY"):
+            limits.keepalive_expiry = float(os.environ["GPTOSS_POOL_KEEPALIVE_EXPIRY"])
+        limits.http2 = os.getenv("GPTOSS_HTTP2", "").lower() in ("1", "true", "yes")
+        return limits
+
+    def to_httpx(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+_lock = threading.Lock()
+_limits: Optional[PoolLimits] = None
+_sync_clients: Dict[PoolKey, httpx.Client] = {}
+# httpx.AsyncClient привязан к event loop, поэтому пулы ведутся отдельно для каждого loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[PoolKey, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+
+
+def _key(provider: Provider, base_url: str, api_key: Optional[str]) -> PoolKey:
+    return (Provider(provider).value, base_url.rstrip("/"), api_key)
+
+
+def configure_pool(limits: PoolLimits) -> None:
+    """Задать лимиты для пулов, которые будут созданы после вызова."""
+    global _limits
+    with _lock:
+        _limits = limits
+
+
+def get_limits() -> PoolLimits:
+    global _limits
+    with _lock:
+        if _limits is None:
+            _limits = PoolLimits.from_env()
+        return _limits
+
+
+def get_http_client(provider: Provider, base_url: str, api_key: Optional[str] = None) -> httpx.Client:
+    """Долгоживущий httpx.Client (keep-alive пул) для бэкенда (provider, base_url, api_key)."""
+    key = _key(provider, base_url, api_key)
+    client = _sync_clients.get(key)
+    if client is not None and not client.is_closed:
+        return client
+    limits = get_limits()
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.Client(limits=limits.to_httpx(), http2=limits.http2)
+            _sync_clients[key] = client
+        return client
+
+
+def get_async_http_client(provider: Provider, base_url: str, api_key: Optional[str] = None) -> httpx.AsyncClient:
+    """Долгоживущий httpx.AsyncClient для бэкенда в текущем event loop."""
+    loop = asyncio.get_running_loop()
+    key = _key(provider, base_url, api_key)
+    clients = _async_clients.get(loop)
+    client = clients.get(key) if clients is not None else None
+    if client is not None and not client.is_closed:
+        return client
+    limits = get_limits()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=limits.to_httpx(), http2=limits.http2)
+            clients[key] = client
+        return client
+
+
+def close_pools() -> None:
+    """Закрыть все синхронные пулы (например, при завершении процесса)."""
+    with _lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        client.close()
+
+
+async def aclose_pools() -> None:
+    """Закрыть асинхронные пулы текущего event loop и все синхронные пулы."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = list(_async_clients.pop(loop, {}).values())
+    for client in clients:
+        await client.aclose()
+    close_pools()
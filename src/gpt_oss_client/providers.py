@@ -4,3 +4,8 @@ from enum import Enum
 class Provider(str, Enum):
     OPENAI_COMPAT = "openai"
     OLLAMA = "ollama"
+
+
+class BalanceStrategy(str, Enum):
+    LEAST_OUTSTANDING = "least_outstanding"
+    EWMA = "ewma"
@@ -0,0 +1,276 @@
+from __future__ import annotations
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+from .metrics import Counter
+
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+RETRIES = Counter("gptoss_retries", "Backend requests retried after a transient error", ("reason",))
+HEDGES = Counter("gptoss_hedged_requests", "Hedged duplicate requests by winner", ("winner",))
+
+
+def is_retryable(e: BaseException) -> bool:
+    """Временные ошибки: сетевые сбои, таймауты и 408/429/5xx (кроме 501)."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code in RETRYABLE_STATUS
+    return isinstance(e, httpx.TransportError)
+
+
+def _retry_reason(e: BaseException) -> str:
+    if isinstance(e, httpx.HTTPStatusError):
+        return str(e.response.status_code)
+    return type(e).__name__
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    if not isinstance(e, httpx.HTTPStatusError):
+        return None
+    value = e.response.headers.get("Retry-After")
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        # HTTP-date не поддерживаем — используем обычный backoff
+        return None
+
+
+class RetryBudget:
+    """Бюджет повторов: в скользящем окне не больше ``min_retries + ratio * запросов`` повторов.
+
+    Защищает перегруженный бэкенд от лавины повторов: при массовых сбоях повторяется лишь доля запросов.
+    Один бюджет можно разделять между клиентами (и между повторами и хеджированием).
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: float = 10.0) -> None:
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float) -> None:
+        edge = now - self.window
+        while self._requests and self._requests[0] < edge:
+            self._requests.popleft()
+        while self._retries and self._retries[0] < edge:
+            self._retries.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class RetryPolicy:
+    """Повторы идемпотентных (нестриминговых) запросов с экспоненциальным backoff и full jitter."""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff_base: float = 0.25,
+        backoff_max: float = 5.0,
+        budget: Optional[RetryBudget] = None,
+    ) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.budget = budget if budget is not None else RetryBudget()
+
+    @classmethod
+    def from_env(cls) -> Optional["RetryPolicy"]:
+        """GPTOSS_RETRIES — число повторов (0 или не задано — без повторов), GPTOSS_RETRY_BACKOFF — база, секунд."""
+        retries = int(os.getenv("GPTOSS_RETRIES", "0") or 0)
+        if retries <= 0:
+            return None
+        return cls(max_attempts=retries + 1, backoff_base=float(os.getenv("GPTOSS_RETRY_BACKOFF", "0.25")))
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Пауза перед повтором номер ``attempt`` (с 1): full jitter, Retry-After от бэкенда как нижняя граница."""
+        cap = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        delay = random.uniform(0, cap)
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _should_retry(self, attempt: int, error: BaseException) -> bool:
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return False
+        if not self.budget.try_spend():
+            return False
+        RETRIES.labels(_retry_reason(error)).inc()
+        return True
+
+    def call(self, fn: Callable[[], T]) -> T:
+        self.budget.record_request()
+        attempt = 1
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                time.sleep(self.delay(attempt, e))
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        self.budget.record_request()
+        attempt = 1
+        while True:
+            try:
+                return await fn()
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                await asyncio.sleep(self.delay(attempt, e))
+                attempt += 1
+
+
+class HedgePolicy:
+    """Хеджирование: если ответа (или первого токена стрима) нет дольше ``delay`` секунд,
+    отправляется дубликат запроса; побеждает первый успешный, проигравший отменяется.
+
+    С пулом реплик дубликат уходит на другую реплику: на исходной уже есть незавершённый запрос.
+    Дубликаты расходуют общий ``RetryBudget``, чтобы хеджирование не перегружало бэкенды.
+    """
+
+    def __init__(self, delay: float, budget: Optional[RetryBudget] = None) -> None:
+        self.delay = delay
+        self.budget = budget if budget is not None else RetryBudget(ratio=0.1, min_retries=5)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["HedgePolicy"]:
+        """GPTOSS_HEDGE_DELAY_MS — порог задержки для дубликата (не задано — без хеджирования)."""
+        value = os.getenv("GPTOSS_HEDGE_DELAY_MS")
+        return cls(delay=float(value) / 1000.0) if value else None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(thread_name_prefix="gptoss-hedge")
+            return self._executor
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Синхронный вариант: запросы идут в потоках; проигравший дорабатывает в фоне, результат отбрасывается."""
+        self.budget.record_request()
+        executor = self._pool()
+        futures: Dict[Future, str] = {executor.submit(fn): "primary"}
+        done, _ = wait(futures, timeout=self.delay)
+        if not done and self.budget.try_spend():
+            futures[executor.submit(fn)] = "hedge"
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if len(futures) > 1:
+                        HEDGES.labels(futures[future]).inc()
+                    return future.result()
+                error = error or future.exception()
+        assert error is not None
+        raise error
+
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        self.budget.record_request()
+        tasks: Dict["asyncio.Future[T]", str] = {asyncio.ensure_future(fn()): "primary"}
+        done, _ = await asyncio.wait(tasks, timeout=self.delay)
+        if not done and self.budget.try_spend():
+            tasks[asyncio.ensure_future(fn())] = "hedge"
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1:
+                            HEDGES.labels(tasks[task]).inc()
+                        return task.result()
+                    error = error or task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        assert error is not None
+        raise error
+
+    async def astream(self, make: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Хеджирование стрима по первому элементу: дальше читается только победивший стрим."""
+        self.budget.record_request()
+        streams: Dict["asyncio.Future[Any]", AsyncIterator[T]] = {}
+        labels: Dict[AsyncIterator[T], str] = {}
+
+        def start(label: str) -> None:
+            stream = make()
+            labels[stream] = label
+            streams[asyncio.ensure_future(stream.__anext__())] = stream
+
+        start("primary")
+        done, _ = await asyncio.wait(streams, timeout=self.delay)
+        if not done and self.budget.try_spend():
+            start("hedge")
+        pending = set(streams)
+        winner: Optional[AsyncIterator[T]] = None
+        first: Any = None
+        ended = False
+        error: Optional[BaseException] = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exc = task.exception()
+                    if exc is None or isinstance(exc, StopAsyncIteration):
+                        winner = streams[task]
+                        first = task.result() if exc is None else None
+                        ended = exc is not None
+                        break
+                    error = error or exc
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            for stream in streams.values():
+                if stream is not winner:
+                    await stream.aclose()  # type: ignore[attr-defined]
+        if winner is None:
+            assert error is not None
+            raise error
+        if len(streams) > 1:
+            HEDGES.labels(labels[winner]).inc()
+        if ended:
+            return
+        try:
+            yield first
+            async for item in winner:
+                yield item
+        finally:
+            await winner.aclose()  # type: ignore[attr-defined]
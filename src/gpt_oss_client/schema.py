@@ -1,12 +1,76 @@
 from __future__ import annotations
-from typing import Any, List, Optional
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, field_validator, model_validator
+
+from .harmony.parser import build_system_instruction
+
+
+FINAL_STOP = "</final>"
+# ответ размечен тегами <thinking>/<final> — только со встроенным системным промптом
+_TAGGED_INSTRUCTION = build_system_instruction()
+
+
+class Usage(BaseModel):
+    """Токены, о которых сообщил бэкенд (``usage`` OpenAI, ``prompt_eval_count``/``eval_count`` Ollama)."""
+
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+
+    @classmethod
+    def from_response(cls, response_json: Any) -> Optional["Usage"]:
+        if not isinstance(response_json, dict):
+            return None
+        usage = response_json.get("usage")
+        if isinstance(usage, dict):
+            return cls(
+                prompt_tokens=usage.get("prompt_tokens"),
+                completion_tokens=usage.get("completion_tokens"),
+                total_tokens=usage.get("total_tokens"),
+            )
+        prompt, completion = response_json.get("prompt_eval_count"), response_json.get("eval_count")
+        if prompt is None and completion is None:
+            return None
+        return cls(prompt_tokens=prompt, completion_tokens=completion, total_tokens=(prompt or 0) + (completion or 0))
+
+
+class Timings(BaseModel):
+    """Фазы вызова ``chat``/``stream_chat``, секунд от его начала; ``None`` — фазы не было.
+
+    ``connect`` — соединение (с TLS) установлено, у соединения из пула его нет; ``first_byte`` — получены
+    заголовки ответа; ``last_token`` — последний чанк стрима, у нестримового запроса — ответ целиком.
+    ``parse`` — длительность разбора вывода, ``total`` — всего вызова.
+    """
+
+    build: Optional[float] = None
+    connect: Optional[float] = None
+    first_byte: Optional[float] = None
+    first_token: Optional[float] = None
+    first_reasoning_token: Optional[float] = None
+    first_final_token: Optional[float] = None
+    last_token: Optional[float] = None
+    parse: Optional[float] = None
+    total: Optional[float] = None
+    # запросов к бэкенду (повторы, хеджирование, failover) и повторных отправок без response_format
+    attempts: int = 0
+    fallbacks: int = 0
+    cached: bool = False
 
 
 class ChatResult(BaseModel):
     reasoning: Optional[str] = None
     final_answer: Optional[str] = None
     raw: Optional[Any] = None
+    # значение, проверенное по json_schema (экземпляр модели, если схема задана pydantic-моделью)
+    parsed: Optional[Any] = None
+    usage: Optional[Usage] = None
+    timings: Optional[Timings] = None
+
+
+class BatchItem(BaseModel):
+    index: int
+    result: Optional[ChatResult] = None
+    error: Optional[str] = None
 
 
 class Message(BaseModel):
@@ -25,3 +89,51 @@ class GenerationParams(BaseModel):
     max_tokens: Optional[int] = None
     json_output: bool = False
     strict_json: bool = False
+    # Ollama: сколько держать модель (и KV-кэш) в памяти после запроса, например "30m"
+    keep_alive: Optional[str] = None
+    stop: Optional[List[str]] = None
+    # остановить генерацию, как только финальный ответ завершён (стоп-последовательность, закрытие стрима);
+    # None — на </final> только со встроенным системным промптом, True — и со своим, False — никогда
+    early_stop: Optional[bool] = None
+    # общий срок запроса, секунд (очередь, повторы и генерация); в ключ кэша не входит
+    timeout: Optional[float] = None
+    # JSON Schema ответа (или pydantic-модель — хранится её схема); включает json_output
+    json_schema: Optional[Dict[str, Any]] = None
+
+    @field_validator("json_schema", mode="before")
+    @classmethod
+    def _schema_of_model(cls, value: Any) -> Any:
+        if isinstance(value, type) and issubclass(value, BaseModel):
+            from .structured import compile_schema
+
+            # компиляция запоминает модель: результат разбирается в её экземпляр
+            return compile_schema(value).schema
+        return value
+
+    @model_validator(mode="after")
+    def _schema_implies_json(self) -> "GenerationParams":
+        if self.json_schema is not None:
+            self.json_output = True
+        return self
+
+    def stops_on_final(self, messages: List["Message"]) -> bool:
+        """Обрывать ли генерацию на ``</final>``. Свой системный промпт может не использовать теги
+        или продолжать ответ после них, поэтому без явного ``early_stop=True`` — только со встроенным."""
+        if self.json_output or self.early_stop is False:
+            return False
+        if self.early_stop:
+            return True
+        return bool(messages) and messages[0].role == "system" and messages[0].content == _TAGGED_INSTRUCTION
+
+    def stop_sequences(self, messages: List["Message"]) -> List[str]:
+        stops = list(self.stop or [])
+        # в JSON-режиме стоп-строки нет: закрытие объекта определяет потоковый парсер
+        if FINAL_STOP not in stops and self.stops_on_final(messages):
+            stops.append(FINAL_STOP)
+        return stops
+
+    def closes_stream(self, finished: Optional[str], messages: List["Message"]) -> bool:
+        """Закрывать ли стрим, когда потоковый парсер сообщил о завершении ответа (причина ``finished``)."""
+        if not finished or self.early_stop is False:
+            return False
+        return finished != "final_closed" or self.stops_on_final(messages)
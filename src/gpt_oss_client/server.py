@@ -1,17 +1,151 @@
 from __future__ import annotations
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import math
+import os
+import weakref
+import anyio
+import httpx
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Literal, Optional, Tuple, TypeVar, Union
 
-from .client import LLMClient
+from .admission import AdmissionController, AdmissionRejected, Priority
+from .balancer import BackendPool, NoBackendAvailable
+from .cache import CacheStats, ResponseCache
+from .capabilities import CAPABILITIES, BackendCapabilities, probe
+from .client import AsyncLLMClient
+from .harmony import HarmonyStreamParser
+from .metrics import CONTENT_TYPE, REGISTRY
+from .pool import aclose_pools
 from .providers import Provider
-from .schema import GenerationParams
+from .retry import HedgePolicy, RetryPolicy
+from .schema import BatchItem, ChatResult, GenerationParams, Message
+from .sessions import Session, SessionBusy, SessionStore, SharedSessionStore
+from .shared import get_shared_state
+from .structured import SchemaStreamParser, StructuredOutputError, compile_schema
+from .timeouts import CANCELLED, DeadlineExceeded, Timeouts
+from .warmup import KeepAliveScheduler
 
-app = FastAPI(title="gpt-oss-client", version="0.2.0")
 
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    # пулы соединений к бэкендам живут всё время работы сервера и переиспользуются между запросами
+    pool = get_backend_pool()
+    if pool is not None:
+        pool.start_health_checks()
+        if os.getenv("GPTOSS_PROBE_CAPABILITIES", "").lower() in ("1", "true", "yes"):
+            await _probe_backends(pool)
+    keepalive = KeepAliveScheduler.from_env(pool)
+    if keepalive is not None:
+        # модели загружаются до приёма запросов: первый запрос не ждёт загрузки весов
+        await asyncio.to_thread(keepalive.warm_all)
+        keepalive.start()
+    yield
+    if keepalive is not None:
+        keepalive.stop()
+    if pool is not None:
+        pool.stop()
+    await aclose_pools()
+    if _response_cache is not None:
+        _response_cache.close()
+    shared = get_shared_state()
+    if shared is not None:
+        shared.close()
 
-class ChatIn(BaseModel):
-    message: str
+
+async def _probe_backends(pool: BackendPool) -> None:
+    """Проверка возможностей реплик при старте, чтобы даже первый JSON-запрос не тратил лишний round trip."""
+    for node in pool.nodes:
+        b = node.backend
+        try:
+            await asyncio.to_thread(probe, b.provider, b.base_url, b.api_key, b.model)
+        except Exception:
+            # недоступная реплика не мешает старту: возможности выучатся на первых запросах
+            continue
+
+
+app = FastAPI(title="gpt-oss-client", version="0.2.0", lifespan=lifespan)
+
+_response_cache: Optional[ResponseCache] = None
+_backend_pool: Optional[BackendPool] = None
+_backend_pool_loaded = False
+# политики повторов и хеджирования общие для всех запросов: у них общий бюджет
+_admission = AdmissionController.from_env()
+_retry_policy = RetryPolicy.from_env()
+_hedge_policy = HedgePolicy.from_env()
+_timeouts = Timeouts.from_env()
+
+T = TypeVar("T")
+
+
+def get_backend_pool() -> Optional[BackendPool]:
+    """Пул реплик из GPTOSS_BACKENDS; None, если балансировка не настроена."""
+    global _backend_pool, _backend_pool_loaded
+    if not _backend_pool_loaded:
+        _backend_pool = BackendPool.from_env()
+        _backend_pool_loaded = True
+    return _backend_pool
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache.from_env()
+    return _response_cache
+
+
+def _cache_metrics() -> List[str]:
+    if _response_cache is None:
+        return []
+    stats = _response_cache.stats()
+    return [
+        "# HELP gptoss_cache_hits_total Response cache hits",
+        "# TYPE gptoss_cache_hits_total counter",
+        f"gptoss_cache_hits_total {stats.hits}",
+        "# HELP gptoss_cache_misses_total Response cache misses",
+        "# TYPE gptoss_cache_misses_total counter",
+        f"gptoss_cache_misses_total {stats.misses}",
+        "# HELP gptoss_cache_entries Entries in the in-memory response cache",
+        "# TYPE gptoss_cache_entries gauge",
+        f"gptoss_cache_entries {stats.memory_entries}",
+    ]
+
+
+REGISTRY.register_collector(_cache_metrics)
+
+
+def _http_error(e: Exception) -> HTTPException:
+    """Ошибки бэкенда → осмысленные HTTP-статусы вместо общего 500."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, AdmissionRejected):
+        retry_after = str(max(1, math.ceil(e.retry_after)))
+        return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": retry_after})
+    if isinstance(e, SessionBusy):
+        return HTTPException(status_code=409, detail=str(e))
+    if isinstance(e, httpx.HTTPStatusError):
+        upstream = e.response.status_code
+        try:
+            body = e.response.text[:500]
+        except httpx.ResponseNotRead:
+            # стриминговый ответ: тело ошибки не читалось, а поток уже закрыт
+            body = e.response.reason_phrase
+        return HTTPException(status_code=502, detail=f"Upstream returned {upstream}: {body}")
+    if isinstance(e, StructuredOutputError):
+        return HTTPException(status_code=502, detail={"message": "Model output does not match the JSON Schema", "errors": e.errors})
+    if isinstance(e, DeadlineExceeded):
+        return HTTPException(status_code=504, detail="Request deadline exceeded (timeout_ms)")
+    if isinstance(e, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail=f"Upstream timeout: {type(e).__name__}")
+    if isinstance(e, (httpx.TransportError, NoBackendAvailable)):
+        return HTTPException(status_code=503, detail=f"Upstream unavailable: {e}")
+    return HTTPException(status_code=500, detail=str(e))
+
+
+class BackendIn(BaseModel):
     provider: Provider = Provider.OPENAI_COMPAT
     base_url: str = "http://localhost:1234/v1"
     model: str = "gpt-oss-20b"
@@ -21,30 +155,383 @@ class ChatIn(BaseModel):
     max_tokens: Optional[int] = None
     json_output: bool = False
     strict_json: bool = False
+    # JSON Schema ответа: передаётся бэкенду (response_format / format) и проверяется по мере генерации
+    json_schema: Optional[Dict[str, Any]] = None
+    cache: bool = False
+    cache_ttl: Optional[float] = None
+    # одинаковые одновременные запросы разделяют один вызов бэкенда
+    coalesce: bool = False
+    # при включённом admission control интерактивные запросы обслуживаются раньше пакетных
+    priority: Optional[Priority] = None
+    # общий срок запроса (очередь, повторы, генерация; в пакете — каждого элемента); по истечении запрос
+    # к бэкенду отменяется, ответ — 504
+    timeout_ms: Optional[int] = Field(None, ge=1)
+
+
+class ChatIn(BackendIn):
+    message: str
+
+
+class ChatStreamIn(ChatIn):
+    format: Literal["sse", "ndjson"] = "sse"
+
+
+class ChatBatchIn(BackendIn):
+    messages: List[str]
+    concurrency: int = Field(8, ge=1, le=256)
+    stream: bool = False
 
 
 class ChatOut(BaseModel):
     reasoning: Optional[str] = None
     final: Optional[str] = None
+    # ответ, проверенный по json_schema
+    parsed: Optional[Any] = None
+
+
+class BatchItemOut(ChatOut):
+    index: int
+    error: Optional[str] = None
+
+
+class ChatBatchOut(BaseModel):
+    results: List[BatchItemOut]
+
+
+def _client_key(x_api_key: Optional[str], authorization: Optional[str]) -> Optional[str]:
+    """Ключ клиента gptoss (для квот): X-API-Key или Authorization: Bearer."""
+    if x_api_key:
+        return x_api_key
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip() or None
+    return None
+
+
+def _pooled(payload: BackendIn) -> bool:
+    # явный base_url в запросе важнее настроенного пула
+    return "base_url" not in payload.model_fields_set
+
+
+def _make_client(
+    payload: BackendIn, client_key: Optional[str] = None, priority: Priority = Priority.INTERACTIVE, pooled: Optional[bool] = None
+) -> AsyncLLMClient:
+    """``pooled`` — уже известный выбор между пулом и ``base_url`` (по умолчанию — по полям запроса)."""
+    pool = get_backend_pool()
+    use_pool = pool is not None and (_pooled(payload) if pooled is None else pooled)
+    admission = None
+    if _admission is not None:
+        lane = "pool" if use_pool else f"{payload.provider.value}|{payload.base_url.rstrip('/')}"
+        controller = _admission
+        admission = lambda: controller.slot(lane, payload.priority or priority, client_key)  # noqa: E731
+    common: Dict[str, Any] = dict(
+        cache=get_response_cache() if payload.cache else None,
+        retry=_retry_policy,
+        hedge=_hedge_policy,
+        admission=admission,
+        timeouts=_timeouts,
+    )
+    if use_pool:
+        assert pool is not None
+        return AsyncLLMClient.from_pool(pool, model=payload.model, **common)
+    return AsyncLLMClient(
+        provider=payload.provider,
+        base_url=payload.base_url,
+        model=payload.model,
+        api_key=payload.api_key,
+        **common,
+    )
+
+
+def _make_gen(payload: BackendIn) -> GenerationParams:
+    return GenerationParams(
+        temperature=payload.temperature,
+        top_p=payload.top_p,
+        max_tokens=payload.max_tokens,
+        json_output=payload.json_output,
+        strict_json=payload.strict_json,
+        json_schema=payload.json_schema,
+        timeout=payload.timeout_ms / 1000.0 if payload.timeout_ms is not None else None,
+    )
+
+
+def _chat_out(result: ChatResult) -> ChatOut:
+    return ChatOut(reasoning=result.reasoning, final=result.final_answer, parsed=result.parsed)
+
+
+class SessionIn(BackendIn):
+    system_prompt: Optional[str] = None
+    max_context_tokens: int = Field(8192, ge=256)
+    keep_alive: Optional[str] = "30m"
+
+
+class ServerSession(Session):
+    # параметры бэкенда и генерации фиксируются при создании: каждый ход шлёт тот же префикс
+    backend: SessionIn
+    # base_url не задан при создании — ходы идут через пул; model_fields_set после общего хранилища не восстанавливается
+    pooled: bool = True
+
+
+class SessionTurnIn(BaseModel):
+    message: str
+
+
+class SessionOut(BaseModel):
+    id: str
+    messages: List[Message]
+    history_tokens: int
+    truncations: int
+
+
+def _session_store() -> Union[SessionStore, SharedSessionStore]:
+    global _sessions
+    if _sessions is None:
+        max_sessions = int(os.getenv("GPTOSS_SESSIONS_MAX", "1000"))
+        ttl = float(os.getenv("GPTOSS_SESSION_TTL", "3600"))
+        shared = get_shared_state()
+        # с несколькими воркерами следующий ход сессии может прийти в другой процесс
+        if shared is not None:
+            turn_timeout = float(os.getenv("GPTOSS_SESSION_TURN_TIMEOUT", "300"))
+            _sessions = SharedSessionStore(shared, ServerSession, max_sessions, ttl, turn_timeout)
+        else:
+            _sessions = SessionStore(max_sessions, ttl)
+    return _sessions
+
+
+_sessions: Optional[Union[SessionStore, SharedSessionStore]] = None
+# ходы одной сессии выполняются по очереди; блокировка живёт, пока на неё кто-то ссылается
+_session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+async def _get_session(session_id: str) -> ServerSession:
+    session = await _session_store().aget(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    return session  # type: ignore[return-value]
+
+
+def _session_out(session: Session) -> SessionOut:
+    return SessionOut(id=session.id, messages=session.messages, history_tokens=session.history_tokens(), truncations=session.truncations)
+
+
+async def _disconnected(request: Request) -> None:
+    # тело запроса уже прочитано: следующее сообщение ASGI — http.disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """Ждёт результат, пока клиент на связи; если клиент закрыл соединение (таймаут n8n, Ctrl+C),
+    отменяет запрос к бэкенду — соединение с ним закрывается, и бэкенд прекращает генерацию."""
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_disconnected(request))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if task.cancelled() or not task.done():
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        CANCELLED.labels("client_disconnect").inc()
+        # nginx-код «клиент закрыл соединение»: ответ уже некому читать, статус виден в логах
+        raise HTTPException(status_code=499, detail="Client closed request")
+    return task.result()
+
+
+def _batch_item_out(item: BatchItem) -> BatchItemOut:
+    if item.result is None:
+        return BatchItemOut(index=item.index, error=item.error)
+    return BatchItemOut(index=item.index, reasoning=item.result.reasoning, final=item.result.final_answer, parsed=item.result.parsed)
 
 
 @app.post("/chat", response_model=ChatOut)
-async def chat(payload: ChatIn) -> ChatOut:
+async def chat(
+    request: Request,
+    payload: ChatIn,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> ChatOut:
     try:
-        client = LLMClient(
-            provider=payload.provider,
-            base_url=payload.base_url,
-            model=payload.model,
-            api_key=payload.api_key,
+        client = _make_client(payload, _client_key(x_api_key, authorization))
+        result = await _cancel_on_disconnect(
+            request, client.chat(payload.message, gen=_make_gen(payload), cache_ttl=payload.cache_ttl, coalesce=payload.coalesce)
         )
-        gen = GenerationParams(
-            temperature=payload.temperature,
-            top_p=payload.top_p,
-            max_tokens=payload.max_tokens,
-            json_output=payload.json_output,
-            strict_json=payload.strict_json,
-        )
-        result = client.chat(payload.message, gen=gen)
-        return ChatOut(reasoning=result.reasoning, final=result.final_answer)
+        return _chat_out(result)
+    except Exception as e:
+        raise _http_error(e)
+
+
+def _stream_event(fmt: str, event: str, data: Dict[str, Any]) -> str:
+    if fmt == "ndjson":
+        return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: Request,
+    payload: ChatStreamIn,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """Стрим токенов по мере генерации: события ``token`` ``{channel, text}``, затем ``done`` ``{reasoning, final}``.
+
+    Формат — SSE (по умолчанию) или NDJSON (``format: "ndjson"``). Ошибки до первого токена
+    (в том числе 429 от admission control) — обычным HTTP-статусом, после — событием ``error``.
+    Если клиент закрыл соединение, стрим к бэкенду закрывается сразу, и генерация прекращается.
+    """
+    client = _make_client(payload, _client_key(x_api_key, authorization))
+    gen = _make_gen(payload)
+    parser = SchemaStreamParser(compile_schema(gen.json_schema)) if gen.json_schema is not None else HarmonyStreamParser()
+    stream = client.stream_chat(payload.message, gen=gen, parser=parser, coalesce=payload.coalesce)
+    try:
+        first: Optional[Tuple[str, str]] = await _cancel_on_disconnect(request, stream.__anext__())
+    except StopAsyncIteration:
+        first = None
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _http_error(e)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            if first is not None:
+                yield _stream_event(payload.format, "token", {"channel": first[0], "text": first[1]})
+                async for channel, text in stream:
+                    yield _stream_event(payload.format, "token", {"channel": channel, "text": text})
+        except Exception as e:
+            yield _stream_event(payload.format, "error", {"detail": str(e)})
+            return
+        except (asyncio.CancelledError, GeneratorExit):
+            # Starlette отменяет отправку ответа при разрыве соединения
+            CANCELLED.labels("client_disconnect").inc()
+            raise
+        finally:
+            # закрытие не должно прерываться той же отменой: иначе соединение с бэкендом остаётся открытым
+            with anyio.CancelScope(shield=True):
+                await stream.aclose()  # type: ignore[attr-defined]
+        reasoning, final = parser.result(strict_json=payload.json_output and payload.strict_json)
+        done: Dict[str, Any] = {"reasoning": reasoning, "final": final}
+        if isinstance(parser, SchemaStreamParser):
+            done["parsed"] = parser.parsed
+        yield _stream_event(payload.format, "done", done)
+
+    media_type = "application/x-ndjson" if payload.format == "ndjson" else "text/event-stream"
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type=media_type, headers=headers)
+
+
+@app.post("/chat/batch", response_model=ChatBatchOut)
+async def chat_batch(
+    request: Request,
+    payload: ChatBatchIn,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> Union[ChatBatchOut, StreamingResponse]:
+    """Пакет независимых промптов: параллельно через общий пул, ошибки — по элементам.
+
+    С ``stream: true`` результаты отдаются NDJSON-строками по мере готовности. По умолчанию
+    элементы идут в admission control с приоритетом ``batch``.
+    """
+    client = _make_client(payload, _client_key(x_api_key, authorization), Priority.BATCH)
+    gen = _make_gen(payload)
+    if payload.stream:
+        async def lines() -> AsyncIterator[str]:
+            async for item in client.iter_chat_many(payload.messages, concurrency=payload.concurrency, gen=gen):
+                yield json.dumps(_batch_item_out(item).model_dump(), ensure_ascii=False) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    items = await _cancel_on_disconnect(request, client.chat_many(payload.messages, concurrency=payload.concurrency, gen=gen))
+    return ChatBatchOut(results=[_batch_item_out(item) for item in items])
+
+
+@app.post("/sessions", response_model=SessionOut)
+async def create_session(payload: SessionIn) -> SessionOut:
+    """Новая сессия диалога; история хранится на сервере и обрезается по ``max_context_tokens``."""
+    session = ServerSession(
+        system_prompt=payload.system_prompt,
+        max_context_tokens=payload.max_context_tokens,
+        keep_alive=payload.keep_alive,
+        json_output=payload.json_output,
+        backend=payload,
+        pooled=_pooled(payload),
+    )
+    await _session_store().aadd(session)
+    return _session_out(session)
+
+
+@app.get("/sessions/{session_id}", response_model=SessionOut)
+async def get_session(session_id: str) -> SessionOut:
+    return _session_out(await _get_session(session_id))
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str) -> Dict[str, bool]:
+    if not await _session_store().adelete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    return {"deleted": True}
+
+
+@app.post("/sessions/{session_id}/chat", response_model=ChatOut)
+async def session_chat(
+    request: Request,
+    session_id: str,
+    payload: SessionTurnIn,
+    x_api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> ChatOut:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = _session_locks[session_id] = asyncio.Lock()
+    # блокировка — между запросами этого воркера, turn — между воркерами (с общим хранилищем)
+    try:
+        async with lock, _session_store().turn(session_id):
+            # под блокировкой: из общего хранилища читается копия с историей предыдущего хода
+            session = await _get_session(session_id)
+            try:
+                client = _make_client(session.backend, _client_key(x_api_key, authorization), pooled=session.pooled)
+                result = await _cancel_on_disconnect(request, client.chat_session(session, payload.message, gen=_make_gen(session.backend)))
+            except Exception as e:
+                raise _http_error(e)
+            # общему хранилищу нужна явная запись изменённой истории
+            await _session_store().aadd(session)
+    except SessionBusy as e:
+        raise _http_error(e)
+    return _chat_out(result)
+
+
+@app.get("/cache/stats", response_model=CacheStats)
+async def cache_stats() -> CacheStats:
+    return get_response_cache().stats()
+
+
+@app.get("/backends")
+async def backends() -> List[Dict[str, Any]]:
+    """Состояние реплик пула (GPTOSS_BACKENDS): нагрузка, EWMA задержки, circuit breaker, health-check."""
+    pool = get_backend_pool()
+    return pool.status() if pool is not None else []
+
+
+@app.get("/admission")
+async def admission() -> Dict[str, Any]:
+    """Состояние admission control по бэкендам: занятые слоты, очередь по приоритетам, среднее время генерации."""
+    if _admission is None:
+        return {}
+    shared = _admission.shared
+    # занятые всеми воркерами слоты читаются из общего файла в его потоке, не в event loop
+    leases = await shared.call(shared.leases) if shared is not None else None
+    return _admission.status(leases)
+
+
+@app.get("/capabilities", response_model=Dict[str, BackendCapabilities])
+async def capabilities() -> Dict[str, BackendCapabilities]:
+    """Что известно о возможностях бэкендов (``response_format``, usage в стриме, модели)."""
+    return CAPABILITIES.snapshot()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.expose(), media_type=CONTENT_TYPE)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Type
+
+from pydantic import BaseModel, Field
+
+from .schema import ChatResult, Message
+from .shared import SharedState
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка без токенизатора: ~4 символа на токен."""
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Message) -> int:
+    # +4 — служебные токены роли/разметки сообщения
+    return estimate_tokens(message.content) + 4
+
+
+class Session(BaseModel):
+    """Многоходовый диалог: системный промпт и история, обрезаемая по бюджету токенов.
+
+    Префикс сообщений меняется только при обрезке, поэтому между обрезками каждый ход
+    начинается с тех же байтов, что и предыдущий, — prefix cache vLLM и KV-кэш Ollama
+    не пересчитывают историю. Обрезка идёт сразу до ``truncate_to`` бюджета (гистерезис),
+    чтобы префикс не сдвигался на каждом ходу.
+    """
+
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    system_prompt: Optional[str] = None
+    messages: List[Message] = []
+    max_context_tokens: int = 8192
+    truncate_to: float = 0.5
+    keep_alive: Optional[str] = "30m"
+    json_output: bool = False
+    truncations: int = 0
+    created_at: float = Field(default_factory=time.time)
+    updated_at: float = Field(default_factory=time.time)
+
+    def history_tokens(self) -> int:
+        return sum(message_tokens(m) for m in self.messages)
+
+    def build_messages(self, system: str, user_prompt: str, reserve_tokens: int = 0) -> List[Message]:
+        """Сообщения для очередного хода; при превышении бюджета старые ходы отбрасываются (в самой сессии)."""
+        user = Message(role="user", content=user_prompt)
+        fixed = message_tokens(Message(role="system", content=system)) + message_tokens(user) + reserve_tokens
+        budget = self.max_context_tokens - fixed
+        if self.history_tokens() > budget:
+            self._truncate(int(budget * self.truncate_to))
+        return [Message(role="system", content=system), *self.messages, user]
+
+    def _truncate(self, target: int) -> None:
+        total = self.history_tokens()
+        start = 0
+        # отбрасываем целые ходы (user + ответы ассистента), чтобы история начиналась с реплики пользователя
+        while start < len(self.messages) and total > target:
+            total -= message_tokens(self.messages[start])
+            start += 1
+            while start < len(self.messages) and self.messages[start].role != "user":
+                total -= message_tokens(self.messages[start])
+                start += 1
+        self.messages = self.messages[start:]
+        self.truncations += 1
+
+    def record(self, user_prompt: str, result: ChatResult) -> None:
+        """Добавляет ход в историю. Рассуждения прошлых ходов модели не нужны — хранится только финальный ответ
+        в том же формате, которого требует системный промпт."""
+        final = result.final_answer or ""
+        if self.json_output:
+            content = json.dumps({"reasoning": "", "final": final}, ensure_ascii=False)
+        else:
+            content = f"<final>{final}</final>"
+        self.messages.append(Message(role="user", content=user_prompt))
+        self.messages.append(Message(role="assistant", content=content))
+        self.updated_at = time.time()
+
+
+class SessionBusy(RuntimeError):
+    """Ход не начался: предыдущий ход той же сессии не закончился за отведённое время (сервер отвечает 409)."""
+
+
+class SessionStore:
+    """Сессии в памяти: LRU по числу сессий и TTL бездействия (память ограничена)."""
+
+    def __init__(self, max_sessions: int = 1000, ttl: Optional[float] = 3600.0) -> None:
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, session: Session, now: float) -> bool:
+        return self.ttl is not None and session.updated_at + self.ttl <= now
+
+    def add(self, session: Session) -> Session:
+        with self._lock:
+            self._data[session.id] = session
+            self._data.move_to_end(session.id)
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+        return session
+
+    @asynccontextmanager
+    async def turn(self, session_id: str) -> AsyncIterator[None]:
+        """Ход сессии; в одном процессе ходы упорядочивает вызывающий код, здесь ждать нечего."""
+        yield
+
+    # async-версии — общий интерфейс с SharedSessionStore; в памяти ждать нечего
+    async def aadd(self, session: Session) -> Session:
+        return self.add(session)
+
+    async def aget(self, session_id: str) -> Optional[Session]:
+        return self.get(session_id)
+
+    async def adelete(self, session_id: str) -> bool:
+        return self.delete(session_id)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        now = time.time()
+        with self._lock:
+            session = self._data.get(session_id)
+            if session is None:
+                return None
+            if self._expired(session, now):
+                del self._data[session_id]
+                return None
+            self._data.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._data.pop(session_id, None) is not None
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, s in self._data.items() if self._expired(s, now)]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+
+class SharedSessionStore:
+    """Сессии в общем файле воркеров (``gptoss serve --workers N``): следующий ход может прийти в любой процесс.
+
+    ``get`` возвращает копию — изменённую сессию нужно снова сохранить через ``add``. Чтение и запись хода
+    выполняются внутри ``turn``: иначе ходы одной сессии в разных воркерах затрут историю друг друга.
+    """
+
+    def __init__(
+        self,
+        shared: SharedState,
+        model: Type[Session] = Session,
+        max_sessions: int = 1000,
+        ttl: Optional[float] = 3600.0,
+        turn_timeout: float = 300.0,
+    ) -> None:
+        self.shared = shared
+        self.model = model
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.turn_timeout = turn_timeout
+
+    def __len__(self) -> int:
+        return self.shared.count_sessions()
+
+    def add(self, session: Session) -> Session:
+        self.shared.put_session(session.id, session.model_dump_json(), session.updated_at, self.max_sessions)
+        return session
+
+    @asynccontextmanager
+    async def turn(self, session_id: str) -> AsyncIterator[None]:
+        """Ход сессии во всех воркерах по очереди: аренда ``session:<id>`` в общем файле на время блока.
+
+        Если предыдущий ход не освободил сессию за ``turn_timeout`` секунд — ``SessionBusy``.
+        """
+        lease = await self.shared.wait_lease(f"session:{session_id}", 1, time.monotonic() + self.turn_timeout)
+        if lease is None:
+            raise SessionBusy(f"Session {session_id} is busy with another turn")
+        try:
+            yield
+        finally:
+            await self.shared.call(self.shared.release_lease, lease)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        row = self.shared.get_session(session_id)
+        if row is None:
+            return None
+        value, updated_at = row
+        if self.ttl is not None and updated_at + self.ttl <= time.time():
+            self.shared.delete_session(session_id)
+            return None
+        return self.model.model_validate_json(value)
+
+    def delete(self, session_id: str) -> bool:
+        return self.shared.delete_session(session_id)
+
+    def purge_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        return self.shared.purge_sessions(time.time() - self.ttl)
+
+    # для event loop: SQLite (и ``BEGIN IMMEDIATE`` при записи) — в потоке SharedState
+    async def aadd(self, session: Session) -> Session:
+        return await self.shared.call(self.add, session)
+
+    async def aget(self, session_id: str) -> Optional[Session]:
+        return await self.shared.call(self.get, session_id)
+
+    async def adelete(self, session_id: str) -> bool:
+        return await self.shared.call(self.delete, session_id)
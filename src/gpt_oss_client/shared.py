@@ -0,0 +1,218 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS leases (id INTEGER PRIMARY KEY, lane TEXT NOT NULL, pid INTEGER NOT NULL, acquired REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS leases_lane ON leases (lane)",
+    "CREATE TABLE IF NOT EXISTS capabilities (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)",
+)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedState:
+    """Состояние, общее для воркеров ``gptoss serve --workers N``: один SQLite-файл в режиме WAL.
+
+    Хранит слоты на генерацию (аренды с pid владельца: аренды упавшего воркера освобождаются),
+    выученные возможности бэкендов и сессии. Транзакции короткие (``BEGIN IMMEDIATE``), поэтому
+    блокировка файла между воркерами не ждётся дольше ``timeout``. Из асинхронного кода методы вызываются
+    через ``call``/``submit``: это ожидание не останавливает event loop.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0) -> None:
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        # свой поток, а не общий пул asyncio.to_thread: ожидание файла не занимает потоки остального сервера,
+        # а вызовы из event loop выполняются в порядке отправки
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gptoss-shared")
+        # isolation_level=None: транзакциями управляем сами
+        self._conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedState"]:
+        """Включается GPTOSS_SHARED_STATE (путь к файлу; ``gptoss serve --workers N`` задаёт его сам)."""
+        path = os.getenv("GPTOSS_SHARED_STATE")
+        return cls(path) if path else None
+
+    def submit(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        """Ставит вызов метода в очередь потока общего состояния, не дожидаясь результата."""
+        return self._executor.submit(fn, *args)
+
+    def defer(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        """Из event loop — как ``submit``; из обычного кода — вызов сразу, результат в уже готовом ``Future``."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            future: "Future[T]" = Future()
+            future.set_result(fn(*args))
+            return future
+        return self.submit(fn, *args)
+
+    async def call(self, fn: Callable[..., T], *args: Any) -> T:
+        """Вызывает метод в потоке общего состояния и ждёт результат, не блокируя event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE: блокировка на запись берётся сразу, чтение и запись внутри не пересекаются с другими воркерами
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # --- слоты на генерацию ---
+
+    def try_lease(self, lane: str, limit: int) -> Optional[int]:
+        """Занимает слот ``lane``, если занято меньше ``limit``; ``None`` — свободных слотов нет."""
+        with self._transaction() as conn:
+            (held,) = conn.execute("SELECT COUNT(*) FROM leases WHERE lane = ?", (lane,)).fetchone()
+            if held >= limit:
+                return None
+            return conn.execute("INSERT INTO leases (lane, pid, acquired) VALUES (?, ?, ?)", (lane, self.pid, time.time())).lastrowid
+
+    async def atry_lease(self, lane: str, limit: int) -> Optional[int]:
+        """``try_lease`` в потоке общего состояния; слот, взятый уже после отмены ожидания, освобождается."""
+        future = self.submit(self.try_lease, lane, limit)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            def drop(done: "Future[Optional[int]]") -> None:
+                if not done.cancelled() and done.exception() is None and done.result() is not None:
+                    self.submit(self.release_lease, done.result())
+
+            future.add_done_callback(drop)
+            raise
+
+    async def wait_lease(self, lane: str, limit: int, deadline: Optional[float] = None) -> Optional[int]:
+        """Ждёт слот ``lane`` с нарастающим интервалом опроса; ``None`` — не дождались до ``deadline`` (``time.monotonic``)."""
+        delay = 0.005
+        while True:
+            lease = await self.atry_lease(lane, limit)
+            if lease is not None:
+                return lease
+            # на каждом круге: владелец слота мог упасть и во время ожидания
+            if await self.call(self.reap):
+                continue
+            if deadline is not None and time.monotonic() + delay > deadline:
+                return None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release_lease(self, lease: int) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+    def reap(self) -> int:
+        """Освобождает слоты завершившихся воркеров; возвращает их число."""
+        with self._lock:
+            pids = [pid for (pid,) in self._conn.execute("SELECT DISTINCT pid FROM leases")]
+        dead = [pid for pid in pids if pid != self.pid and not _alive(pid)]
+        if not dead:
+            return 0
+        with self._transaction() as conn:
+            return conn.execute(f"DELETE FROM leases WHERE pid IN ({','.join('?' * len(dead))})", dead).rowcount
+
+    def leases(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT lane, COUNT(*) FROM leases GROUP BY lane").fetchall())
+
+    # --- возможности бэкендов ---
+
+    def capabilities(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM capabilities").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def merge_capabilities(self, key: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Обновляет поля записи ``key`` поверх уже известного другими воркерами; возвращает итог."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM capabilities WHERE key = ?", (key,)).fetchone()
+            merged = {**(json.loads(row[0]) if row else {}), **fields}
+            conn.execute(
+                "INSERT OR REPLACE INTO capabilities (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(merged, ensure_ascii=False), time.time()),
+            )
+        return merged
+
+    def forget_capabilities(self, key: Optional[str] = None) -> None:
+        with self._transaction() as conn:
+            if key is None:
+                conn.execute("DELETE FROM capabilities")
+            else:
+                conn.execute("DELETE FROM capabilities WHERE key = ?", (key,))
+
+    # --- сессии ---
+
+    def get_session(self, session_id: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._conn.execute("SELECT value, updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+
+    def put_session(self, session_id: str, value: str, updated_at: float, max_sessions: int) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (id, value, updated_at) VALUES (?, ?, ?)", (session_id, value, updated_at))
+            # вытесняем давно не использованные сверх лимита
+            conn.execute("DELETE FROM sessions WHERE id NOT IN (SELECT id FROM sessions ORDER BY updated_at DESC LIMIT ?)", (max_sessions,))
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def purge_sessions(self, before: float) -> int:
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (before,)).rowcount
+
+    def count_sessions(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+_shared: Optional[SharedState] = None
+_shared_loaded = False
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """Общее состояние процесса (GPTOSS_SHARED_STATE), одно на процесс; ``None`` — сервер работает в одном процессе."""
+    global _shared, _shared_loaded
+    if not _shared_loaded:
+        _shared = SharedState.from_env()
+        _shared_loaded = True
+    return _shared
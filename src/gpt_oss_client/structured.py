@@ -0,0 +1,640 @@
+from __future__ import annotations
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, ValidationError
+
+from .metrics import Counter
+
+
+# Структурированный вывод по схеме пользователя: JSON Schema (или pydantic-модель) компилируется один раз
+# в дерево узлов-проверок и кэшируется по sha256 канонической схемы. Поддерживается подмножество JSON Schema,
+# которое генерируют pydantic и типичные клиенты: type, enum, const, properties, required, additionalProperties,
+# items/prefixItems, min/max(Length|Items), minimum/maximum (в т.ч. exclusive), pattern, anyOf/oneOf/allOf, $ref.
+
+SCHEMA_VIOLATIONS = Counter("gptoss_schema_violations", "Model outputs rejected by the requested JSON Schema", ("stage",))
+
+SchemaLike = Union[Dict[str, Any], Type[BaseModel]]
+
+_MAX_ERRORS = 10
+
+
+class StructuredOutputError(ValueError):
+    """Вывод модели не соответствует схеме (или не является JSON)."""
+
+    def __init__(self, errors: List[str], text: str = "") -> None:
+        super().__init__("Model output does not match the JSON Schema: " + "; ".join(errors[:3]))
+        self.errors = errors
+        self.text = text
+
+
+_TYPE_OF = {dict: "object", list: "array", str: "string", bool: "boolean", type(None): "null"}
+
+
+def _json_type(value: Any) -> str:
+    kind = _TYPE_OF.get(type(value))
+    if kind is not None:
+        return kind
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "integer" if value.is_integer() else "number"
+    return type(value).__name__
+
+
+def _type_ok(types: Optional[frozenset], kind: str) -> bool:
+    return types is None or kind in types or (kind == "integer" and "number" in types)
+
+
+class _Node:
+    """Скомпилированный узел схемы."""
+
+    __slots__ = (
+        "types", "enum", "const", "has_const", "properties", "required", "additional", "items", "prefix_items",
+        "min_length", "max_length", "pattern", "minimum", "maximum", "exclusive_minimum", "exclusive_maximum",
+        "min_items", "max_items", "any_of", "all_of", "ref", "target",
+    )
+
+    def __init__(self) -> None:
+        self.types: Optional[frozenset] = None
+        self.enum: Optional[List[Any]] = None
+        self.const: Any = None
+        self.has_const = False
+        self.properties: Dict[str, _Node] = {}
+        self.required: Tuple[str, ...] = ()
+        # True — любые лишние ключи, False — запрещены, _Node — по схеме
+        self.additional: Union[bool, _Node] = True
+        self.items: Optional[_Node] = None
+        self.prefix_items: List[_Node] = []
+        self.min_length: Optional[int] = None
+        self.max_length: Optional[int] = None
+        self.pattern: Optional[re.Pattern] = None
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.exclusive_minimum: Optional[float] = None
+        self.exclusive_maximum: Optional[float] = None
+        self.min_items: Optional[int] = None
+        self.max_items: Optional[int] = None
+        self.any_of: List[_Node] = []
+        self.all_of: List[_Node] = []
+        self.ref: Optional[str] = None
+        self.target: Optional[_Node] = None
+
+    def resolve(self) -> "_Node":
+        node = self
+        while node.target is not None:
+            node = node.target
+        return node
+
+
+_ANY = _Node()
+
+
+class _Compiler:
+    def __init__(self, root: Dict[str, Any]) -> None:
+        self.root = root
+        self.refs: Dict[str, _Node] = {}
+
+    def compile(self, schema: Any) -> _Node:
+        if schema is True or schema == {}:
+            return _ANY
+        if not isinstance(schema, dict):
+            raise ValueError(f"unsupported schema: {schema!r}")
+        node = _Node()
+        ref = schema.get("$ref")
+        if isinstance(ref, str):
+            node.ref = ref
+            node.target = self._ref(ref)
+            return node
+        kind = schema.get("type")
+        if isinstance(kind, str):
+            node.types = frozenset([kind])
+        elif isinstance(kind, list):
+            node.types = frozenset(kind)
+        if "enum" in schema:
+            node.enum = list(schema["enum"])
+        if "const" in schema:
+            node.const, node.has_const = schema["const"], True
+        node.properties = {k: self.compile(v) for k, v in (schema.get("properties") or {}).items()}
+        node.required = tuple(schema.get("required") or ())
+        additional = schema.get("additionalProperties", True)
+        node.additional = additional if isinstance(additional, bool) else self.compile(additional)
+        items = schema.get("items")
+        if isinstance(items, list):
+            node.prefix_items = [self.compile(s) for s in items]
+        elif items is not None:
+            node.items = self.compile(items)
+        if "prefixItems" in schema:
+            node.prefix_items = [self.compile(s) for s in schema["prefixItems"]]
+        node.min_length = schema.get("minLength")
+        node.max_length = schema.get("maxLength")
+        if "pattern" in schema:
+            node.pattern = re.compile(schema["pattern"])
+        node.minimum = schema.get("minimum")
+        node.maximum = schema.get("maximum")
+        # draft 4: exclusiveMinimum/exclusiveMaximum — флаги к minimum/maximum
+        if schema.get("exclusiveMinimum") is True:
+            node.exclusive_minimum, node.minimum = node.minimum, None
+        elif isinstance(schema.get("exclusiveMinimum"), (int, float)):
+            node.exclusive_minimum = schema["exclusiveMinimum"]
+        if schema.get("exclusiveMaximum") is True:
+            node.exclusive_maximum, node.maximum = node.maximum, None
+        elif isinstance(schema.get("exclusiveMaximum"), (int, float)):
+            node.exclusive_maximum = schema["exclusiveMaximum"]
+        node.min_items = schema.get("minItems")
+        node.max_items = schema.get("maxItems")
+        # oneOf проверяется как anyOf: для вывода модели достаточно совпадения хотя бы с одной веткой
+        node.any_of = [self.compile(s) for s in (schema.get("anyOf") or schema.get("oneOf") or [])]
+        node.all_of = [self.compile(s) for s in (schema.get("allOf") or [])]
+        return node
+
+    def _ref(self, ref: str) -> _Node:
+        node = self.refs.get(ref)
+        if node is not None:
+            return node
+        if not ref.startswith("#"):
+            raise ValueError(f"only local $ref is supported: {ref}")
+        # заглушка до компиляции — для рекурсивных схем
+        placeholder = self.refs[ref] = _Node()
+        target: Any = self.root
+        for part in ref[1:].lstrip("/").split("/") if ref != "#" else []:
+            target = target[part.replace("~1", "/").replace("~0", "~")]
+        placeholder.target = self.compile(target)
+        return placeholder
+
+
+def _check(value: Any, node: _Node, path: str, errors: List[str]) -> None:
+    node = node.resolve()
+    if node is _ANY or len(errors) >= _MAX_ERRORS:
+        return
+    kind = _json_type(value)
+    if not _type_ok(node.types, kind):
+        errors.append(f"{path or '$'}: expected {'/'.join(sorted(node.types or ()))}, got {kind}")
+        return
+    if node.enum is not None and value not in node.enum:
+        errors.append(f"{path or '$'}: {value!r} is not one of {node.enum!r}")
+    if node.has_const and value != node.const:
+        errors.append(f"{path or '$'}: expected {node.const!r}")
+    if kind == "string":
+        if node.min_length is not None and len(value) < node.min_length:
+            errors.append(f"{path or '$'}: shorter than {node.min_length}")
+        if node.max_length is not None and len(value) > node.max_length:
+            errors.append(f"{path or '$'}: longer than {node.max_length}")
+        if node.pattern is not None and node.pattern.search(value) is None:
+            errors.append(f"{path or '$'}: does not match {node.pattern.pattern!r}")
+    elif kind in ("integer", "number"):
+        if node.minimum is not None and value < node.minimum:
+            errors.append(f"{path or '$'}: less than {node.minimum}")
+        if node.maximum is not None and value > node.maximum:
+            errors.append(f"{path or '$'}: greater than {node.maximum}")
+        if node.exclusive_minimum is not None and value <= node.exclusive_minimum:
+            errors.append(f"{path or '$'}: not greater than {node.exclusive_minimum}")
+        if node.exclusive_maximum is not None and value >= node.exclusive_maximum:
+            errors.append(f"{path or '$'}: not less than {node.exclusive_maximum}")
+    elif kind == "object":
+        for key in node.required:
+            if key not in value:
+                errors.append(f"{path or '$'}: missing required property {key!r}")
+        for key, item in value.items():
+            child = node.properties.get(key)
+            if child is None:
+                if node.additional is False:
+                    errors.append(f"{path or '$'}: unexpected property {key!r}")
+                    continue
+                child = node.additional if isinstance(node.additional, _Node) else _ANY
+            _check(item, child, f"{path}.{key}" if path else key, errors)
+    elif kind == "array":
+        if node.min_items is not None and len(value) < node.min_items:
+            errors.append(f"{path or '$'}: fewer than {node.min_items} items")
+        if node.max_items is not None and len(value) > node.max_items:
+            errors.append(f"{path or '$'}: more than {node.max_items} items")
+        for i, item in enumerate(value):
+            child = node.prefix_items[i] if i < len(node.prefix_items) else (node.items or _ANY)
+            _check(item, child, f"{path}[{i}]", errors)
+    if node.any_of and not any(not _errors(value, branch, path) for branch in node.any_of):
+        errors.append(f"{path or '$'}: does not match any of the allowed schemas")
+    for branch in node.all_of:
+        _check(value, branch, path, errors)
+
+
+def _errors(value: Any, node: _Node, path: str = "") -> List[str]:
+    errors: List[str] = []
+    _check(value, node, path, errors)
+    return errors
+
+
+def split_json(text: str, openers: str = "{[") -> Tuple[Optional[str], str]:
+    """(текст до JSON, JSON) — модели без принудительного формата пишут рассуждение до объекта и теги после.
+
+    Скобки в рассуждении («см. [1]») пропускаются: JSON начинается с первой скобки из ``openers``, с которой
+    значение разбирается целиком. Если не разобралось ни одно — текст с первой скобки (проверка схемы покажет ошибку).
+    """
+    first: Optional[int] = None
+    pos = 0
+    while True:
+        starts = [i for i in (text.find(ch, pos) for ch in openers) if i >= 0]
+        if not starts:
+            break
+        start = min(starts)
+        if first is None:
+            first = start
+        try:
+            _, end = _DECODER.raw_decode(text, start)
+        except json.JSONDecodeError as e:
+            if e.msg.startswith("Unterminated string"):
+                # ответ обрезан: всё дальше — содержимое этой строки, а не новое значение
+                break
+            # до места ошибки текст разобрался как часть этого значения — вложенные скобки не пробуем
+            pos = max(start + 1, e.pos)
+            continue
+        return text[:start].strip() or None, text[start:end].strip()
+    if first is None:
+        return None, text.strip()
+    return text[:first].strip() or None, text[first:].strip()
+
+
+_DECODER = json.JSONDecoder()
+
+
+class OutputSchema:
+    """Скомпилированная схема ответа; получать через ``compile_schema`` (кэш по хэшу)."""
+
+    def __init__(self, schema: Dict[str, Any], model: Optional[Type[BaseModel]] = None) -> None:
+        self.schema = schema
+        self.model = model
+        self.hash = schema_hash(schema)
+        self.name = re.sub(r"[^a-zA-Z0-9_-]", "_", str(schema.get("title") or "response"))[:64]
+        self.root = _Compiler(schema).compile(schema)
+
+    @property
+    def openers(self) -> str:
+        """С каких символов может начинаться ответ — по ``type`` верхнего уровня схемы."""
+        kind = self.schema.get("type")
+        return {"object": "{", "array": "["}.get(kind, "{[") if isinstance(kind, str) else "{["
+
+    def errors(self, value: Any) -> List[str]:
+        return _errors(value, self.root)
+
+    def parse(self, text: str) -> Any:
+        """JSON-текст → проверенное значение (экземпляр модели, если схема задана pydantic-моделью)."""
+        try:
+            value = json.loads(text)
+        except ValueError as e:
+            SCHEMA_VIOLATIONS.labels("final").inc()
+            raise StructuredOutputError([f"invalid JSON: {e}"], text)
+        errors = self.errors(value)
+        if errors:
+            SCHEMA_VIOLATIONS.labels("final").inc()
+            raise StructuredOutputError(errors, text)
+        if self.model is None:
+            return value
+        try:
+            return self.model.model_validate(value)
+        except ValidationError as e:
+            # ограничения модели, которых нет в JSON Schema (валидаторы полей и т.п.)
+            SCHEMA_VIOLATIONS.labels("final").inc()
+            raise StructuredOutputError([f"{'.'.join(map(str, err['loc'])) or '$'}: {err['msg']}" for err in e.errors()], text)
+
+    def response_format(self) -> Dict[str, Any]:
+        """``response_format`` для OpenAI-совместимых серверов (vLLM, LM Studio, llama.cpp)."""
+        return {"type": "json_schema", "json_schema": {"name": self.name, "schema": self.schema}}
+
+
+def schema_hash(schema: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+_cache: "OrderedDict[str, OutputSchema]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 256
+
+
+def compile_schema(schema: SchemaLike) -> OutputSchema:
+    """Скомпилированная схема из кэша (ключ — sha256 канонического JSON); pydantic-модель превращается в её JSON Schema.
+
+    Схема, впервые скомпилированная из модели, помнит модель: последующие вызовы с той же схемой-словарём
+    (например, из ``GenerationParams.json_schema``) возвращают экземпляры модели.
+    """
+    model: Optional[Type[BaseModel]] = None
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        model, schema = schema, schema.model_json_schema()
+    if not isinstance(schema, dict):
+        raise TypeError("json_schema must be a dict or a pydantic model class")
+    key = schema_hash(schema)
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            if model is not None and compiled.model is None:
+                compiled.model = model
+            return compiled
+    compiled = OutputSchema(schema, model)
+    with _cache_lock:
+        compiled = _cache.setdefault(key, compiled)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+# --- инкрементальная проверка стрима ---
+
+_OBJ_KEY_OR_END, _OBJ_KEY, _OBJ_COLON, _OBJ_VALUE, _OBJ_COMMA_OR_END = range(5)
+_ARR_VALUE_OR_END, _ARR_VALUE, _ARR_COMMA_OR_END = range(5, 8)
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+_WS = frozenset(" \t\r\n")
+
+
+class _Frame:
+    __slots__ = ("node", "is_object", "state", "keys", "key", "count")
+
+    def __init__(self, node: _Node, is_object: bool) -> None:
+        self.node = node
+        self.is_object = is_object
+        self.state = _OBJ_KEY_OR_END if is_object else _ARR_VALUE_OR_END
+        self.keys: set = set()
+        self.key = ""
+        self.count = 0
+
+
+class IncrementalValidator:
+    """Проверяет JSON по мере поступления текста: синтаксис, типы значений, лишние и обязательные ключи,
+    скаляры целиком (enum, диапазоны, длины). Первое нарушение — ``StructuredOutputError`` сразу, не дожидаясь
+    конца генерации. ``complete`` — значение верхнего уровня закрыто; ``close`` проверяет документ целиком.
+    """
+
+    def __init__(self, schema: OutputSchema) -> None:
+        self.schema = schema
+        self.complete = False
+        self._stack: List[_Frame] = []
+        self._root_started = False
+        self._token: Optional[str] = None  # "string" | "key" | "number" | "literal"
+        self._buf: List[str] = []
+        self._escape = False
+        self._scalar_node: _Node = schema.root
+        self._text: List[str] = []
+        self.offset = 0
+
+    def _fail(self, message: str) -> None:
+        SCHEMA_VIOLATIONS.labels("stream").inc()
+        raise StructuredOutputError([f"at char {self.offset}: {message}"], "".join(self._text))
+
+    def _path(self) -> str:
+        return ".".join(f.key if f.is_object else str(f.count) for f in self._stack) or "$"
+
+    def _child_node(self) -> _Node:
+        """Узел схемы для значения, которое начинается сейчас."""
+        if not self._stack:
+            return self.schema.root
+        frame = self._stack[-1]
+        node = frame.node
+        if node is _ANY:
+            return _ANY
+        if frame.is_object:
+            child = node.properties.get(frame.key)
+            if child is not None:
+                return child
+            return node.additional if isinstance(node.additional, _Node) else _ANY
+        if frame.count < len(node.prefix_items):
+            return node.prefix_items[frame.count]
+        return node.items or _ANY
+
+    def _narrow(self, node: _Node, kind: str) -> _Node:
+        """Проверка типа в начале значения; для anyOf — выбор единственной подходящей ветки."""
+        node = node.resolve()
+        if node is _ANY:
+            return node
+        if not _type_ok(node.types, kind) and not (kind == "number" and _type_ok(node.types, "integer")):
+            self._fail(f"{self._path()}: expected {'/'.join(sorted(node.types or ()))}, got {kind}")
+        if node.any_of:
+            branches = [b for b in (x.resolve() for x in node.any_of) if b is _ANY or _type_ok(b.types, kind) or (kind == "number" and _type_ok(b.types, "integer"))]
+            if not branches:
+                self._fail(f"{self._path()}: {kind} does not match any of the allowed schemas")
+            # несколько веток одного типа уточнит полная проверка в close()
+            return branches[0] if len(branches) == 1 and not node.properties and not node.all_of else _ANY
+        return node
+
+    def _value_done(self) -> None:
+        if not self._stack:
+            self.complete = True
+            return
+        frame = self._stack[-1]
+        if frame.is_object:
+            frame.state = _OBJ_COMMA_OR_END
+        else:
+            frame.count += 1
+            node = frame.node.resolve()
+            if node is not _ANY and node.max_items is not None and frame.count > node.max_items:
+                self._fail(f"{self._path()}: more than {node.max_items} items")
+            frame.state = _ARR_COMMA_OR_END
+
+    def _scalar(self, value: Any) -> None:
+        errors = _errors(value, self._scalar_node, self._path())
+        if errors:
+            self._fail(errors[0])
+        self._value_done()
+
+    def _start_value(self, ch: str) -> None:
+        node = self._child_node()
+        if ch == "{":
+            self._stack.append(_Frame(self._narrow(node, "object"), True))
+        elif ch == "[":
+            self._stack.append(_Frame(self._narrow(node, "array"), False))
+        elif ch == '"':
+            self._scalar_node = self._narrow(node, "string")
+            self._token, self._buf = "string", []
+        elif ch in _LITERALS:
+            self._scalar_node = self._narrow(node, "boolean" if ch != "n" else "null")
+            self._token, self._buf = "literal", [ch]
+        elif ch == "-" or ch.isdigit():
+            self._scalar_node = self._narrow(node, "number")
+            self._token, self._buf = "number", [ch]
+        else:
+            self._fail(f"unexpected {ch!r}, expected a JSON value")
+
+    def _end_container(self) -> None:
+        frame = self._stack.pop()
+        node = frame.node.resolve()
+        if node is not _ANY:
+            if frame.is_object:
+                missing = [k for k in node.required if k not in frame.keys]
+                if missing:
+                    self._stack.append(frame)
+                    self._fail(f"{self._path()}: missing required property {missing[0]!r}")
+            elif node.min_items is not None and frame.count < node.min_items:
+                self._stack.append(frame)
+                self._fail(f"{self._path()}: fewer than {node.min_items} items")
+        self._value_done()
+
+    def _finish_number(self) -> None:
+        text = "".join(self._buf)
+        self._token = None
+        try:
+            value: Any = int(text) if re.fullmatch(r"-?(0|[1-9]\d*)", text) else float(text)
+        except ValueError:
+            self._fail(f"invalid number {text!r}")
+        if isinstance(value, float) and not math.isfinite(value):
+            self._fail(f"invalid number {text!r}")
+        self._scalar(value)
+
+    def feed(self, text: str) -> int:
+        """Проверяет очередной фрагмент; возвращает, сколько его символов относится к JSON-значению.
+
+        После конца значения текст не читается (как в ``split_json``: теги и пояснения после JSON не ошибка).
+        """
+        used = len(text)
+        for i, ch in enumerate(text):
+            if self.complete:
+                used = i
+                break
+            self.offset += 1
+            token = self._token
+            if token == "string" or token == "key":
+                if self._escape:
+                    self._escape = False
+                    self._buf.append("\\" + ch)
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._token = None
+                    try:
+                        value = json.loads('"' + "".join(self._buf) + '"')
+                    except ValueError:
+                        self._fail("invalid string escape")
+                    if token == "key":
+                        self._key(value)
+                    else:
+                        self._scalar(value)
+                elif ch < " ":
+                    self._fail("control character in string")
+                else:
+                    self._buf.append(ch)
+                continue
+            if token == "number":
+                if ch in _NUMBER_CHARS:
+                    self._buf.append(ch)
+                    continue
+                self._finish_number()
+                if self.complete:
+                    # число верхнего уровня закончилось на этом символе, сам символ уже не JSON
+                    self.offset -= 1
+                    used = i
+                    break
+            elif token == "literal":
+                self._buf.append(ch)
+                word = "".join(self._buf)
+                expected = _LITERALS[word[0]]
+                if not expected.startswith(word):
+                    self._fail(f"invalid literal {word!r}")
+                if word == expected:
+                    self._token = None
+                    self._scalar({"true": True, "false": False, "null": None}[word])
+                continue
+            self._structural(ch)
+        self._text.append(text[:used])
+        return used
+
+    def _key(self, key: str) -> None:
+        frame = self._stack[-1]
+        node = frame.node.resolve()
+        if node is not _ANY and node.additional is False and key not in node.properties:
+            self._fail(f"{self._path()}: unexpected property {key!r}")
+        frame.key = key
+        frame.keys.add(key)
+        frame.state = _OBJ_COLON
+
+    def _structural(self, ch: str) -> None:
+        if ch in _WS:
+            return
+        if self.complete:
+            self._fail(f"unexpected {ch!r} after the end of the JSON value")
+        if not self._stack:
+            self._root_started = True
+            self._start_value(ch)
+            return
+        frame = self._stack[-1]
+        state = frame.state
+        if state == _OBJ_KEY_OR_END and ch == "}":
+            self._end_container()
+        elif state in (_OBJ_KEY_OR_END, _OBJ_KEY) and ch == '"':
+            self._token, self._buf = "key", []
+        elif state == _OBJ_COLON and ch == ":":
+            frame.state = _OBJ_VALUE
+        elif state == _OBJ_COMMA_OR_END and ch == ",":
+            frame.state = _OBJ_KEY
+        elif state == _OBJ_COMMA_OR_END and ch == "}":
+            self._end_container()
+        elif state == _ARR_VALUE_OR_END and ch == "]":
+            self._end_container()
+        elif state == _ARR_COMMA_OR_END and ch == ",":
+            frame.state = _ARR_VALUE
+        elif state == _ARR_COMMA_OR_END and ch == "]":
+            self._end_container()
+        elif state in (_OBJ_VALUE, _ARR_VALUE_OR_END, _ARR_VALUE):
+            self._start_value(ch)
+        else:
+            self._fail(f"unexpected {ch!r}")
+
+    def close(self) -> Any:
+        """Конец стрима: документ должен быть закончен; возвращает проверенное значение целиком."""
+        if self._token == "number":
+            self._finish_number()
+        if not self.complete:
+            self._fail("JSON value is incomplete")
+        return self.schema.parse("".join(self._text).strip())
+
+
+class SchemaStreamParser:
+    """Потоковый парсер для ``json_schema``: тот же интерфейс, что у ``HarmonyStreamParser``.
+
+    Текст до начала JSON отдаётся как ``reasoning``, сам JSON — как ``final`` с проверкой на лету;
+    при нарушении схемы ``feed`` бросает ``StructuredOutputError`` и клиент закрывает стрим к бэкенду.
+    """
+
+    def __init__(self, schema: OutputSchema) -> None:
+        self.validator = IncrementalValidator(schema)
+        self.finished: Optional[str] = None
+        self.parsed: Any = None
+        # usage и фазы запроса (``Usage``, ``Timings``): заполняет клиент по окончании стрима
+        self.usage: Any = None
+        self.timings: Any = None
+        self._prefix: List[str] = []
+        self._json: List[str] = []
+        self._in_json = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        if not chunk or self.finished:
+            return []
+        events: List[Tuple[str, str]] = []
+        if not self._in_json:
+            starts = [i for i in (chunk.find(ch) for ch in self.validator.schema.openers) if i >= 0]
+            if not starts:
+                self._prefix.append(chunk)
+                return [("reasoning", chunk)]
+            start = min(starts)
+            if start:
+                self._prefix.append(chunk[:start])
+                events.append(("reasoning", chunk[:start]))
+            chunk = chunk[start:]
+            self._in_json = True
+        # текст после конца JSON-значения отбрасывается, как в нестриминговом ``split_json``
+        chunk = chunk[: self.validator.feed(chunk)]
+        if chunk:
+            self._json.append(chunk)
+            events.append(("final", chunk))
+        if self.validator.complete:
+            self.finished = "json_complete"
+        return events
+
+    def close(self) -> List[Tuple[str, str]]:
+        self.parsed = self.validator.close()
+        return []
+
+    def result(self, strict_json: bool = False) -> Tuple[Optional[str], Optional[str]]:
+        reasoning = "".join(self._prefix).strip() or None
+        return reasoning, "".join(self._json).strip() or None
@@ -0,0 +1,218 @@
+from __future__ import annotations
+import asyncio
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager, suppress
+from typing import AsyncIterator, Iterator, Optional, Set, TypeVar
+
+import httpx
+from pydantic import BaseModel
+
+from .metrics import Counter
+
+
+T = TypeVar("T")
+
+CANCELLED = Counter(
+    "gptoss_cancelled_requests",
+    "Requests aborted before completion: client disconnect, deadline, first-token or inter-token timeout",
+    ("reason",),
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Истёк общий срок запроса (``GenerationParams.timeout``, ``timeout_ms`` в REST); не повторяется."""
+
+
+def _env_timeout(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    # 0 — без ограничения
+    return float(value) or None
+
+
+def _cap(value: Optional[float], limit: Optional[float]) -> Optional[float]:
+    if limit is None:
+        return value
+    return limit if value is None else min(value, limit)
+
+
+class Timeouts(BaseModel):
+    """Таймауты запроса к бэкенду, секунд; ``None`` — без ограничения.
+
+    ``first_token`` — ожидание первого токена стрима (очередь бэкенда, загрузка модели, prefill),
+    у нестримового запроса — ожидание ответа целиком; ``inter_token`` — пауза между токенами стрима.
+    """
+
+    connect: Optional[float] = 10.0
+    first_token: Optional[float] = 90.0
+    inter_token: Optional[float] = 30.0
+
+    @classmethod
+    def from_env(cls) -> "Timeouts":
+        """GPTOSS_CONNECT_TIMEOUT, GPTOSS_FIRST_TOKEN_TIMEOUT, GPTOSS_INTER_TOKEN_TIMEOUT (0 — без ограничения)."""
+        defaults = cls()
+        return cls(
+            connect=_env_timeout("GPTOSS_CONNECT_TIMEOUT", defaults.connect),
+            first_token=_env_timeout("GPTOSS_FIRST_TOKEN_TIMEOUT", defaults.first_token),
+            inter_token=_env_timeout("GPTOSS_INTER_TOKEN_TIMEOUT", defaults.inter_token),
+        )
+
+    def http(self, stream: bool, limit: Optional[float] = None) -> httpx.Timeout:
+        """Таймауты httpx для одного запроса, не больше ``limit`` (остаток общего срока).
+
+        В стриме таймаут чтения из сокета — большее из first_token и inter_token: httpx не различает
+        первый и следующие чанки. Точные значения применяют асинхронный клиент (``anext_within``)
+        и синхронные адаптеры (``watch``).
+        """
+        read = self.first_token
+        if stream and read is not None:
+            read = None if self.inter_token is None else max(read, self.inter_token)
+        connect = _cap(self.connect, limit)
+        return httpx.Timeout(connect=connect, read=_cap(read, limit), write=connect, pool=connect)
+
+    @contextmanager
+    def watch(self, response: httpx.Response, base_url: str) -> Iterator["StreamWatch"]:
+        """Таймауты первого токена и между токенами для синхронного стрима ``response``.
+
+        Истёкший таймаут — ``httpx.ReadTimeout``, как в асинхронном клиенте: пул переключается на другую реплику.
+        """
+        watch = StreamWatch(response, self.first_token, self.inter_token, base_url)
+        _watch_start(watch)
+        try:
+            yield watch
+        except httpx.TransportError:
+            # чтение прервано закрытием сокета по таймауту
+            watch.check()
+            raise
+        finally:
+            _watch_stop(watch)
+        watch.check()
+
+
+class StreamWatch:
+    """Срок очередного чанка синхронного стрима.
+
+    httpx задаёт один таймаут чтения на весь ответ, поэтому сроки проверяет общий фоновый поток: если чанк
+    не пришёл вовремя, он закрывает сокет ответа, и заблокированное чтение возвращается. Пока чанк обрабатывает
+    потребитель стрима (между ``received`` и ``waiting``), время не считается. Для HTTP/2 не включается:
+    закрытие сокета оборвало бы и другие запросы соединения — там действует только таймаут чтения httpx.
+    """
+
+    __slots__ = ("deadline", "expired", "limit", "reason", "inter_token", "base_url", "_sock")
+
+    def __init__(self, response: httpx.Response, first_token: Optional[float], inter_token: Optional[float], base_url: str) -> None:
+        stream = response.extensions.get("network_stream") if response.http_version == "HTTP/1.1" else None
+        self._sock: Optional[socket.socket] = stream.get_extra_info("socket") if stream is not None else None
+        self.inter_token = inter_token
+        self.base_url = base_url
+        self.expired = False
+        self.limit, self.reason = first_token, "first_token_timeout"
+        self.deadline = time.monotonic() + first_token if first_token is not None and self._sock is not None else None
+
+    def received(self) -> None:
+        self.deadline = None
+
+    def waiting(self) -> None:
+        self.limit, self.reason = self.inter_token, "inter_token_timeout"
+        if self.inter_token is not None and self._sock is not None:
+            self.deadline = time.monotonic() + self.inter_token
+
+    def expire(self) -> None:
+        self.expired = True
+        self.deadline = None
+        if self._sock is not None:
+            with suppress(OSError):
+                self._sock.shutdown(socket.SHUT_RDWR)
+
+    def check(self) -> None:
+        if self.expired:
+            CANCELLED.labels(self.reason).inc()
+            raise httpx.ReadTimeout(f"{self.reason.replace('_', ' ')} after {self.limit} s: {self.base_url}")
+
+
+_watches: Set[StreamWatch] = set()
+_watch_lock = threading.Lock()
+_watch_thread: Optional[threading.Thread] = None
+# точность срабатывания таймаутов синхронного стрима
+_WATCH_INTERVAL = 0.05
+
+
+def _watch_start(watch: StreamWatch) -> None:
+    global _watch_thread
+    if watch._sock is None or (watch.limit is None and watch.inter_token is None):
+        return
+    with _watch_lock:
+        _watches.add(watch)
+        if _watch_thread is None:
+            _watch_thread = threading.Thread(target=_watch_loop, name="gptoss-stream-watch", daemon=True)
+            _watch_thread.start()
+
+
+def _watch_stop(watch: StreamWatch) -> None:
+    with _watch_lock:
+        _watches.discard(watch)
+
+
+def _watch_loop() -> None:
+    global _watch_thread
+    while True:
+        time.sleep(_WATCH_INTERVAL)
+        now = time.monotonic()
+        with _watch_lock:
+            if not _watches:
+                # поток живёт, пока есть стримы: без них не просыпается
+                _watch_thread = None
+                return
+            expired = [w for w in _watches if w.deadline is not None and w.deadline <= now]
+        for watch in expired:
+            watch.expire()
+
+
+def deadline_after(timeout: Optional[float]) -> Optional[float]:
+    return time.monotonic() + timeout if timeout is not None else None
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Остаток срока в секундах; ``DeadlineExceeded``, если срок уже истёк."""
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        CANCELLED.labels("deadline").inc()
+        raise DeadlineExceeded("request deadline exceeded")
+    return left
+
+
+async def anext_within(iterator: AsyncIterator[T], timeout: Optional[float]) -> T:
+    """``await iterator.__anext__()`` не дольше ``timeout`` секунд, иначе ``asyncio.TimeoutError``.
+
+    В отличие от ``asyncio.wait_for`` не создаёт задачу на каждый чанк: по таймеру отменяется текущая
+    задача, и отмена превращается в таймаут. Генератор, прерванный таймаутом, закрывается (вместе с запросом).
+    """
+    if timeout is None:
+        return await iterator.__anext__()
+    task = asyncio.current_task()
+    assert task is not None
+    fired = False
+
+    def expire() -> None:
+        nonlocal fired
+        fired = True
+        task.cancel()
+
+    handle = asyncio.get_running_loop().call_later(max(timeout, 0.0), expire)
+    try:
+        return await iterator.__anext__()
+    except asyncio.CancelledError:
+        if not fired:
+            raise
+        uncancel = getattr(task, "uncancel", None)  # Python 3.11+: снять отметку об отмене с задачи
+        if uncancel is not None:
+            uncancel()
+        raise asyncio.TimeoutError() from None
+    finally:
+        handle.cancel()
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .schema import Timings, Usage
+
+
+# Фазы, которые httpcore сообщает через расширение запроса ``trace``
+_CONNECT_EVENTS = frozenset({"connection.connect_tcp.complete", "connection.start_tls.complete"})
+_HEADERS_EVENTS = frozenset({"http11.receive_response_headers.complete", "http2.receive_response_headers.complete"})
+
+
+class ClientHook:
+    """Хук клиента: переопределяются нужные методы, остальные ничего не делают.
+
+    Вызывается синхронно в потоке запроса; ``at`` — секунд от начала вызова. События: ``build``, ``attempt``,
+    ``connect``, ``first_byte``, ``first_token``, ``first_reasoning_token``, ``first_final_token``, ``fallback``,
+    ``last_token``, ``parse``, ``cache_hit``. Исключение хука прерывает запрос.
+    """
+
+    def on_start(self, trace: "RequestTrace") -> None:
+        pass
+
+    def on_event(self, trace: "RequestTrace", name: str, at: float, attrs: Dict[str, Any]) -> None:
+        pass
+
+    def on_end(self, trace: "RequestTrace", error: Optional[BaseException]) -> None:
+        pass
+
+
+class RequestTrace:
+    """Ход одного вызова ``chat``/``stream_chat``: фазы, usage и события для хуков.
+
+    Без хуков стоит несколько ``perf_counter`` на запрос: фазы копятся в словаре, ``Timings`` строится в конце.
+    """
+
+    def __init__(self, kind: str, provider: str, base_url: str, model: str, hooks: Sequence[ClientHook] = ()) -> None:
+        self.kind = kind
+        self.provider = provider
+        self.base_url = base_url
+        self.model = model
+        self.hooks = hooks
+        self.usage: Optional[Usage] = None
+        # (provider, base_url, model) бэкенда последней попытки — с пулом это реплика, а не адрес клиента
+        self.backend: Optional[Tuple[str, str, str]] = None
+        self.error: Optional[BaseException] = None
+        # состояние хуков (например, span OpenTelemetry)
+        self.data: Dict[str, Any] = {}
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        self._marks: Dict[str, Any] = {}
+        self._timings: Optional[Timings] = None
+        # ждём первого токена рассуждения и финального ответа
+        self.watching = True
+        self.http_extensions = {"trace": self._on_http}
+        self.async_http_extensions = {"trace": self._aon_http}
+        for hook in hooks:
+            hook.on_start(self)
+
+    def _notify(self, name: str, at: float, attrs: Dict[str, Any]) -> None:
+        for hook in self.hooks:
+            hook.on_event(self, name, at, attrs)
+
+    def mark(self, phase: str, now: Optional[float] = None, **attrs: Any) -> None:
+        """Фаза наступила; в ``timings`` попадает первое наступление."""
+        at = (time.perf_counter() if now is None else now) - self.started
+        self._marks.setdefault(phase, at)
+        if self.hooks:
+            self._notify(phase, at, attrs)
+
+    def count(self, name: str, **attrs: Any) -> None:
+        """Событие-счётчик: ``attempt`` (запрос к бэкенду), ``fallback`` (повтор без response_format)."""
+        key = name + "s"
+        self._marks[key] = self._marks.get(key, 0) + 1
+        if self.hooks:
+            self._notify(name, time.perf_counter() - self.started, attrs)
+
+    def cache_hit(self) -> None:
+        self._marks["cached"] = True
+        if self.hooks:
+            self._notify("cache_hit", time.perf_counter() - self.started, {})
+
+    def parsed(self, seconds: float) -> None:
+        self._marks["parse"] = self._marks.get("parse", 0.0) + seconds
+        if self.hooks:
+            self._notify("parse", time.perf_counter() - self.started, {"duration": seconds})
+
+    def channels(self, events: List[Tuple[str, str]]) -> None:
+        for channel, _ in events:
+            if channel == "final":
+                self.mark("first_final_token")
+                # рассуждения после начала финального ответа уже не ждём
+                self.watching = False
+                return
+            if channel == "reasoning" and "first_reasoning_token" not in self._marks:
+                self.mark("first_reasoning_token")
+
+    def set_usage(self, response_json: Any) -> None:
+        usage = Usage.from_response(response_json)
+        if usage is not None:
+            self.usage = usage
+
+    def _on_http(self, name: str, info: Dict[str, Any]) -> None:
+        if name in _CONNECT_EVENTS:
+            # TCP, затем TLS: фаза заканчивается последним из них
+            at = time.perf_counter() - self.started
+            self._marks["connect"] = at
+            if self.hooks:
+                self._notify("connect", at, {"step": name})
+        elif name in _HEADERS_EVENTS:
+            self.mark("first_byte")
+
+    async def _aon_http(self, name: str, info: Dict[str, Any]) -> None:
+        self._on_http(name, info)
+
+    @property
+    def timings(self) -> Timings:
+        if self._timings is None:
+            return Timings(**self._marks)
+        return self._timings
+
+    def end(self, error: Optional[BaseException] = None) -> Timings:
+        """Конец вызова: ``total`` и ``on_end`` хуков; повторный вызов ничего не делает."""
+        if self._timings is None:
+            self._marks["total"] = time.perf_counter() - self.started
+            self.error = error
+            self._timings = Timings(**self._marks)
+            for hook in self.hooks:
+                hook.on_end(self, error)
+        return self._timings
+
+
+def http_extensions(trace: Optional[RequestTrace]) -> Optional[Dict[str, Any]]:
+    return trace.http_extensions if trace is not None else None
+
+
+def async_http_extensions(trace: Optional[RequestTrace]) -> Optional[Dict[str, Any]]:
+    return trace.async_http_extensions if trace is not None else None
+
+
+class OpenTelemetryHook(ClientHook):
+    """Span OpenTelemetry на каждый вызов клиента: фазы — события span, usage и timings — атрибуты.
+
+    Нужен ``opentelemetry-api`` (``pip install gpt-oss-client[otel]``); span становится дочерним к текущему.
+    """
+
+    def __init__(self, tracer: Any = None) -> None:
+        try:
+            from opentelemetry import trace as otel_trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetryHook requires opentelemetry-api: pip install gpt-oss-client[otel]") from e
+        self._otel = otel_trace
+        self.tracer = tracer or otel_trace.get_tracer("gpt_oss_client")
+
+    @staticmethod
+    def _ns(trace: RequestTrace, at: float) -> int:
+        return int((trace.start_time + at) * 1e9)
+
+    def on_start(self, trace: RequestTrace) -> None:
+        trace.data["otel_span"] = self.tracer.start_span(
+            f"gptoss.{trace.kind}",
+            kind=self._otel.SpanKind.CLIENT,
+            start_time=self._ns(trace, 0.0),
+            attributes={"gen_ai.system": trace.provider, "gen_ai.request.model": trace.model, "server.address": trace.base_url},
+        )
+
+    def on_event(self, trace: RequestTrace, name: str, at: float, attrs: Dict[str, Any]) -> None:
+        span = trace.data.get("otel_span")
+        if span is not None:
+            attributes = {k: v for k, v in attrs.items() if isinstance(v, (str, bool, int, float))}
+            span.add_event(name, attributes=attributes, timestamp=self._ns(trace, at))
+
+    def on_end(self, trace: RequestTrace, error: Optional[BaseException]) -> None:
+        span = trace.data.pop("otel_span", None)
+        if span is None:
+            return
+        timings = trace.timings
+        for field, value in timings.model_dump(exclude_none=True).items():
+            span.set_attribute(f"gptoss.timings.{field}", value)
+        if trace.usage is not None:
+            if trace.usage.prompt_tokens is not None:
+                span.set_attribute("gen_ai.usage.input_tokens", trace.usage.prompt_tokens)
+            if trace.usage.completion_tokens is not None:
+                span.set_attribute("gen_ai.usage.output_tokens", trace.usage.completion_tokens)
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(self._otel.Status(self._otel.StatusCode.ERROR, str(error)))
+        span.end(end_time=self._ns(trace, timings.total or 0.0))
@@ -0,0 +1,137 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from .metrics import WARMUP_ERRORS, WARMUP_LATENCY, last_request, note_warmup
+
+if TYPE_CHECKING:
+    from .balancer import BackendPool
+    from .client import LLMClient
+
+
+# Прогрев: Ollama выгружает модель после keep_alive (по умолчанию 5 минут), LM Studio — по TTL JIT-загрузки,
+# и первый запрос после простоя ждёт загрузки весов. Прогрев при старте и периодические пинги это убирают.
+
+
+def warmup_target(adapter: Any, model: str, keep_alive: Optional[str], kind: str = "startup", timeout: Optional[float] = None) -> Optional[float]:
+    """Прогревает модель на бэкенде адаптера; возвращает время в секундах или None при ошибке."""
+    labels = (adapter.provider.value, adapter.base_url, model)
+    started = time.perf_counter()
+    try:
+        adapter.warmup(model, keep_alive=keep_alive, timeout=timeout)
+    except Exception:
+        WARMUP_ERRORS.labels(*labels).inc()
+        return None
+    elapsed = time.perf_counter() - started
+    WARMUP_LATENCY.labels(*labels, kind).observe(elapsed)
+    note_warmup(*labels)
+    return elapsed
+
+
+async def awarmup_target(adapter: Any, model: str, keep_alive: Optional[str], kind: str = "startup", timeout: Optional[float] = None) -> Optional[float]:
+    labels = (adapter.provider.value, adapter.base_url, model)
+    started = time.perf_counter()
+    try:
+        await adapter.warmup(model, keep_alive=keep_alive, timeout=timeout)
+    except Exception:
+        WARMUP_ERRORS.labels(*labels).inc()
+        return None
+    elapsed = time.perf_counter() - started
+    WARMUP_LATENCY.labels(*labels, kind).observe(elapsed)
+    note_warmup(*labels)
+    return elapsed
+
+
+class KeepAliveScheduler:
+    """Фоновый поток, который прогревает модели клиента при старте и пингует их каждые ``interval`` секунд.
+
+    Пинги идут, только пока ожидается трафик: с момента старта или последнего запроса к модели прошло
+    не больше ``active_window`` секунд (``None`` — всегда). Так простаивающий сервис не держит GPU занятым.
+    """
+
+    def __init__(
+        self,
+        client: "LLMClient",
+        interval: float = 240.0,
+        keep_alive: Optional[str] = "30m",
+        active_window: Optional[float] = 3600.0,
+        timeout: float = 300.0,
+    ) -> None:
+        self.client = client
+        self.interval = interval
+        self.keep_alive = keep_alive
+        self.active_window = active_window
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.pings = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, pool: Optional["BackendPool"] = None) -> Optional["KeepAliveScheduler"]:
+        """GPTOSS_WARMUP — реплики ``[provider=]url[#model]`` через запятую или ``pool`` (реплики GPTOSS_BACKENDS);
+        GPTOSS_WARMUP_MODEL (для реплик без модели), GPTOSS_KEEP_ALIVE, GPTOSS_KEEPALIVE_INTERVAL (0 — только прогрев
+        при старте), GPTOSS_KEEPALIVE_WINDOW (секунд ожидания трафика после последнего запроса, 0 — всегда)."""
+        from .balancer import BackendPool
+        from .client import LLMClient
+
+        value = os.getenv("GPTOSS_WARMUP", "").strip()
+        if not value:
+            return None
+        model = os.getenv("GPTOSS_WARMUP_MODEL", "gpt-oss-20b")
+        if value.lower() == "pool":
+            if pool is None:
+                return None
+            target_pool = pool
+        else:
+            specs = [s.strip() for s in value.split(",") if s.strip()]
+            target_pool = BackendPool(specs, health_check_interval=None)
+        window = float(os.getenv("GPTOSS_KEEPALIVE_WINDOW", "3600"))
+        return cls(
+            LLMClient.from_pool(target_pool, model=model),
+            interval=float(os.getenv("GPTOSS_KEEPALIVE_INTERVAL", "240")),
+            keep_alive=os.getenv("GPTOSS_KEEP_ALIVE", "30m") or None,
+            active_window=window or None,
+        )
+
+    def _expected(self, provider: str, base_url: str, model: str) -> bool:
+        if self.active_window is None:
+            return True
+        seen = last_request(provider, base_url, model)
+        return time.monotonic() - max(seen or 0.0, self.started) <= self.active_window
+
+    def warm_all(self, kind: str = "startup") -> Dict[str, Optional[float]]:
+        """Прогрев (или пинг) всех моделей клиента; пинги — только моделей, к которым ожидается трафик."""
+        results: Dict[str, Optional[float]] = {}
+        for adapter, model in self.client._warmup_targets():
+            if kind == "keepalive" and not self._expected(adapter.provider.value, adapter.base_url, model):
+                continue
+            results[f"{adapter.provider.value}|{adapter.base_url}#{model}"] = warmup_target(
+                adapter, model, self.keep_alive, kind=kind, timeout=self.timeout
+            )
+        return results
+
+    def start(self, warm: bool = False) -> None:
+        """Запускает пинги; ``warm=True`` — сначала прогрев в том же потоке (старт не блокируется)."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop() -> None:
+            if warm:
+                self.warm_all()
+            if self.interval <= 0:
+                return
+            while not self._stop.wait(self.interval):
+                self.pings += len(self.warm_all(kind="keepalive"))
+
+        self._thread = threading.Thread(target=loop, name="gptoss-keepalive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
@@ -0,0 +1,52 @@
+from __future__ import annotations
+import asyncio
+from typing import List
+
+import pytest
+
+from gpt_oss_client import admission
+from gpt_oss_client.admission import AdmissionController, AdmissionRejected
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> List[float]:
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_rotating_keys_do_not_grow_quotas(clock: List[float]) -> None:
+    controller = AdmissionController(key_rate_per_minute=60)
+    for i in range(1000):
+        controller._check_key(f"key-{i}")
+        # ведро пополняется на токен в секунду: прошлые ключи снова полные
+        clock[0] += 1.0
+    assert len(controller._keys) <= 2
+
+
+def test_exhausted_key_is_not_forgotten(clock: List[float]) -> None:
+    controller = AdmissionController(key_rate_per_minute=2)
+    controller._check_key("a")
+    controller._check_key("a")
+    with pytest.raises(AdmissionRejected):
+        controller._check_key("a")
+    for i in range(10):
+        controller._check_key(f"other-{i}")
+    with pytest.raises(AdmissionRejected):
+        controller._check_key("a")
+
+
+def test_busy_key_is_not_forgotten() -> None:
+    controller = AdmissionController(key_max_concurrent=1)
+
+    async def main() -> None:
+        async with controller.slot("backend", api_key="a"):
+            for i in range(10):
+                controller._check_key(f"other-{i}")
+            with pytest.raises(AdmissionRejected):
+                controller._check_key("a")
+        for i in range(10):
+            controller._check_key(f"again-{i}")
+
+    asyncio.run(main())
+    assert len(controller._keys) <= 2
@@ -0,0 +1,33 @@
+from __future__ import annotations
+import time
+from pathlib import Path
+
+from gpt_oss_client.cache import ResponseCache
+from gpt_oss_client.schema import ChatResult
+
+
+def test_zero_ttl_is_not_stored(tmp_path: Path) -> None:
+    cache = ResponseCache(path=str(tmp_path / "cache.sqlite"))
+    cache.set("k", ChatResult(final_answer="42"), ttl=0)
+    assert cache.get("k") is None
+    assert cache.stats().stores == 0
+    cache.close()
+
+    memory_only = ResponseCache(ttl=0)
+    memory_only.set("k", ChatResult(final_answer="42"))
+    assert memory_only.get("k") is None
+
+
+def test_disk_hit_keeps_remaining_ttl(tmp_path: Path) -> None:
+    path = str(tmp_path / "cache.sqlite")
+    writer = ResponseCache(path=path, ttl=3600.0)
+    writer.set("k", ChatResult(final_answer="42"), ttl=0.3)
+    writer.close()
+
+    reader = ResponseCache(path=path, ttl=3600.0)
+    assert reader.get("k") is not None
+    assert reader.stats().disk_hits == 1
+    time.sleep(0.4)
+    # запись в памяти истекает вместе с дисковой, а не живёт ещё час
+    assert reader.get("k") is None
+    reader.close()
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import random
+from typing import Optional, Tuple
+
+import _baseline_parser as baseline
+from gpt_oss_client.harmony.parser import parse_json_strict, parse_structured_output
+
+_ATOMS = [
+    "<thinking>", "</thinking>", "<final>", "</final>", "<THINKING>", "</Final>",
+    "<|channel|>", "<|message|>", "<|CHANNEL|>",
+    '{"reasoning": "r", "final": "f"}', '{"final": 0, "answer": 3}', '{"reasoning":"x"}',
+    '{"final":"q"', "[1,2]", '"str"', "<x>", "<", ">", "{", "}",
+    " ", "  ", "\n", "\t", "abc", "final", "42",
+]
+
+
+def _baseline_structured(text: str) -> Tuple[Optional[str], Optional[str]]:
+    reasoning, final = baseline.parse_structured_output(text)
+    # единственное намеренное отличие: незакрытый <final> после пустого <thinking>
+    # больше не теряет ответ (остановка на стоп-последовательности </final>)
+    if (
+        final is None
+        and baseline._FINAL_OPEN_RE.search(text)
+        and not baseline._FINAL_TAG_RE.search(text)
+    ):
+        final = baseline._extract_unclosed_final(text)[1]
+    return reasoning, final
+
+
+def test_unclosed_final_keeps_text_before_it_as_reasoning() -> None:
+    # без <thinking> рассуждение — всё до <final>, и при остановке на </final> тоже
+    assert parse_structured_output("Let me think.\n<final>4") == ("Let me think.", "4")
+    assert parse_structured_output("<final>4") == (None, "4")
+
+
+def test_stop_on_final_keeps_answer_after_thinking() -> None:
+    # стоп-последовательность </final> срезала закрывающий тег
+    assert parse_structured_output("<thinking>2+2</thinking><final>4") == ("2+2", "4")
+
+
+def test_matches_regex_parser_on_random_markup() -> None:
+    rnd = random.Random(1)
+    for _ in range(20000):
+        text = "".join(rnd.choice(_ATOMS) for _ in range(rnd.randint(0, 7)))
+        assert parse_structured_output(text) == _baseline_structured(text), text
+        assert parse_json_strict(text) == baseline.parse_json_strict(text), text
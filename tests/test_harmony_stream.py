@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import random
+from typing import Dict, Iterator, List
+
+import pytest
+
+from gpt_oss_client.harmony.parser import parse_structured_output
+from gpt_oss_client.harmony.stream import HarmonyStreamParser
+
+# теги и JSON: события потока должны совпадать с parse_structured_output
+TAGGED = [
+    "<thinking>I think 2+2</thinking><final>4</final> trailing chatter",
+    "<THINKING>a<b</THINKING>\n<Final>x < y and z</FINAL>",
+    "reasoning first <final>unclosed answer",
+    '{"reasoning": "r \\"q\\" \\\\ \\u00e9 \\ud83d\\ude00 line\\nnext", "final": "ok \\u00e9"}',
+    '{"reasoning":"r","final":42}',
+]
+# форматы, которые разбирает только стриминговый парсер: события сверяются между чанкованиями
+OTHER = [
+    "<|channel|>analysis<|message|>Need to think.<|end|><|start|>assistant"
+    "<|channel|>final<|message|>The answer<|return|>",
+    'pre text<|channel|>final <|constrain|>json<|message|>{"reasoning":"rr","final":"ff"}',
+    "plain text no tags",
+]
+
+
+def _chunkings(text: str) -> Iterator[List[str]]:
+    yield [text]
+    yield list(text)
+    for i in range(1, len(text)):
+        yield [text[:i], text[i:]]
+    rnd = random.Random(len(text))
+    for _ in range(20):
+        chunks, i = [], 0
+        while i < len(text):
+            k = rnd.randint(1, 6)
+            chunks.append(text[i:i + k])
+            i += k
+        yield chunks
+
+
+def _run(chunks: List[str]) -> tuple:
+    parser = HarmonyStreamParser()
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    events += parser.close()
+    joined: Dict[str, str] = {}
+    for channel, text in events:
+        joined[channel] = joined.get(channel, "") + text
+    return joined, parser.result()
+
+
+@pytest.mark.parametrize("text", TAGGED + OTHER)
+def test_events_do_not_depend_on_chunking(text: str) -> None:
+    expected = _run([text])
+    for chunks in _chunkings(text):
+        assert _run(chunks) == expected, chunks
+
+
+@pytest.mark.parametrize("text", TAGGED + OTHER)
+def test_result_matches_non_streaming_parser(text: str) -> None:
+    for chunks in _chunkings(text):
+        assert _run(chunks)[1] == parse_structured_output(text), chunks
+
+
+@pytest.mark.parametrize("text", TAGGED)
+def test_final_events_match_non_streaming_parser(text: str) -> None:
+    reasoning, final = parse_structured_output(text)
+    joined, _ = _run([text])
+    assert joined.get("final", "").strip() == final
+    assert (joined.get("reasoning", "").strip() or None) == reasoning
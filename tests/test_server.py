@@ -0,0 +1,46 @@
+from __future__ import annotations
+from pathlib import Path
+
+import httpx
+
+from gpt_oss_client.server import ServerSession, SessionIn, _http_error, _pooled
+from gpt_oss_client.sessions import SharedSessionStore
+from gpt_oss_client.shared import SharedState
+
+
+def _status_error(response: httpx.Response) -> httpx.HTTPStatusError:
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        return e
+    raise AssertionError("expected an error status")
+
+
+def test_http_error_reports_upstream_body() -> None:
+    request = httpx.Request("POST", "http://backend/v1/chat/completions")
+    error = _http_error(_status_error(httpx.Response(503, request=request, text="model is loading")))
+    assert error.status_code == 502
+    assert error.detail == "Upstream returned 503: model is loading"
+
+
+def test_http_error_on_unread_stream_response() -> None:
+    # /chat/stream: raise_for_status до чтения тела
+    request = httpx.Request("POST", "http://backend/v1/chat/completions")
+    response = httpx.Response(503, request=request, stream=httpx.ByteStream(b"model is loading"))
+    error = _http_error(_status_error(response))
+    assert error.status_code == 502
+    assert error.detail == "Upstream returned 503: Service Unavailable"
+
+
+def test_shared_session_keeps_pool_routing(tmp_path: Path) -> None:
+    shared = SharedState(str(tmp_path / "state.sqlite"))
+    store = SharedSessionStore(shared, ServerSession)
+    backend = SessionIn(model="gpt-oss-20b")
+    session = ServerSession(backend=backend, pooled=_pooled(backend))
+    store.add(session)
+    restored = store.get(session.id)
+    shared.close()
+    assert restored is not None
+    # после JSON все поля считаются заданными — маршрут берётся из сохранённого флага
+    assert "base_url" in restored.backend.model_fields_set
+    assert restored.pooled
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import asyncio
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from gpt_oss_client.client import LLMClient
+from gpt_oss_client.harmony.parser import build_system_instruction
+from gpt_oss_client.providers import Provider
+from gpt_oss_client.schema import GenerationParams
+from gpt_oss_client.sessions import Session, SessionBusy, SharedSessionStore
+from gpt_oss_client.shared import SharedState
+
+
+def _client(sent: List[Dict[str, Any]]) -> LLMClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json={"choices": [{"message": {"content": '{"ok": true}'}}]})
+
+    http = httpx.Client(transport=httpx.MockTransport(handler))
+    return LLMClient(Provider.OPENAI_COMPAT, "http://backend/v1", "gpt-oss-20b", http_client=http)
+
+
+def test_session_turn_does_not_change_client_defaults() -> None:
+    sent: List[Dict[str, Any]] = []
+    client = _client(sent)
+    client.chat_session(Session(json_output=True, keep_alive="30m"), "turn")
+    assert client.default_gen == GenerationParams()
+
+    client.chat("plain")
+    assert sent[-1]["messages"][0] == {"role": "system", "content": build_system_instruction()}
+    assert "response_format" not in sent[-1]
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_shared_turn_times_out_while_held(tmp_path: Path) -> None:
+    shared = SharedState(str(tmp_path / "state.sqlite"))
+    store = SharedSessionStore(shared, turn_timeout=0.2)
+    holder = shared.try_lease("session:s1", 1)
+    assert holder is not None
+
+    async def turn() -> None:
+        async with store.turn("s1"):
+            pass
+
+    with pytest.raises(SessionBusy):
+        asyncio.run(turn())
+    shared.release_lease(holder)
+    asyncio.run(turn())
+    assert shared.leases() == {}
+    shared.close()
+
+
+def test_shared_turn_reaps_holder_that_dies_while_waiting(tmp_path: Path) -> None:
+    shared = SharedState(str(tmp_path / "state.sqlite"))
+    store = SharedSessionStore(shared, turn_timeout=5.0)
+    holder = shared.try_lease("session:s1", 1)
+    assert holder is not None
+
+    async def main() -> None:
+        async def die() -> None:
+            # владелец «падает» после того, как ожидание уже началось
+            await asyncio.sleep(0.2)
+            with shared._transaction() as conn:
+                conn.execute("UPDATE leases SET pid = ? WHERE id = ?", (_dead_pid(), holder))
+
+        dying = asyncio.create_task(die())
+        async with store.turn("s1"):
+            assert shared.leases() == {"session:s1": 1}
+        await dying
+
+    asyncio.run(main())
+    shared.close()
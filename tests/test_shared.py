@@ -0,0 +1,93 @@
+from __future__ import annotations
+import asyncio
+import sqlite3
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
+
+from gpt_oss_client.cache import ResponseCache
+from gpt_oss_client.capabilities import CapabilityRegistry
+from gpt_oss_client.providers import Provider
+from gpt_oss_client.schema import ChatResult
+from gpt_oss_client.sessions import Session, SharedSessionStore
+from gpt_oss_client.shared import SharedState
+
+T = TypeVar("T")
+HOLD = 0.5
+
+
+async def _while_locked(path: Path, action: Callable[[], Awaitable[T]]) -> T:
+    """Выполняет ``action``, пока другой «воркер» держит блокировку записи; event loop должен работать."""
+    blocker = sqlite3.connect(str(path), isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    loop = asyncio.get_running_loop()
+    loop.call_later(HOLD, blocker.execute, "COMMIT")
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        result = await action()
+        # дождаться снятия блокировки, не останавливая loop
+        await asyncio.sleep(HOLD)
+    finally:
+        task.cancel()
+        blocker.close()
+    assert ticks > HOLD / 0.01 / 2
+    return result
+
+
+def test_capability_update_does_not_wait_for_the_file(tmp_path: Path) -> None:
+    path = tmp_path / "state.sqlite"
+    shared = SharedState(str(path))
+    registry = CapabilityRegistry(shared=shared)
+
+    async def update() -> float:
+        started = time.monotonic()
+        registry.update(Provider.OPENAI_COMPAT, "http://backend/v1", json_schema=False)
+        assert registry.get(Provider.OPENAI_COMPAT, "http://backend/v1").json_schema is False
+        return time.monotonic() - started
+
+    assert asyncio.run(_while_locked(path, update)) < HOLD / 2
+    # запись в общий файл дошла после снятия блокировки
+    assert list(shared.capabilities().values()) == [{"json_schema": False}]
+    shared.close()
+
+
+def test_shared_sessions_from_event_loop(tmp_path: Path) -> None:
+    path = tmp_path / "state.sqlite"
+    shared = SharedState(str(path))
+    store = SharedSessionStore(shared)
+    session = Session(system_prompt="be brief")
+
+    async def roundtrip() -> Session:
+        await store.aadd(session)
+        restored = await store.aget(session.id)
+        assert restored is not None
+        return restored
+
+    assert asyncio.run(_while_locked(path, roundtrip)).system_prompt == "be brief"
+    assert asyncio.run(store.adelete(session.id))
+    shared.close()
+
+
+def test_cache_disk_tier_from_event_loop(tmp_path: Path) -> None:
+    path = tmp_path / "cache.sqlite"
+    cache = ResponseCache(path=str(path))
+    cache.disk.set("warm", ChatResult(final_answer="hello"))  # type: ignore[union-attr]
+
+    async def roundtrip() -> ChatResult:
+        await cache.aset("k", ChatResult(final_answer="42"))
+        cached = await cache.aget("warm")
+        assert cached is not None
+        return cached
+
+    assert asyncio.run(_while_locked(path, roundtrip)).final_answer == "hello"
+    assert cache.stats().disk_hits == 1
+    assert ResponseCache(path=str(path)).get("k").final_answer == "42"  # type: ignore[union-attr]
+    cache.close()
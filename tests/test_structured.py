@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import random
+from typing import Any, Iterator, List, Optional, Tuple
+
+import pytest
+
+from gpt_oss_client.structured import (
+    IncrementalValidator,
+    OutputSchema,
+    SchemaStreamParser,
+    StructuredOutputError,
+    split_json,
+)
+
+OBJECT = OutputSchema({"type": "object", "properties": {"a": {"type": "integer"}}, "required": ["a"]})
+
+
+def test_split_json_skips_brackets_in_reasoning() -> None:
+    assert split_json('see [ref] first, then {"a": 1} </final>') == ("see [ref] first, then", '{"a": 1}')
+    assert split_json("{x} is a set; answer: [1, 2]") == ("{x} is a set; answer:", "[1, 2]")
+
+
+def test_split_json_uses_schema_openers() -> None:
+    # [1] — корректный JSON, но схема ждёт объект
+    assert split_json('as in [1], {"a": 2}', OBJECT.openers) == ("as in [1],", '{"a": 2}')
+
+
+def test_split_json_does_not_pick_a_value_nested_in_truncated_output() -> None:
+    assert split_json('{"a": {"b": 1}, "c": ') == (None, '{"a": {"b": 1}, "c":')
+    assert split_json('{"a": "cut {"b": 1}') == (None, '{"a": "cut {"b": 1}')
+    assert split_json("no json here") == (None, "no json here")
+
+
+def test_stream_parser_starts_at_schema_opener() -> None:
+    parser = SchemaStreamParser(OBJECT)
+    events = parser.feed('as in [1], {"a": 2} tail')
+    parser.close()
+    assert events == [("reasoning", "as in [1], "), ("final", '{"a": 2}')]
+    assert parser.parsed == {"a": 2}
+
+
+TEXT = OutputSchema({
+    "type": "object",
+    "properties": {
+        "s": {"type": "string", "maxLength": 8},
+        "e": {"enum": ["é", "a\"b", "x\\y"]},
+        "n": {"type": "array", "items": {"type": "number", "minimum": 0}, "maxItems": 3},
+        "b": {"type": ["boolean", "null"]},
+    },
+    "required": ["s"],
+    "additionalProperties": False,
+})
+
+DOCUMENTS = [
+    # корректные: экранирование, \u и суррогатная пара (один символ для maxLength)
+    '{"s": "a\\"b\\\\c\\nd"}',
+    '{"s": "\\ud83d\\ude00", "e": "\\u00e9"}',
+    '{"s": "", "e": "a\\"b", "n": [0, 1.5, 2e3], "b": null}',
+    '{"s": "\\u0041", "e": "x\\\\y", "b": true} trailing text',
+    # нарушения схемы
+    '{"e": "é"}',
+    '{"s": "\\ud83d\\ude00\\ud83d\\ude00\\ud83d\\ude00\\u00e9\\u00e9\\u00e9\\u00e9\\u00e9\\u00e9"}',
+    '{"s": "x", "e": "\\u00e8"}',
+    '{"s": "x", "n": [1, -1]}',
+    '{"s": "x", "n": [1, 2, 3, 4]}',
+    '{"s": "x", "b": "true"}',
+    '{"s": "x", "extra": 1}',
+    '{"s": 1}',
+    # ошибки JSON
+    '{"s": "bad \\x escape"}',
+    '{"s": "x",}',
+    '{"s": "x"',
+    '{"s": "x" "b": true}',
+]
+
+
+def _chunkings(text: str) -> Iterator[List[str]]:
+    yield [text]
+    yield list(text)
+    for i in range(1, len(text)):
+        yield [text[:i], text[i:]]
+    rnd = random.Random(len(text))
+    for _ in range(20):
+        chunks, i = [], 0
+        while i < len(text):
+            k = rnd.randint(1, 5)
+            chunks.append(text[i:i + k])
+            i += k
+        yield chunks
+
+
+def _full(schema: OutputSchema, text: str) -> Tuple[Any, bool]:
+    try:
+        return schema.parse(split_json(text)[1]), True
+    except StructuredOutputError:
+        return None, False
+
+
+def _incremental(schema: OutputSchema, chunks: List[str]) -> Tuple[Any, Optional[List[str]]]:
+    validator = IncrementalValidator(schema)
+    try:
+        for chunk in chunks:
+            validator.feed(chunk)
+        return validator.close(), None
+    except StructuredOutputError as e:
+        return None, e.errors
+
+
+@pytest.mark.parametrize("text", DOCUMENTS)
+def test_incremental_validation_matches_full_validation(text: str) -> None:
+    value, ok = _full(TEXT, text)
+    expected = _incremental(TEXT, [text])
+    assert (expected[1] is None) == ok
+    assert expected[0] == value
+    # ошибка (и позиция в ней) не зависит от того, где поток разрезан
+    for chunks in _chunkings(text):
+        assert _incremental(TEXT, chunks) == expected, chunks
+
+
+@pytest.mark.parametrize("text", DOCUMENTS[:4])
+def test_stream_parser_final_matches_split_json(text: str) -> None:
+    reasoning, final = split_json("thinking... " + text)
+    for chunks in _chunkings("thinking... " + text):
+        parser = SchemaStreamParser(TEXT)
+        events = []
+        for chunk in chunks:
+            events += parser.feed(chunk)
+        parser.close()
+        assert parser.result() == (reasoning, final), chunks
+        assert "".join(t for ch, t in events if ch == "final") == final
+        assert parser.parsed == TEXT.parse(final)